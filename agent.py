@@ -1,33 +1,46 @@
 import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
 from datetime import datetime
-from google import genai
 
-# ---------- CONFIG ----------
-API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not API_KEY:
-    raise RuntimeError("GEMINI_API_KEY not set. Set it and re-run.")
-
-client = genai.Client(api_key=API_KEY)
+from core.gemini_client import get_client_holder, get_gemini_client
+from core.llm_backends import GeminiBackend
+from core.playbook_engine import UPSTREAM_BREAKER
+from core.playbook_store import get_playbook_store, parse_legacy_text
+from core.resilience import (
+    Deadline,
+    MalformedResponseError,
+    call_with_retries_async,
+    default_deadline_seconds,
+    default_retry_policy,
+)
+from core.retrieval import reference_context
+from core.token_budget import budget_prompt
 
-# ---------- INTERACTIVE INPUT ----------
-print("\nEnter SOAR use case details.")
-print("Press Enter on an empty line to submit.\n")
+# ---------- CONFIG ----------
+MODEL_NAME = "models/gemini-2.5-flash"
+DEFAULT_BATCH_DIR = os.path.join("playbooks", "batch")
 
-lines = []
-while True:
-    line = input("> ")
-    if line.strip() == "":
-        break
-    lines.append(line)
 
-USE_CASE = "\n".join(lines)
+# ---------- PROMPT ----------
+def build_prompt(use_case: str) -> str:
+    # Compacts the use case and fits it (and the retrieved context) to the agent budget
+    prompt, _ = budget_prompt(
+        use_case,
+        "agent",
+        render=render_prompt,
+        context_for=reference_context,
+        count_tokens=GeminiBackend(MODEL_NAME).count_tokens,
+    )
+    return prompt
 
-if not USE_CASE.strip():
-    raise RuntimeError("No use case provided. Exiting.")
 
-# ---------- PROMPT ----------
-PROMPT = f"""
+def render_prompt(context: str, use_case: str) -> str:
+    return f"""
 You are an AI agent for SOAR Playbook Automation.
 
 STRICT OUTPUT FORMAT.
@@ -51,29 +64,322 @@ Align where relevant with:
 - NIST Incident Response
 - SOC SOPs
 
-Use case:
-{USE_CASE}
+{context}Use case:
+{use_case}
 """
 
-# ---------- RUN ----------
-response = client.models.generate_content(
-    model="models/gemini-2.5-flash",
-    contents=PROMPT,
-)
 
-output_text = response.text
+# ---------- INTERACTIVE MODE ----------
+def run_interactive() -> None:
+    client = get_gemini_client()
+
+    print("\nEnter SOAR use case details.")
+    print("Press Enter on an empty line to submit.\n")
+
+    lines = []
+    while True:
+        line = input("> ")
+        if line.strip() == "":
+            break
+        lines.append(line)
+
+    use_case = "\n".join(lines)
+
+    if not use_case.strip():
+        raise RuntimeError("No use case provided. Exiting.")
+
+    response = client.models.generate_content(
+        model=MODEL_NAME,
+        contents=build_prompt(use_case),
+    )
+
+    output_text = response.text
+
+    print("\n===== AI OUTPUT START =====\n")
+    print(output_text)
+    print("\n===== AI OUTPUT END =====\n")
+
+    # ---------- SAVE OUTPUT ----------
+    saved = archive_output(output_text, slugify(use_case.splitlines()[0]), use_case)
+    if saved is not None:
+        print(f"\nSaved playbook #{saved[0]} to {get_playbook_store().path}"
+              + ("" if saved[1] else " (identical playbook already stored)"))
+        return
+
+    # Output that does not follow the SECTION A / B format is kept verbatim
+    os.makedirs("playbooks", exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"playbooks/PB_generated_{timestamp}.txt"
+
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(output_text)
+
+    print(f"\nSaved output to {filename}")
+
+
+def archive_output(output_text: str, use_case_id: str, use_case: str, seconds: float = None):
+    """
+    Stores a SECTION A / B response in the playbook store.
+    Returns (playbook_id, created), or None if the store is disabled or
+    the response could not be parsed.
+    """
+    store = get_playbook_store()
+    if store is None:
+        return None
+
+    try:
+        playbook, documentation = parse_legacy_text(output_text)
+    except ValueError as e:
+        print(f"[WARN] {use_case_id}: not stored ({e})")
+        return None
+
+    return store.save(
+        playbook,
+        use_case=use_case_id,
+        source_alert=use_case,
+        model=MODEL_NAME,
+        timings={"total_seconds": seconds} if seconds is not None else None,
+        documentation=documentation,
+    )
+
+
+# ---------- BATCH INPUT SOURCES ----------
+def slugify(name: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+    return slug[:80] or "use_case"
+
+
+def load_catalog(path: str) -> list:
+    """
+    Parses use_case_catalog.txt style files:
+    "N. Title" followed by description lines, entries separated by blank lines.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = [e.strip() for e in re.split(r"\n\s*\n", f.read()) if e.strip()]
+
+    use_cases = []
+    for entry in entries:
+        title = re.sub(r"^\d+\.\s*", "", entry.splitlines()[0]).strip()
+        use_cases.append({"id": slugify(title), "use_case": entry})
+
+    return use_cases
+
+
+def load_directory(path: str) -> list:
+    use_cases = []
+
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if not name.endswith(".txt") or not os.path.isfile(full_path):
+            continue
+
+        with open(full_path, "r", encoding="utf-8") as f:
+            text = f.read().strip()
+
+        if text:
+            stem = re.sub(r"^PB_", "", os.path.splitext(name)[0])
+            use_cases.append({"id": slugify(stem), "use_case": text})
+
+    return use_cases
+
+
+def load_jsonl(stream) -> list:
+    """
+    One object per line: {"id": "...", "use_case": "..."} ("id" optional).
+    """
+    use_cases = []
+
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+
+        record = json.loads(line)
+        text = record.get("use_case") or record.get("text")
+        if not text:
+            raise RuntimeError(f"Line {line_no}: missing 'use_case'")
+
+        use_case_id = record.get("id") or slugify(text.splitlines()[0])
+        use_cases.append({"id": slugify(use_case_id), "use_case": text})
+
+    return use_cases
+
+
+# ---------- BATCH EXECUTION ----------
+class RateLimiter:
+    """
+    Spaces request starts evenly so at most `rpm` begin per minute.
+    """
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def write_atomic(path: str, text: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+async def generate_text(backend: GeminiBackend, prompt: str, limiter: RateLimiter, timeout_ms: int) -> str:
+    # Every attempt, retries included, counts against --rpm
+    await limiter.wait()
+    text = await backend.agenerate(prompt, timeout_ms)
+    if not text:
+        # Retryable, like any other malformed response
+        raise MalformedResponseError("Empty response from Gemini")
+    return text
+
+
+def record_failure(manifest, item: dict, error: BaseException) -> None:
+    manifest.write(json.dumps({"id": item["id"], "status": "failed", "error": str(error)}) + "\n")
+    manifest.flush()
+    print(f"[FAIL] {item['id']}: {error}")
+
+
+async def generate_one(backend: GeminiBackend, item: dict, output_dir: str, semaphore, limiter, manifest) -> bool:
+    output_path = os.path.join(output_dir, f"PB_{item['id']}.txt")
+
+    async with semaphore:
+        started = time.monotonic()
+
+        try:
+            # Retrieval and token counting block: keep them off the event loop
+            prompt = await asyncio.to_thread(build_prompt, item["use_case"])
+            text = await call_with_retries_async(
+                lambda timeout_ms: generate_text(backend, prompt, limiter, timeout_ms),
+                policy=default_retry_policy(),
+                deadline=Deadline(default_deadline_seconds()),
+                breaker=UPSTREAM_BREAKER,
+            )
+        except Exception as e:
+            record_failure(manifest, item, e)
+            return False
+
+    elapsed = round(time.monotonic() - started, 2)
+    try:
+        # Archived first: the output file is what marks the item done on resume
+        await asyncio.to_thread(archive_output, text, item["id"], item["use_case"], elapsed)
+        await asyncio.to_thread(write_atomic, output_path, text)
+    except Exception as e:
+        record_failure(manifest, item, e)
+        return False
+
+    manifest.write(json.dumps({
+        "id": item["id"],
+        "status": "ok",
+        "output": output_path,
+        "seconds": elapsed,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+    }) + "\n")
+    manifest.flush()
+
+    print(f"[OK] {item['id']} ({elapsed}s)")
+    return True
+
+
+async def run_batch_async(use_cases: list, output_dir: str, concurrency: int, rpm: float) -> int:
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Resume: anything with a finished output file is skipped
+    pending = [
+        item for item in use_cases
+        if not os.path.exists(os.path.join(output_dir, f"PB_{item['id']}.txt"))
+    ]
+
+    skipped = len(use_cases) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} use case(s) already generated in {output_dir}")
+
+    if not pending:
+        return 0
+
+    backend = GeminiBackend(MODEL_NAME)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rpm)
+
+    with open(os.path.join(output_dir, "manifest.jsonl"), "a", encoding="utf-8") as manifest:
+        try:
+            # Every item settles before the shared client is closed
+            results = await asyncio.gather(*(
+                generate_one(backend, item, output_dir, semaphore, limiter, manifest)
+                for item in pending
+            ), return_exceptions=True)
+        finally:
+            await get_client_holder().aclose()
+
+        for item, result in zip(pending, results):
+            if isinstance(result, BaseException):
+                record_failure(manifest, item, result)
+
+    failed = sum(1 for result in results if result is not True)
+    print(f"\nBatch done: {len(pending) - failed} generated, {failed} failed, {skipped} skipped")
+    return failed
+
+
+def run_batch(args) -> int:
+    if args.catalog:
+        use_cases = load_catalog(args.catalog)
+    elif args.input_dir:
+        use_cases = load_directory(args.input_dir)
+    else:
+        use_cases = load_jsonl(sys.stdin)
+
+    if not use_cases:
+        raise RuntimeError("No use cases found in batch input.")
+
+    seen = set()
+    for item in use_cases:
+        if item["id"] in seen:
+            raise RuntimeError(f"Duplicate use case id: {item['id']}")
+        seen.add(item["id"])
+
+    return asyncio.run(run_batch_async(use_cases, args.output_dir, args.concurrency, args.rpm))
+
+
+# ---------- ENTRYPOINT ----------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SOAR playbook generation agent")
+
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--catalog", help="Use case catalog file (e.g. use_case_catalog.txt)")
+    source.add_argument("--input-dir", help="Directory of .txt use cases (e.g. inputs/)")
+    source.add_argument("--stdin-jsonl", action="store_true", help="Read JSONL use cases from stdin")
+
+    parser.add_argument("--output-dir", default=DEFAULT_BATCH_DIR, help="Batch output directory")
+    parser.add_argument("--concurrency", type=int, default=4, help="Max in-flight requests")
+    parser.add_argument("--rpm", type=float, default=30, help="Max requests started per minute (0 = unlimited)")
+
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be >= 1")
+    return args
+
 
-print("\n===== AI OUTPUT START =====\n")
-print(output_text)
-print("\n===== AI OUTPUT END =====\n")
+def main(argv=None) -> int:
+    args = parse_args(argv)
 
-# ---------- SAVE OUTPUT ----------
-os.makedirs("playbooks", exist_ok=True)
+    if args.catalog or args.input_dir or args.stdin_jsonl:
+        return 1 if run_batch(args) else 0
 
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-filename = f"playbooks/PB_generated_{timestamp}.txt"
+    run_interactive()
+    return 0
 
-with open(filename, "w", encoding="utf-8") as f:
-    f.write(output_text)
 
-print(f"\nSaved output to {filename}")
+if __name__ == "__main__":
+    sys.exit(main())
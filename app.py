@@ -1,42 +1,56 @@
 import os
-import json
-import re
 import streamlit as st
-import streamlit.components.v1 as components
-from google import genai
+
+from core.diagram_engine import build_soar_mermaid
+from core.diagram_render import render_diagram
+from core.json_extractor import extract_json_value
+from core.llm_backends import get_backend
+from core.resilience import MalformedResponseError
+from core.rerun import render_debug_panel, track_rerun, warm_resources
+from core.retrieval import reference_context
+from core.token_budget import budget_prompt
 
 # -------------------------------------------------
 # PAGE CONFIG
 # -------------------------------------------------
 st.set_page_config(page_title="SOAR Playbook Generator", layout="wide")
+track_rerun("home")
 st.caption("Built by Accenture")
 
 # -------------------------------------------------
 # API CONFIG
 # -------------------------------------------------
 API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
+if os.getenv("PLAYBOOK_BACKEND", "gemini") == "gemini" and not API_KEY:
     st.error("GEMINI_API_KEY not set")
     st.stop()
 
-client = genai.Client(api_key=API_KEY)
+# Shared backend (PLAYBOOK_BACKEND / PLAYBOOK_HEDGE_BACKEND); the SDK client
+# behind it is only built on first use or by warm_resources() below
+backend = get_backend()
 
 # -------------------------------------------------
 # SAFE JSON EXTRACTION
 # -------------------------------------------------
 def extract_json(text: str):
-    try:
-        return json.loads(text)
-    except Exception:
-        match = re.search(r"\{[\s\S]*\}", text)
-        if not match:
-            raise ValueError("Invalid JSON returned by model")
-        return json.loads(match.group())
+    return extract_json_value(text, expected=(dict,))
 
 # -------------------------------------------------
 # PROMPT BUILDER
 # -------------------------------------------------
 def build_prompt(alert_text: str, depth: str):
+    # Compacts the alert and fits it (and the retrieved context) to the learning budget
+    prompt, _ = budget_prompt(
+        alert_text,
+        "learning",
+        render=lambda context, alert: render_prompt(context, alert, depth),
+        context_for=reference_context,
+        count_tokens=backend.count_tokens,
+    )
+    return prompt
+
+
+def render_prompt(context: str, alert_text: str, depth: str):
     return f"""
 You are a senior SOC SOAR architect.
 
@@ -59,7 +73,7 @@ Schema:
 
 Learning depth: {depth}
 
-Use case:
+{context}Use case:
 {alert_text}
 """
 
@@ -67,53 +81,35 @@ Use case:
 # MERMAID GENERATION
 # -------------------------------------------------
 def generate_mermaid(blocks):
-    lines = ["flowchart LR"]
-    for i, b in enumerate(blocks):
-        lines.append(f'B{i}["{b["title"]}"]:::core')
-        if i > 0:
-            lines.append(f'B{i-1} --> B{i}')
-
-    lines.append('D{"Threat Confidence?"}:::decision')
-    lines.append(f'B{len(blocks)-1} --> D')
-
-    lines += [
-        'D -->|High| HC1["Auto Containment"]:::contain',
-        'HC1 --> HC2["Disable / Block"]:::contain --> HC3["Preserve Evidence"]:::evidence --> HC4["Notify L2 / IR"]:::notify',
-        'D -->|Low / Medium| LC1["Manual Review"]:::manual --> LC2["L1 Analysis"]:::manual --> LC3["Close / Escalate"]:::notify',
-        "classDef core fill:#2563eb,color:#fff,stroke:#1e3a8a,stroke-width:2px",
-        "classDef decision fill:#f59e0b,stroke:#b45309,stroke-width:3px",
-        "classDef contain fill:#dc2626,color:#fff",
-        "classDef evidence fill:#7c3aed,color:#fff",
-        "classDef notify fill:#16a34a,color:#fff",
-        "classDef manual fill:#6b7280,color:#fff",
-    ]
-    return "\n".join(lines)
-
-def render_mermaid(code):
-    components.html(
-        f"""
-        <script src="https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.min.js"></script>
-        <script>mermaid.initialize({{ startOnLoad:true }});</script>
-        <div class="mermaid">{code}</div>
-        """,
-        height=650,
-    )
+    # Same lane layout and label escaping as the Deployment page
+    return build_soar_mermaid(blocks)
+
+def render_mermaid(blocks):
+    # Server-side render (no CDN); falls back to the diagram source without Graphviz
+    svg = render_diagram(blocks, "svg")
+    if svg is not None:
+        st.image(svg.decode("utf-8"))
+    else:
+        st.code(generate_mermaid(blocks), language="text")
 
 # -------------------------------------------------
 # SHARED ENGINE (USED BY PAGES)
 # -------------------------------------------------
 def generate_playbook(alert_text: str, mode: str = "learning", depth: str = "Beginner"):
-    resp = client.models.generate_content(
-        model="models/gemini-2.5-flash",
-        contents=build_prompt(alert_text, depth)
-    )
+    # pydantic is only loaded once a playbook is actually generated
+    from core.playbook_schema import LEARNING_SCHEMA, validate_playbook
 
-    data = extract_json(resp.text)
+    prompt = build_prompt(alert_text, depth)
+    text = backend.generate(prompt, timeout_ms=90_000, schema=LEARNING_SCHEMA.model)
 
-    if "blocks" not in data or not isinstance(data["blocks"], list):
-        raise ValueError("Invalid playbook structure")
+    # Invalid blocks are regenerated on their own, against the same prompt
+    def regenerate(instructions, schema):
+        return backend.generate(f"{prompt}\n\n{instructions}", timeout_ms=90_000, schema=schema)
 
-    return data
+    try:
+        return validate_playbook(LEARNING_SCHEMA, extract_json(text), regenerate)
+    except MalformedResponseError as e:
+        raise ValueError(f"Invalid playbook structure: {e}")
 
 # -------------------------------------------------
 # MAIN LANDING UI (OPTIONAL)
@@ -126,3 +122,7 @@ Use the sidebar to navigate:
 - 🚀 **Deployment** → Production-ready playbooks
 """
 )
+
+# SDK, clients, retrieval index, caches: loaded in the background once the page is up
+warm_resources()
+render_debug_panel()
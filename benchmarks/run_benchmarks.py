@@ -0,0 +1,276 @@
+"""
+Micro-benchmarks for the non-LLM hot paths: prompt building, JSON
+extraction, Mermaid generation, IRP document extraction and cold-start
+imports.
+
+    python benchmarks/run_benchmarks.py                      # run + print
+    python benchmarks/run_benchmarks.py --save-baseline      # record baseline
+    python benchmarks/run_benchmarks.py --compare            # fail on regressions
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core.diagram_engine import build_soar_mermaid
+from core.document_extraction import extract_docx, extract_pdf
+from core.json_extractor import extract_json_value
+from core.playbook_engine import build_prompt, extract_json
+from core.retrieval import RetrievalIndex, get_retrieval_index, source_files
+from core.startup import import_report
+from core.token_budget import compact_text, estimate_tokens
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+# -------------------------------------------------
+# Fixtures
+# -------------------------------------------------
+def read_corpus(relative_path: str) -> str:
+    with open(os.path.join(ROOT, relative_path), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def synthetic_blocks(count: int) -> List[Dict[str, Any]]:
+    types = ("enrichment", "decision", "automation", "human")
+    return [
+        {
+            "id": str(i),
+            "title": f"Step {i}: Enrich \"host-{i}\" [playbook {i % 7}]",
+            "type": types[i % len(types)],
+            "description": f"Synthetic block {i} " + "lorem ipsum " * 20,
+        }
+        for i in range(count)
+    ]
+
+
+def synthetic_playbook_text(count: int) -> str:
+    body = json.dumps({"summary": "Synthetic", "confidence": "High", "blocks": synthetic_blocks(count)}, indent=2)
+    return f"Here is the playbook:\n```json\n{body}\n```\nLet me know if you need changes {{ }}."
+
+
+def synthetic_siem_dump(lines: int) -> str:
+    events = "\n".join(
+        f"2026-01-12T10:{i // 60 % 60:02d}:{i % 60:02d}Z sshd[{4000 + i}]: Failed password for root "
+        f"from 203.0.{i // 256 % 256}.{i % 256} port {40000 + i} ssh2"
+        for i in range(lines)
+    )
+    return f"Alert: Brute force against WEB-01\n\n\n{events}\nThis message was sent by the SIEM. Do not reply.\n"
+
+
+def synthetic_pdf(pages: int) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(pages):
+        y = 800
+        for line in range(45):
+            pdf.drawString(40, y, f"IRP section {page}.{line}: isolate host, reset credentials, notify IR lead.")
+            y -= 16
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def synthetic_docx(paragraphs: int) -> bytes:
+    from docx import Document
+
+    document = Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"Step {i}: Validate alert, enrich entities, escalate to L2 if confirmed.")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+# -------------------------------------------------
+# Stage Registry
+# -------------------------------------------------
+def build_stages(quick: bool) -> List[Tuple[str, Callable[[], Any]]]:
+    output_txt = read_corpus("output.txt")
+    latest_txt = read_corpus(os.path.join("playbooks", "PB_latest.txt"))
+    blocks_json = read_corpus(os.path.join("playbooks", "PB_blocks.json"))
+    alert = read_corpus(os.path.join("inputs", "PB_Account_Compromise_BruteForce_Success.txt"))
+    siem_dump = synthetic_siem_dump(2_000 if quick else 20_000)
+
+    sizes = (1_000,) if quick else (1_000, 10_000)
+    synthetic = {n: synthetic_playbook_text(n) for n in sizes}
+    blocks = {n: synthetic_blocks(n) for n in sizes}
+
+    stages: List[Tuple[str, Callable[[], Any]]] = [
+        ("build_prompt/alert", lambda: build_prompt(alert, "Deployment", "Deep")),
+        ("build_prompt/300kb", lambda: build_prompt(latest_txt, "Deployment", "Deep")),
+        ("token_budget/estimate_300kb", lambda: estimate_tokens(latest_txt)),
+        ("token_budget/compact_siem_dump", lambda: compact_text(siem_dump)),
+        ("retrieval/build_index", lambda: RetrievalIndex.build(source_files())),
+        ("retrieval/search_alert", lambda: get_retrieval_index().search(alert)),
+        ("extract_json/output.txt", lambda: extract_json_value(output_txt)),
+        ("extract_json/PB_latest.txt", lambda: extract_json_value(latest_txt)),
+        ("extract_json/PB_blocks.json", lambda: extract_json_value(blocks_json)),
+        # Fresh interpreter each run: what a new worker / CLI run pays before its first output
+        ("startup/import_playbook_engine", lambda: import_report("core.playbook_engine")),
+        ("startup/import_agent", lambda: import_report("agent")),
+    ]
+
+    for n in sizes:
+        stages.append((f"extract_json/synthetic_{n}", lambda n=n: extract_json(synthetic[n])))
+        stages.append((f"build_soar_mermaid/{n}", lambda n=n: build_soar_mermaid(blocks[n], use_cache=False)))
+        stages.append((f"build_soar_mermaid/{n}_memoized", lambda n=n: build_soar_mermaid(blocks[n])))
+
+    try:
+        pdf_pages = 20 if quick else 100
+        pdf_bytes = synthetic_pdf(pdf_pages)
+        stages.append((f"extract_pdf/{pdf_pages}_pages", lambda: extract_pdf(pdf_bytes, use_cache=False)))
+        stages.append((f"extract_pdf/{pdf_pages}_pages_cached", lambda: extract_pdf(pdf_bytes)))
+    except ImportError:
+        print("reportlab not installed; skipping PDF extraction benchmark", file=sys.stderr)
+
+    try:
+        docx_bytes = synthetic_docx(2_000)
+        stages.append(("extract_docx/2000_paragraphs", lambda: extract_docx(docx_bytes, use_cache=False)))
+        stages.append(("extract_docx/2000_paragraphs_cached", lambda: extract_docx(docx_bytes)))
+    except ImportError:
+        print("python-docx not installed; skipping DOCX extraction benchmark", file=sys.stderr)
+
+    return stages
+
+
+# -------------------------------------------------
+# Measurement
+# -------------------------------------------------
+def measure(fn: Callable[[], Any], min_runs: int, min_seconds: float) -> Dict[str, Any]:
+    fn()  # warm-up
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_runs or time.perf_counter() - started < min_seconds:
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+        if len(timings) >= 1_000:
+            break
+
+    # Separate pass so tracemalloc overhead does not skew timings
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "runs": len(timings),
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(stages, min_runs: int, min_seconds: float, name_filter: str) -> Dict[str, Any]:
+    results = {}
+    for name, fn in stages:
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(fn, min_runs, min_seconds)
+        r = results[name]
+        print(f"{name:<36} median {r['median_s'] * 1000:10.3f} ms   peak {r['peak_kib']:10.1f} KiB   ({r['runs']} runs)")
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+# -------------------------------------------------
+# Baseline Comparison
+# -------------------------------------------------
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], time_threshold: float, memory_threshold: float) -> List[str]:
+    regressions = []
+
+    for name, now in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+
+        time_ratio = now["median_s"] / before["median_s"] if before["median_s"] else 1.0
+        mem_ratio = now["peak_kib"] / before["peak_kib"] if before["peak_kib"] else 1.0
+
+        flag = ""
+        if time_ratio > time_threshold:
+            flag += " TIME"
+        if mem_ratio > memory_threshold:
+            flag += " MEMORY"
+        if flag:
+            regressions.append(name)
+
+        print(f"{name:<36} time x{time_ratio:5.2f}   memory x{mem_ratio:5.2f}{flag}")
+
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark non-LLM pipeline stages")
+    parser.add_argument("--quick", action="store_true", help="Smaller fixtures (CI smoke run)")
+    parser.add_argument("--filter", default="", help="Only run stages whose name contains this")
+    parser.add_argument("--min-runs", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.5)
+    parser.add_argument("--output", help="Results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline; exit 1 on regression")
+    parser.add_argument("--time-threshold", type=float, default=1.25, help="Allowed median slowdown ratio")
+    parser.add_argument("--memory-threshold", type=float, default=1.25, help="Allowed peak memory ratio")
+    args = parser.parse_args(argv)
+
+    current = run(build_stages(args.quick), args.min_runs, args.min_seconds, args.filter)
+
+    output = args.output
+    if output is None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        output = os.path.join(DEFAULT_RESULTS_DIR, datetime.now().strftime("bench_%Y%m%d_%H%M%S.json"))
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+            return 2
+
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        print("\nComparison against baseline:")
+        regressions = compare(current, baseline, args.time_threshold, args.memory_threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+import os
+import re
+import ipaddress
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.response_cache import ROOT, ResponseCache, get_response_cache, make_cache_key
+from core.telemetry import record_event, span
+
+
+# Bump when placeholder rules change so old templates are not reused
+TEMPLATE_VERSION = "2"
+
+# Templates get their own file: their own LRU budget and counters
+DEFAULT_TEMPLATE_CACHE_PATH = os.path.join(ROOT, ".cache", "playbook_templates.sqlite3")
+
+# Fields copied verbatim from cached playbooks (never templated)
+_STRUCTURAL_FIELDS = frozenset({"id", "type", "confidence"})
+
+
+# -------------------------------------------------
+# Entity Patterns
+# -------------------------------------------------
+_MONTHS = r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*"
+_COUNT_NOUNS = (
+    r"(?:attempts?|failures?|times|events?|logins?|logons?|requests?|messages?|emails?|otps?|"
+    r"files?|hosts?|users?|accounts?|connections?|alerts?|queries|sessions?|packets?|"
+    r"seconds?|secs?|minutes?|mins?|hours?|hrs?|days?)"
+)
+_FILE_EXTENSIONS = frozenset(
+    "exe dll sys ps1 psm1 bat cmd vbs js jse hta scr msi lnk iso img zip rar 7z gz tar "
+    "doc docx docm xls xlsx xlsm ppt pptx pdf txt log csv json xml html htm py sh".split()
+)
+
+# Alternatives are tried left to right at each position, so more specific
+# entity types must come first (timestamps before counts, emails before hosts).
+# Matching is case-sensitive except for the (?i:...) keyword groups.
+_ENTITY = re.compile(
+    r"(?P<TIMESTAMP>"
+    r"\b\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?\b"
+    r"|\b\d{1,2}/\d{1,2}/\d{2,4}(?:,?\s+\d{1,2}:\d{2}(?::\d{2})?(?:\s?[AaPp][Mm])?)?"
+    rf"|\b(?i:{_MONTHS})\s+\d{{1,2}}(?:,?\s+\d{{4}})?\s+\d{{1,2}}:\d{{2}}(?::\d{{2}})?"
+    r"|\b\d{1,2}:\d{2}:\d{2}(?:\.\d+)?\b"
+    r")"
+    r"|(?P<UPN_LABEL>(?i:upn|userprincipalname|user(?:name)?|account|principal|log[io]n)\s*[:=]\s*[\"']?)"
+    r"(?P<UPN>[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})"
+    r"|(?P<EMAIL>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)"
+    r"|(?P<ACCOUNT>\b[A-Z][A-Z0-9-]{1,14}\\[A-Za-z0-9._$-]+)"
+    r"|(?P<HASH>\b(?:[A-Fa-f0-9]{64}|[A-Fa-f0-9]{40}|[A-Fa-f0-9]{32})\b)"
+    r"|(?P<IPV6>(?<![\w:.])(?:[A-Fa-f0-9]{0,4}:){2,7}[A-Fa-f0-9]{0,4}(?![\w:]))"
+    r"|(?P<IPV4>\b(?:\d{1,3}\.){3}\d{1,3}\b)"
+    r"|(?P<HOST_LABEL>(?i:host(?:name)?|computer(?:name)?|device(?:name)?|workstation|endpoint)\s*[:=]\s*[\"']?)"
+    r"(?P<HOST>[A-Za-z0-9](?:[A-Za-z0-9.-]*[A-Za-z0-9])?)"
+    r"|(?P<FQDN>\b(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,24}\b)"
+    r"|(?P<HOSTNAME>\b(?!(?:CVE|SHA|TLS|SSL|RFC|ISO|AES|RSA|UTF|HTTP)-)[A-Z][A-Z0-9]*-[A-Z0-9-]*\d[A-Z0-9-]*\b)"
+    rf"|(?P<COUNT>\b\d+(?=\s+(?:[A-Za-z]+\s+)?(?i:{_COUNT_NOUNS})\b))"
+)
+
+_PLACEHOLDER = re.compile(r"<([A-Z0-9]+_\d+)>")
+
+
+def _valid_ip(value: str) -> bool:
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _looks_like_host(value: str) -> bool:
+    # "host: server" is prose; "host: WS-0042", "host: dc01.corp" and "host: SQLPROD" are names
+    return any(c.isdigit() or c in ".-" for c in value) or (len(value) > 1 and value.isupper())
+
+
+def _round_trips(kind: str, value: str) -> bool:
+    """
+    Whether templatize_playbook() can put the value back as a placeholder.
+    Single-digit counts cannot (they collide with ordinary prose), so they
+    stay in the normalized text and alerts with different ones do not share
+    a template.
+    """
+    return not (kind == "COUNT" and len(value) < 2)
+
+
+def _classify(match: re.Match) -> Tuple[Optional[str], str, str]:
+    """(entity_type, prefix_kept_verbatim, value), or (None, "", text) to leave as-is."""
+    kind = match.lastgroup
+    text = match.group(0)
+
+    if kind == "UPN":
+        return kind, match.group("UPN_LABEL"), match.group("UPN")
+    if kind == "HOST":
+        value = match.group("HOST")
+        if _valid_ip(value):
+            kind = "IPV6" if ":" in value else "IPV4"
+        elif not _looks_like_host(value):
+            return None, "", text
+        return kind, match.group("HOST_LABEL"), value
+    if kind == "FQDN":
+        if text.rsplit(".", 1)[-1].lower() in _FILE_EXTENSIONS:
+            return None, "", text
+        return "HOST", "", text
+    if kind == "HOSTNAME":
+        return "HOST", "", text
+    if kind in ("IPV4", "IPV6") and not _valid_ip(text):
+        return None, "", text
+    return kind, "", text
+
+
+# -------------------------------------------------
+# Normalization
+# -------------------------------------------------
+def normalize_alert(alert_text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Replaces entities with indexed, typed placeholders.
+
+    "Login for bob@corp.com from 10.0.0.5 and 10.0.0.5 again" ->
+    ("Login for <EMAIL_1> from <IPV4_1> and <IPV4_1> again",
+     {"EMAIL_1": "bob@corp.com", "IPV4_1": "10.0.0.5"})
+
+    Repeated values share a placeholder, so alerts only share a template
+    when their entities line up the same way. Values that could not be
+    put back into a generated playbook are left in the text.
+    """
+    entities: Dict[str, str] = {}
+    by_value: Dict[Tuple[str, str], str] = {}
+    counts: Dict[str, int] = {}
+
+    def replace(match: re.Match) -> str:
+        kind, prefix, value = _classify(match)
+        if kind is None or not _round_trips(kind, value):
+            return match.group(0)
+
+        name = by_value.get((kind, value))
+        if name is None:
+            counts[kind] = counts.get(kind, 0) + 1
+            name = f"{kind}_{counts[kind]}"
+            by_value[(kind, value)] = name
+            entities[name] = value
+        return f"{prefix}<{name}>"
+
+    template = _ENTITY.sub(replace, alert_text)
+    return " ".join(template.split()), entities
+
+
+def template_key(template: str, model: str, mode: str, depth: str, prompt_version: str = "") -> str:
+    """
+    `prompt_version` identifies everything else that goes into the prompt
+    (prefix, retrieval corpus): a change there must not serve old templates.
+    """
+    return make_cache_key(template, model, f"template:{TEMPLATE_VERSION}:{prompt_version}:{mode}", depth)
+
+
+# -------------------------------------------------
+# Playbook <-> Template
+# -------------------------------------------------
+def _map_strings(value: Any, fn, key: Optional[str] = None) -> Any:
+    if isinstance(value, str):
+        return value if key in _STRUCTURAL_FIELDS else fn(value)
+    if isinstance(value, list):
+        return [_map_strings(v, fn, key) for v in value]
+    if isinstance(value, dict):
+        return {k: _map_strings(v, fn, k) for k, v in value.items()}
+    return value
+
+
+def _strings(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+
+
+def templatize_playbook(playbook: Dict[str, Any], entities: Dict[str, str]) -> Dict[str, Any]:
+    """Swaps this alert's entity values in the playbook text for their placeholders."""
+    values = {value: name for name, value in entities.items()}
+    if not values:
+        return playbook
+
+    pattern = re.compile(
+        r"(?<![\w.@\\-])(?:" + "|".join(re.escape(v) for v in sorted(values, key=len, reverse=True)) + r")(?![\w@-])"
+    )
+    return _map_strings(playbook, lambda s: pattern.sub(lambda m: f"<{values[m.group(0)]}>", s))
+
+
+def leaked_entities(template: Dict[str, Any], entities: Dict[str, str]) -> List[str]:
+    """
+    Entity names whose value is still in a templatized playbook in some
+    form templatize_playbook() missed: another case ("ws-0042"), or just
+    the user part of an address ("alice" for alice@corp.com, CORP\\alice).
+    Such a template would show this incident's entities in the next one.
+    """
+    needles: Dict[str, str] = {}
+    for name, value in entities.items():
+        needles[value.lower()] = name
+        if name.startswith(("EMAIL_", "UPN_")):
+            needles[value.split("@", 1)[0].lower()] = name
+        elif name.startswith("ACCOUNT_"):
+            needles[value.split("\\", 1)[-1].lower()] = name
+
+    needles.pop("", None)
+    if not needles:
+        return []
+
+    pattern = re.compile(
+        r"(?<![A-Za-z0-9_])(?:" + "|".join(re.escape(v) for v in sorted(needles, key=len, reverse=True)) + r")(?![A-Za-z0-9_])",
+        re.IGNORECASE,
+    )
+    leaked = {needles[m.group(0).lower()] for s in _strings(template) for m in pattern.finditer(s)}
+    return sorted(leaked)
+
+
+def fill_playbook(template: Dict[str, Any], entities: Dict[str, str]) -> Dict[str, Any]:
+    return _map_strings(
+        template,
+        lambda s: _PLACEHOLDER.sub(lambda m: entities.get(m.group(1), m.group(0)), s),
+    )
+
+
+# -------------------------------------------------
+# Template Cache
+# -------------------------------------------------
+class TemplateCache:
+    """
+    Serves playbooks for alerts that differ from an earlier one only in
+    their entities (IPs, accounts, hosts, hashes, timestamps, counts).
+
+    Entries live in their own ResponseCache file under a key derived from
+    the normalized alert; the stored playbook carries placeholders that
+    are filled with the new alert's entities on a hit. Playbooks that
+    still mention an entity after templating are not stored.
+    """
+
+    def __init__(self, store: ResponseCache):
+        self.store = store
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "unsafe": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+        record_event(f"template_cache_{name}")
+
+    def lookup(
+        self,
+        alert_text: str,
+        model: str,
+        mode: str,
+        depth: str,
+        prompt_version: str = ""
+    ) -> Tuple[Optional[Dict[str, Any]], str, Dict[str, str]]:
+        """
+        Returns (playbook_or_None, key, entities); pass key and entities
+        to store_playbook() after generating on a miss.
+        """
+        with span("template_normalize", chars=len(alert_text)) as s:
+            template, entities = normalize_alert(alert_text)
+            s.set("entities", len(entities))
+        key = template_key(template, model, mode, depth, prompt_version)
+
+        with span("template_cache_lookup") as s:
+            cached = self.store.get(key)
+            s.set("hit", cached is not None)
+
+        if cached is None:
+            self._count("misses")
+            return None, key, entities
+
+        self._count("hits")
+        return fill_playbook(cached["playbook"], entities), key, entities
+
+    def store_playbook(self, key: str, entities: Dict[str, str], playbook: Dict[str, Any]) -> None:
+        template = templatize_playbook(playbook, entities)
+        if leaked_entities(template, entities):
+            self._count("unsafe")
+            return
+
+        self.store.set(key, {"playbook": template})
+        self._count("stores")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": (counters["hits"] / lookups) if lookups else 0.0,
+            "entries": self.store.stats()["entries"],
+        }
+
+
+_template_cache: Optional[TemplateCache] = None
+_template_lock = threading.Lock()
+
+
+def get_template_cache() -> Optional[TemplateCache]:
+    """
+    None when PLAYBOOK_TEMPLATE_CACHE_DISABLED is set or the response
+    cache itself is disabled (PLAYBOOK_CACHE_DISABLED turns off both).
+    """
+    global _template_cache
+
+    if os.getenv("PLAYBOOK_TEMPLATE_CACHE_DISABLED"):
+        return None
+
+    responses = get_response_cache()
+    if responses is None:
+        return None
+
+    if _template_cache is None:
+        with _template_lock:
+            if _template_cache is None:
+                _template_cache = TemplateCache(ResponseCache(
+                    path=os.getenv("PLAYBOOK_TEMPLATE_CACHE_PATH", DEFAULT_TEMPLATE_CACHE_PATH),
+                    max_bytes=int(os.getenv("PLAYBOOK_TEMPLATE_CACHE_MAX_BYTES", responses.max_bytes)),
+                    ttl_seconds=responses.ttl_seconds,
+                ))
+    return _template_cache
+
+
+def template_cache_stats() -> Dict[str, Any]:
+    cache = get_template_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
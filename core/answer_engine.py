@@ -0,0 +1,360 @@
+"""
+"Ask Siemmy": answers learner questions from the learning material first.
+
+    answer = get_answer_engine().ask(question, "Beginner", user=user_key(by_ip=False), session=session_key())
+
+1. Answer cache: an LRU on (level, normalized question)
+2. Local retrieval: BM25 (core.retrieval.RetrievalIndex) over learning/*.md
+   and the reference files, built in memory once per process and restricted
+   to the learner's level file plus the references. A strong match is
+   answered from the passage with no model call
+3. Model fallback for weak matches: the closest passage is returned right
+   away with `pending` set to a Future for the model's answer. Fallbacks are
+   debounced per session (only a question still current after
+   DEBOUNCE_SECONDS is sent), rate-limited per user and per process, and
+   identical questions share one call. Model answers are cached too.
+   Pass user_key(by_ip=False) as the user key (see core.rerun.user_key)
+"""
+
+import os
+import re
+import glob
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.resilience import (
+    Deadline,
+    RateLimiter,
+    SingleFlight,
+    call_with_retries,
+    default_retry_policy,
+)
+from core.retrieval import ROOT, RetrievalIndex, format_context, tokenize
+from core.telemetry import record_event, span
+
+
+# -----------------------------
+# Configuration (env)
+# -----------------------------
+CACHE_SIZE = int(os.getenv("PLAYBOOK_SIEMMY_CACHE_SIZE", 512))
+
+# A local answer needs this BM25 score and this share of the question's terms
+MIN_SCORE = float(os.getenv("PLAYBOOK_SIEMMY_MIN_SCORE", 4.0))
+MIN_COVERAGE = float(os.getenv("PLAYBOOK_SIEMMY_MIN_COVERAGE", 0.6))
+
+DEBOUNCE_SECONDS = float(os.getenv("PLAYBOOK_SIEMMY_DEBOUNCE_SECONDS", 0.8))
+MODEL_PER_USER_PER_MINUTE = float(os.getenv("PLAYBOOK_SIEMMY_MODEL_PER_USER", 3))
+MODEL_PER_MINUTE = float(os.getenv("PLAYBOOK_SIEMMY_MODEL_PER_MINUTE", 30))
+MODEL_TIMEOUT_SECONDS = float(os.getenv("PLAYBOOK_SIEMMY_MODEL_TIMEOUT", 20))
+
+MAX_TRACKED_SESSIONS = 10_000
+
+LEVEL_SOURCES = {
+    "Beginner": os.path.join("learning", "beginner.md"),
+    "Intermediate": os.path.join("learning", "intermediate.md"),
+    "Advanced": os.path.join("learning", "advanced.md"),
+}
+REFERENCE_PATTERN = "reference_*.txt"
+
+PASSAGE_MAX_CHARS = 700
+# "What you will learn" / "What's next?" sections (and bare titles) describe the course, not the topic
+_COURSE_HEADINGS = re.compile(r"^(?:what you will learn|what[’']s next)", re.IGNORECASE)
+MIN_PASSAGE_CHARS = 60
+
+# Phrasing words that say nothing about the topic
+_QUESTION_WORDS = frozenset("""
+what whats why how when where who whom which does do did done explain tell me
+about difference between mean means meaning define definition you your we our
+my could would please exactly actually really example examples
+""".split())
+
+
+def question_terms(question: str) -> List[str]:
+    return [t for t in tokenize(question) if t not in _QUESTION_WORDS]
+
+
+def _level(level: Optional[str]) -> str:
+    return level if level in LEVEL_SOURCES else "Beginner"
+
+
+# -----------------------------
+# Answer Engine
+# -----------------------------
+class AnswerEngine:
+    def __init__(self, index: RetrievalIndex, references: List[str]):
+        self.index = index
+        self.references = references
+
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        # Each session's most recent fallback question, for debouncing
+        self._latest: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._counters = {
+            "questions": 0, "cache_hits": 0, "local": 0, "fallbacks": 0,
+            "model_answers": 0, "superseded": 0, "rate_limited": 0, "model_errors": 0,
+        }
+
+        self.limiter = RateLimiter("siemmy_model", MODEL_PER_USER_PER_MINUTE, MODEL_PER_MINUTE)
+        self._flights = SingleFlight("siemmy")
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="siemmy")
+
+    @classmethod
+    def build(cls, root: str = ROOT) -> "AnswerEngine":
+        references = sorted(glob.glob(os.path.join(root, REFERENCE_PATTERN)))
+        paths = [os.path.join(root, source) for source in LEVEL_SOURCES.values()] + references
+        index = RetrievalIndex.build([path for path in paths if os.path.exists(path)], root=root)
+        return cls(index, [os.path.relpath(path, root) for path in references])
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+        record_event(f"siemmy_{name}")
+
+    # -------------------------
+    # Cache
+    # -------------------------
+    def _cached(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            answer = self._cache.get(key)
+            if answer is not None:
+                self._cache.move_to_end(key)
+            return answer
+
+    def _remember(self, key: Tuple[str, str], answer: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[key] = answer
+            self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    # -------------------------
+    # Local Retrieval
+    # -------------------------
+    def passages(self, question: str, level: str, k: int = 3) -> List[Tuple[float, float, Dict[str, Any]]]:
+        """(score, coverage, chunk) for the best passages in the level's material."""
+        terms = set(question_terms(question))
+        if not terms:
+            return []
+
+        sources = [LEVEL_SOURCES[level], *self.references]
+        hits = []
+        for score, chunk in self.index.search(" ".join(terms), k=k * 3, sources=sources):
+            if len(chunk["text"]) < MIN_PASSAGE_CHARS or _COURSE_HEADINGS.match(chunk["heading"]):
+                continue
+            coverage = len(terms & set(tokenize(f"{chunk['heading']} {chunk['text']}"))) / len(terms)
+            hits.append((score, coverage, chunk))
+            if len(hits) == k:
+                break
+        return hits
+
+    @staticmethod
+    def _label(chunk: Dict[str, Any]) -> str:
+        return chunk["source"] + (f" › {chunk['heading']}" if chunk["heading"] else "")
+
+    @classmethod
+    def _from_passage(cls, chunk: Dict[str, Any], score: float, strong: bool) -> Dict[str, Any]:
+        lines = [line for line in chunk["text"].splitlines() if not line.startswith("#") and line.strip() != "---"]
+        text = "\n".join(lines).strip()
+        if len(text) > PASSAGE_MAX_CHARS:
+            text = text[:PASSAGE_MAX_CHARS].rsplit("\n", 1)[0] + "\n..."
+        return {
+            "text": text,
+            "heading": chunk["heading"],
+            "sources": [cls._label(chunk)],
+            "origin": "local",
+            "strong": strong,
+            "score": round(score, 2),
+        }
+
+    # -------------------------
+    # Ask
+    # -------------------------
+    def ask(
+        self,
+        question: str,
+        level: Optional[str],
+        user: str,
+        session: Optional[str] = None,
+        allow_model: bool = True
+    ) -> Dict[str, Any]:
+        """
+        The answer dict: text, sources, origin ("local" | "model"), cached,
+        and `pending`, a Future resolving to the model's answer (or a dict
+        with a `note` when none was produced) while a fallback is in flight.
+
+        `user` is charged for model calls; `session` (default: `user`) is
+        what a newer question supersedes within.
+        """
+        level = _level(level)
+        session = session or user
+        key = (level, " ".join(question_terms(question)) or question.strip().lower())
+        self._count("questions")
+
+        cached = self._cached(key)
+        if cached is not None:
+            self._count("cache_hits")
+            return {**cached, "cached": True, "pending": None}
+
+        with span("siemmy_local", level=level) as s:
+            hits = self.passages(question, level)
+            best = hits[0] if hits else None
+            strong = best is not None and best[0] >= MIN_SCORE and best[1] >= MIN_COVERAGE
+            s.set("strong", strong)
+
+        if best is not None:
+            answer = self._from_passage(best[2], best[0], strong)
+        else:
+            answer = {"text": "", "heading": "", "sources": [], "origin": "local", "strong": False, "score": 0.0}
+
+        if strong:
+            self._count("local")
+            self._remember(key, answer)
+            return {**answer, "cached": False, "pending": None}
+
+        passages = [chunk for _, _, chunk in hits]
+        pending = self._fallback(key, question, level, user, session, passages) if allow_model else None
+        return {**answer, "cached": False, "pending": pending}
+
+    # -------------------------
+    # Model Fallback
+    # -------------------------
+    def _fallback(
+        self,
+        key: Tuple[str, str],
+        question: str,
+        level: str,
+        user: str,
+        session: str,
+        passages: List[Dict[str, Any]]
+    ) -> Future:
+        self._count("fallbacks")
+        with self._lock:
+            self._latest[session] = key
+            self._latest.move_to_end(session)
+            while len(self._latest) > MAX_TRACKED_SESSIONS:
+                self._latest.popitem(last=False)
+        return self._pool.submit(
+            self._model_answer, key, question, level, user, session, passages, time.monotonic()
+        )
+
+    def _model_answer(
+        self,
+        key: Tuple[str, str],
+        question: str,
+        level: str,
+        user: str,
+        session: str,
+        passages: List[Dict[str, Any]],
+        submitted_at: float
+    ) -> Dict[str, Any]:
+        # Debounce: a newer question from the same session while this one waited wins
+        time.sleep(max(0.0, DEBOUNCE_SECONDS - (time.monotonic() - submitted_at)))
+        with self._lock:
+            superseded = self._latest.get(session) != key
+        if superseded:
+            self._count("superseded")
+            return {"note": "superseded"}
+
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        # Askers of the same question share one call and one rate-limit token
+        return self._flights.do(
+            f"{key[0]}\x00{key[1]}",
+            lambda: self._limited_model_answer(key, question, level, user, passages),
+        )
+
+    def _limited_model_answer(
+        self,
+        key: Tuple[str, str],
+        question: str,
+        level: str,
+        user: str,
+        passages: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        if not self.limiter.try_acquire(user):
+            self._count("rate_limited")
+            return {"note": "rate_limited"}
+
+        try:
+            answer = self._ask_model(question, level, passages)
+        except Exception:
+            # The local passage stays on screen
+            self._count("model_errors")
+            return {"note": "unavailable"}
+
+        self._count("model_answers")
+        self._remember(key, answer)
+        return answer
+
+    def _ask_model(self, question: str, level: str, passages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        from core.llm_backends import get_backend
+        from core.playbook_engine import UPSTREAM_BREAKER
+
+        backend = get_backend()
+        prompt = render_prompt(question, level, passages)
+        with span("siemmy_model", backend=backend.name):
+            text = call_with_retries(
+                lambda timeout_ms: backend.generate(prompt, timeout_ms),
+                policy=default_retry_policy(),
+                deadline=Deadline(MODEL_TIMEOUT_SECONDS),
+                breaker=UPSTREAM_BREAKER,
+            )
+        return {
+            "text": text.strip(),
+            "heading": "",
+            "sources": [self._label(chunk) for chunk in passages],
+            "origin": "model",
+            "strong": True,
+            "score": None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            cached = len(self._cache)
+        return {
+            **counters,
+            "cached_answers": cached,
+            "index": self.index.stats(),
+            "rate_limit": self.limiter.stats(),
+            "coalescing": self._flights.stats(),
+        }
+
+
+def render_prompt(question: str, level: str, passages: List[Dict[str, Any]]) -> str:
+    context = format_context(passages) if passages else "(no matching lesson passage)"
+    return f"""
+You are Siemmy, a friendly SOC mentor on a SOC / SIEM / SOAR learning platform.
+The learner is at the {level} level.
+
+Answer the question in at most 120 words, in plain language for that level.
+Use the lesson passages below when they are relevant. If the question is not
+about security operations, say so briefly and point back to SOC topics.
+
+Lesson passages:
+{context}
+
+Question:
+{question.strip()}
+""".strip()
+
+
+_engine: Optional[AnswerEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_answer_engine() -> AnswerEngine:
+    """Built in memory once per process (a few ms: the learning material is small)."""
+    global _engine
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                with span("siemmy_index_build"):
+                    _engine = AnswerEngine.build()
+    return _engine
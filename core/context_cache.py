@@ -0,0 +1,278 @@
+"""
+Model-side caching of the static prompt prefix (Gemini context caching).
+
+The instructions, rules, schema and reference material at the top of every
+playbook prompt never change between requests. They are registered once per
+model as a cached context (client.caches) and each request then sends only
+its alert-specific suffix plus the cache name.
+
+- The cache is found by display name, so every worker process shares one
+- It is extended (caches.update) when a request finds it within
+  REFRESH_MARGIN_SECONDS of expiry; an idle app lets it lapse
+- Changing the prefix text changes its hash: a new cache is created and
+  the old one deleted if this process made it (or nobody has touched it
+  for TTL_SECONDS); another process's cache is left to expire, since that
+  process may still be serving the old prefix
+- A prefix below the model's minimum cacheable size (MIN_CACHE_TOKENS,
+  checked once per prefix with count_tokens) is never registered: those
+  requests send the full prompt, and stats() lists it under below_minimum
+- If the API refuses otherwise, requests fall back to the full prompt and
+  creation is retried after RETRY_SECONDS
+"""
+
+import os
+import time
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set, Tuple
+
+from core.telemetry import record_event, span
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+
+# -----------------------------
+# Configuration (env)
+# -----------------------------
+TTL_SECONDS = int(os.getenv("PLAYBOOK_CONTEXT_CACHE_TTL", 3600))
+REFRESH_MARGIN_SECONDS = int(os.getenv("PLAYBOOK_CONTEXT_CACHE_REFRESH_MARGIN", 300))
+RETRY_SECONDS = float(os.getenv("PLAYBOOK_CONTEXT_CACHE_RETRY_SECONDS", 600))
+
+# A cache this close to expiry is not handed out (it could lapse mid-request)
+EXPIRY_SLACK_SECONDS = 30
+
+# Smallest cacheable context per model family; caches.create rejects less
+MIN_CACHE_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+}
+DEFAULT_MIN_CACHE_TOKENS = int(os.getenv("PLAYBOOK_CONTEXT_CACHE_MIN_TOKENS", 4096))
+
+DISPLAY_NAME_PREFIX = "soar-playbook-prefix-"
+
+
+def prefix_digest(model: str, prefix: str) -> str:
+    return hashlib.sha256(f"{model}\x00{prefix}".encode("utf-8")).hexdigest()[:16]
+
+
+def min_cache_tokens(model: str) -> int:
+    name = model.split("/")[-1]
+    for family, tokens in MIN_CACHE_TOKENS.items():
+        if name.startswith(family):
+            return tokens
+    return DEFAULT_MIN_CACHE_TOKENS
+
+
+class _Entry:
+    def __init__(self, digest: str, name: str, expires_at: float):
+        self.digest = digest
+        self.name = name
+        self.expires_at = expires_at
+
+    def remaining(self, now: float) -> float:
+        return self.expires_at - now
+
+
+def _expires_at(cached: "types.CachedContent") -> float:
+    if cached.expire_time is not None:
+        return cached.expire_time.timestamp()
+    return time.time() + TTL_SECONDS
+
+
+def _abandoned(cached: "types.CachedContent", now: float) -> bool:
+    """Nobody has created or extended it for a full TTL."""
+    touched = cached.update_time or cached.create_time
+    return touched is not None and now - touched.timestamp() > TTL_SECONDS
+
+
+# -----------------------------
+# Context Cache Registry
+# -----------------------------
+class ContextCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # One refresh / create at a time; other requests keep using the live entry meanwhile
+        self._maintenance = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._failed_until: Dict[str, float] = {}
+        # digest -> (model, prefix tokens) for prefixes too small to cache
+        self._below_minimum: Dict[str, Tuple[str, int]] = {}
+        # Names of caches this process registered
+        self._created: Set[str] = set()
+        self._counters = {
+            "hits": 0, "created": 0, "reused": 0, "refreshed": 0, "invalidated": 0, "errors": 0,
+            "below_minimum_requests": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+        record_event(f"context_cache_{name}")
+
+    def resolve(self, client, model: str, prefix: str) -> Optional[str]:
+        """
+        Name of a live cached context holding `prefix` for `model`, or None
+        when the caller should send the full prompt instead.
+        """
+        digest = prefix_digest(model, prefix)
+        now = time.time()
+
+        entry = self._entries.get(model)
+        usable = entry is not None and entry.digest == digest and entry.remaining(now) > EXPIRY_SLACK_SECONDS
+
+        if usable and entry.remaining(now) > REFRESH_MARGIN_SECONDS:
+            self._count("hits")
+            return entry.name
+
+        if digest in self._below_minimum:
+            self._count("below_minimum_requests")
+            return None
+
+        import httpx
+        from google.genai import errors as genai_errors
+
+        if self._failed_until.get(digest, 0.0) > now or not self._maintenance.acquire(blocking=not usable):
+            if usable:
+                self._count("hits")
+                return entry.name
+            return None
+
+        try:
+            entry = self._entries.get(model)
+            if entry is not None and entry.digest == digest and entry.remaining(time.time()) > REFRESH_MARGIN_SECONDS:
+                self._count("hits")
+                return entry.name
+
+            if entry is None or entry.digest != digest:
+                if not self._cacheable(client, model, prefix, digest):
+                    self._count("below_minimum_requests")
+                    return None
+
+            with span("context_cache_maintain", model=model):
+                entry = self._maintain(client, model, prefix, digest, entry)
+            self._entries[model] = entry
+            self._failed_until.pop(digest, None)
+            return entry.name
+
+        except (genai_errors.APIError, httpx.HTTPError):
+            self._failed_until[digest] = time.time() + RETRY_SECONDS
+            self._count("errors")
+            return entry.name if usable else None
+
+        finally:
+            self._maintenance.release()
+
+    def _cacheable(self, client, model: str, prefix: str, digest: str) -> bool:
+        """Whether `prefix` reaches the model's minimum; asked once per prefix."""
+        with span("context_cache_count_tokens", model=model):
+            tokens = client.models.count_tokens(model=model, contents=prefix).total_tokens or 0
+        if tokens >= min_cache_tokens(model):
+            return True
+
+        with self._lock:
+            self._below_minimum[digest] = (model, tokens)
+        return False
+
+    def _maintain(self, client, model: str, prefix: str, digest: str, entry: Optional[_Entry]) -> _Entry:
+        from google.genai import errors as genai_errors
+        from google.genai import types
+
+        if entry is not None and entry.digest == digest:
+            try:
+                cached = client.caches.update(
+                    name=entry.name,
+                    config=types.UpdateCachedContentConfig(ttl=f"{TTL_SECONDS}s"),
+                )
+            except genai_errors.ClientError as e:
+                if e.code != 404:
+                    raise
+            else:
+                self._count("refreshed")
+                return _Entry(digest, entry.name, _expires_at(cached))
+
+        # First use in this process, the template changed, or the cache lapsed:
+        # adopt one another process registered, dropping old-template caches
+        # that are ours or abandoned (the rest may still be in use elsewhere)
+        found: Optional[types.CachedContent] = None
+        now = time.time()
+        for cached in client.caches.list():
+            display_name = cached.display_name or ""
+            if not display_name.startswith(DISPLAY_NAME_PREFIX) or not (cached.model or "").endswith(model.split("/")[-1]):
+                continue
+            if display_name == DISPLAY_NAME_PREFIX + digest and found is None:
+                found = cached
+            elif cached.name in self._created or _abandoned(cached, now):
+                client.caches.delete(name=cached.name)
+                self._created.discard(cached.name)
+                self._count("invalidated")
+
+        if found is not None and _expires_at(found) - time.time() > REFRESH_MARGIN_SECONDS:
+            self._count("reused")
+            return _Entry(digest, found.name, _expires_at(found))
+
+        if found is not None:
+            cached = client.caches.update(
+                name=found.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{TTL_SECONDS}s"),
+            )
+            self._count("refreshed")
+            return _Entry(digest, found.name, _expires_at(cached))
+
+        cached = client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=DISPLAY_NAME_PREFIX + digest,
+                contents=[types.Content(role="user", parts=[types.Part(text=prefix)])],
+                ttl=f"{TTL_SECONDS}s",
+            ),
+        )
+        self._created.add(cached.name)
+        self._count("created")
+        return _Entry(digest, cached.name, _expires_at(cached))
+
+    def invalidate(self, model: str, name: str) -> None:
+        """Forget a cache the API no longer recognises; the next request re-registers it."""
+        entry = self._entries.get(model)
+        if entry is not None and entry.name == name:
+            self._entries.pop(model, None)
+            self._count("invalidated")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": {
+                    model: {"name": e.name, "expires_in_seconds": round(e.remaining(now))}
+                    for model, e in self._entries.items()
+                },
+                # Not a failure: these prefixes are sent in full by design
+                "below_minimum": {
+                    model: {"prefix_tokens": tokens, "min_tokens": min_cache_tokens(model)}
+                    for model, tokens in self._below_minimum.values()
+                },
+            }
+
+
+_context_cache: Optional[ContextCache] = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> Optional[ContextCache]:
+    """None when PLAYBOOK_CONTEXT_CACHE_DISABLED is set."""
+    global _context_cache
+
+    if os.getenv("PLAYBOOK_CONTEXT_CACHE_DISABLED"):
+        return None
+
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                _context_cache = ContextCache()
+    return _context_cache
+
+
+def context_cache_stats() -> Dict[str, Any]:
+    cache = get_context_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
@@ -1,141 +1,244 @@
-from typing import Dict, Any, List
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from core.telemetry import span
+
+
+# -------------------------------------------------
+# Lanes (block type -> swimlane)
+# -------------------------------------------------
+# (lane id, lane title, node class)
+LANES: Dict[str, Tuple[str, str, str]] = {
+    "enrichment": ("Enrichment", "Context Enrichment", "enrich"),
+    "decision": ("Decision", "Decision Point", "decision"),
+    "automation": ("Response", "Automated Response", "response"),
+    "human": ("Human", "Human-in-the-Loop", "human"),
+}
+LANE_ORDER = ("enrichment", "decision", "automation", "human")
+
+# Blocks without a recognised "type" (e.g. the Learning schema) are placed by title
+_TYPE_KEYWORDS = (
+    ("decision", ("?", "decision", "decide", "confirmed", "verdict", "branch", "if ")),
+    ("human", ("analyst", "review", "approv", "escalat", "notify", "manual", "human", "triage")),
+    ("enrichment", ("enrich", "lookup", "look up", "parse", "normaliz", "gather", "collect",
+                    "query", "ingest", "context", "intel", "reputation", "validate")),
+)
+
+NESTED_KEYWORDS = ("nested", "sub-playbook", "subplaybook", "child playbook", "run playbook")
+
+LABEL_MAX_CHARS = 80
+
+STYLES = (
+    "classDef intake fill:#E3F2FD,stroke:#1565C0,stroke-width:2px,rx:6,ry:6;",
+    "classDef enrich fill:#E0F7FA,stroke:#00838F,stroke-width:2px,rx:6,ry:6;",
+    "classDef decision fill:#FFF3E0,stroke:#EF6C00,stroke-width:2px;",
+    "classDef response fill:#FCE4EC,stroke:#C2185B,stroke-width:2px,rx:6,ry:6;",
+    "classDef human fill:#EDE7F6,stroke:#4527A0,stroke-width:2px,rx:6,ry:6;",
+    "classDef closure fill:#E8F5E9,stroke:#2E7D32,stroke-width:2px,rx:6,ry:6;",
+    "classDef nested stroke-dasharray: 5 5,stroke-width:2px,fill:#F5F5F5;",
+)
+
+
+# -------------------------------------------------
+# Label Escaping
+# -------------------------------------------------
+# Mermaid entity codes; labels are always emitted inside double quotes.
+# Backticks / "$" / backslashes are also escaped so a diagram can be
+# embedded in a JavaScript template literal unchanged.
+_ESCAPES = str.maketrans({
+    "#": "#35;",
+    '"': "#quot;",
+    "<": "#lt;",
+    ">": "#gt;",
+    "&": "#amp;",
+    "`": "#96;",
+    "$": "#36;",
+    "\\": "#92;",
+    ";": "#59;",
+    "\n": " ",
+    "\r": " ",
+    "\t": " ",
+})
+
+
+def _shorten(text: Any) -> str:
+    text = " ".join(str(text).split())
+    if len(text) > LABEL_MAX_CHARS:
+        text = text[: LABEL_MAX_CHARS - 1].rstrip() + "…"
+    return text
+
+
+def escape_label(text: Any) -> str:
+    return _shorten(text).translate(_ESCAPES)
+
+
+def block_label(block: Dict[str, Any], index: int) -> str:
+    """Unescaped, length-limited node label for a block."""
+    return _shorten(block.get("title") or block.get("block_name") or block.get("id") or f"Step {index + 1}")
+
+
+def block_lane(block: Dict[str, Any]) -> str:
+    block_type = str(block.get("type", "")).strip().lower()
+    if block_type in LANES:
+        return block_type
+
+    title = str(block.get("title") or block.get("block_name") or "").lower()
+    for lane, keywords in _TYPE_KEYWORDS:
+        if any(k in title for k in keywords):
+            return lane
+    return "automation"
+
+
+def is_nested(block: Dict[str, Any]) -> bool:
+    text = f"{block.get('title', '')} {block.get('description', '')}".lower()
+    return any(k in text for k in NESTED_KEYWORDS)
+
+
+# -------------------------------------------------
+# Memoization (keyed by a hash of the blocks)
+# -------------------------------------------------
+class _DiagramCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            diagram = self._entries.get(key)
+            if diagram is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return diagram
+
+    def put(self, key: str, diagram: str) -> None:
+        with self._lock:
+            self._entries[key] = diagram
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_cache = _DiagramCache()
+
+
+def blocks_hash(blocks: List[Dict[str, Any]]) -> str:
+    payload = json.dumps(blocks, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def diagram_cache_stats() -> Dict[str, int]:
+    return _cache.stats()
 
 
 # -------------------------------------------------
 # SOAR Mermaid Diagram Engine
 # -------------------------------------------------
-def build_soar_mermaid(blocks: List[Dict[str, Any]]) -> str:
+def build_soar_mermaid(blocks: List[Dict[str, Any]], use_cache: bool = True) -> str:
     """
     Builds a SOAR-style Mermaid diagram similar to Splunk SOAR / Cortex XSOAR.
 
-    Guarantees:
-    - Same lanes
-    - Same layout
-    - Same decision diamond
-    - Same colors
-
-    Adds:
-    - Visual rendering for Nested Playbooks (dashed border)
+    - One node per block, in playbook order, placed in the lane for its type
+    - Decision blocks are diamonds: "Yes" continues, "No" goes to closure
+    - Nested playbooks get a dashed border
+    - Linear in the number of blocks; unchanged block lists are memoized
     """
+    with span("diagram_build", blocks=len(blocks)) as s:
+        key = blocks_hash(blocks) if use_cache else None
+        diagram = _cache.get(key) if use_cache else None
+        s.set("cached", diagram is not None)
+
+        if diagram is None:
+            diagram = _build_soar_mermaid(blocks)
+            if use_cache:
+                _cache.put(key, diagram)
+        return diagram
+
+
+def _build_soar_mermaid(blocks: List[Dict[str, Any]]) -> str:
+    lane_nodes: Dict[str, List[str]] = {lane: [] for lane in LANE_ORDER}
+    lane_ids: Dict[str, List[str]] = {lane: [] for lane in LANE_ORDER}
+    edges: List[str] = []
+    nested: List[str] = []
+
+    previous = "A"
+    previous_is_decision = False
+
+    for index, block in enumerate(blocks):
+        if not isinstance(block, dict):
+            continue
+
+        node_id = f"N{index}"
+        lane = block_lane(block)
+        label = escape_label(block_label(block, index))
+
+        if lane == "decision":
+            lane_nodes[lane].append(f'{node_id}{{"{label}"}}')
+        else:
+            lane_nodes[lane].append(f'{node_id}["{label}"]')
+        lane_ids[lane].append(node_id)
+
+        if previous_is_decision:
+            edges.append(f"{previous} -->|Yes| {node_id}")
+            edges.append(f"{previous} -->|No| Z")
+        else:
+            edges.append(f"{previous} --> {node_id}")
+
+        if is_nested(block):
+            nested.append(node_id)
+
+        previous = node_id
+        previous_is_decision = lane == "decision"
+
+    if previous_is_decision:
+        edges.append(f"{previous} -->|Yes| Z")
+        edges.append(f"{previous} -->|No| Z")
+    else:
+        edges.append(f"{previous} --> Z")
+
+    lines: List[str] = [
+        "flowchart LR",
+        "subgraph Intake [Alert Intake]",
+        "direction TB",
+        'A["SIEM Alert Received"]',
+        "end",
+    ]
+
+    for lane in LANE_ORDER:
+        if not lane_nodes[lane]:
+            continue
+        lane_id, lane_title, _ = LANES[lane]
+        lines.append(f"subgraph {lane_id} [{lane_title}]")
+        lines.append("direction TB")
+        lines.extend(lane_nodes[lane])
+        lines.append("end")
+
+    lines += [
+        "subgraph Closure [Incident Closure]",
+        "direction TB",
+        'Z["Update Incident #amp; Close"]',
+        "end",
+    ]
+    lines.extend(edges)
+    lines.extend(STYLES)
 
-    lines: List[str] = []
-
-    # -------------------------------------------------
-    # Base diagram
-    # -------------------------------------------------
-    lines.append("flowchart LR")
-    lines.append("")
-
-    # -------------------------------------------------
-    # Lanes (DO NOT CHANGE STRUCTURE)
-    # -------------------------------------------------
-    lines.append("subgraph Intake [Alert Intake]")
-    lines.append("direction TB")
-    lines.append("A[SIEM Alert Received]")
-    lines.append("end")
-    lines.append("")
-
-    lines.append("subgraph Enrichment [Context Enrichment]")
-    lines.append("direction TB")
-    lines.append("B[Normalize & Parse]")
-    lines.append("C[Asset / User / IP Enrichment]")
-    lines.append("D[Threat Intelligence Lookup]")
-    lines.append("end")
-    lines.append("")
-
-    lines.append("subgraph Decision [Decision Point]")
-    lines.append("direction TB")
-    lines.append("E{Threat Confirmed?}")
-    lines.append("end")
-    lines.append("")
-
-    lines.append("subgraph Response [Automated Response]")
-    lines.append("direction TB")
-    lines.append("F[Automated Containment]")
-    lines.append("G[Block IP / Isolate Host]")
-    lines.append("H[Preserve Evidence]")
-    lines.append("end")
-    lines.append("")
-
-    lines.append("subgraph Human [Human-in-the-Loop]")
-    lines.append("direction TB")
-    lines.append("I[Human Review]")
-    lines.append("J[SOC Analyst Decision]")
-    lines.append("end")
-    lines.append("")
-
-    lines.append("subgraph Closure [Incident Closure]")
-    lines.append("direction TB")
-    lines.append("K[Notify IR Team]")
-    lines.append("L[Update Incident & Close]")
-    lines.append("end")
-    lines.append("")
-
-    # -------------------------------------------------
-    # Main Flow (UNCHANGED)
-    # -------------------------------------------------
-    lines.append("A --> B")
-    lines.append("B --> C")
-    lines.append("C --> D")
-    lines.append("D --> E")
-
-    lines.append("E -->|Yes| F")
-    lines.append("F --> G")
-    lines.append("G --> H")
-    lines.append("H --> K")
-    lines.append("K --> L")
-
-    lines.append("E -->|Uncertain| I")
-    lines.append("I --> J")
-    lines.append("J -->|Escalate| F")
-    lines.append("J -->|Dismiss| L")
-    lines.append("")
-
-    # -------------------------------------------------
-    # Styling (BASE SOAR COLORS)
-    # -------------------------------------------------
-    lines.append("classDef intake fill:#E3F2FD,stroke:#1565C0,stroke-width:2px,rx:6,ry:6;")
-    lines.append("classDef enrich fill:#E0F7FA,stroke:#00838F,stroke-width:2px,rx:6,ry:6;")
-    lines.append("classDef decision fill:#FFF3E0,stroke:#EF6C00,stroke-width:2px;")
-    lines.append("classDef response fill:#FCE4EC,stroke:#C2185B,stroke-width:2px,rx:6,ry:6;")
-    lines.append("classDef human fill:#EDE7F6,stroke:#4527A0,stroke-width:2px,rx:6,ry:6;")
-    lines.append("classDef closure fill:#E8F5E9,stroke:#2E7D32,stroke-width:2px,rx:6,ry:6;")
-
-    # Nested playbook style (ADD ONLY)
-    lines.append(
-        "classDef nested stroke-dasharray: 5 5,stroke-width:2px,fill:#F5F5F5;"
-    )
-    lines.append("")
-
-    # -------------------------------------------------
-    # Base Class Assignment
-    # -------------------------------------------------
     lines.append("class A intake")
-    lines.append("class B,C,D enrich")
-    lines.append("class E decision")
-    lines.append("class F,G,H response")
-    lines.append("class I,J human")
-    lines.append("class K,L closure")
-
-    # -------------------------------------------------
-    # Nested Playbook Detection (VISUAL ONLY)
-    # -------------------------------------------------
-    nested_keywords = ("nested", "sub-playbook", "playbook")
-
-    node_title_map = {
-        "B": "Normalize & Parse",
-        "C": "Asset / User / IP Enrichment",
-        "D": "Threat Intelligence Lookup",
-        "F": "Automated Containment",
-        "G": "Block IP / Isolate Host",
-        "H": "Preserve Evidence",
-        "I": "Human Review",
-        "J": "SOC Analyst Decision",
-    }
-
-    for node_id, title in node_title_map.items():
-        title_lower = title.lower()
-        if any(k in title_lower for k in nested_keywords):
-            lines.append(f"class {node_id} nested")
+    for lane in LANE_ORDER:
+        if lane_ids[lane]:
+            lines.append(f"class {','.join(lane_ids[lane])} {LANES[lane][2]}")
+    lines.append("class Z closure")
+    if nested:
+        lines.append(f"class {','.join(nested)} nested")
 
     return "\n".join(lines)
@@ -0,0 +1,232 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from core.diagram_engine import LANE_ORDER, LANES, block_label, block_lane, blocks_hash, is_nested
+from core.telemetry import record_event, span
+
+
+# -------------------------------------------------
+# Configuration (env)
+# -------------------------------------------------
+# Rendered files live under Streamlit's static folder (next to app.py) so
+# the browser can fetch them directly from /app/static/diagrams/<hash>.<format>
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RENDER_DIR = os.path.join(ROOT, "static", "diagrams")
+RENDER_DIR = os.getenv("PLAYBOOK_DIAGRAM_DIR", DEFAULT_RENDER_DIR)
+MAX_CACHED_FILES = int(os.getenv("PLAYBOOK_DIAGRAM_CACHE_FILES", 500))
+
+# Temp files older than this belong to a render that died mid-write
+TMP_GRACE_SECONDS = 600
+
+# Bump when the Graphviz layout changes so stale files are not served
+RENDER_VERSION = "1"
+
+FORMATS = {"svg": "image/svg+xml", "png": "image/png"}
+
+# Same palette as the Mermaid classDefs in core.diagram_engine
+_NODE_STYLES = {
+    "intake": {"fillcolor": "#E3F2FD", "color": "#1565C0"},
+    "enrich": {"fillcolor": "#E0F7FA", "color": "#00838F"},
+    "decision": {"fillcolor": "#FFF3E0", "color": "#EF6C00", "shape": "diamond"},
+    "response": {"fillcolor": "#FCE4EC", "color": "#C2185B"},
+    "human": {"fillcolor": "#EDE7F6", "color": "#4527A0"},
+    "closure": {"fillcolor": "#E8F5E9", "color": "#2E7D32"},
+}
+
+
+# -------------------------------------------------
+# Graphviz Source
+# -------------------------------------------------
+def build_soar_graphviz(blocks: List[Dict[str, Any]]):
+    """
+    Graphviz equivalent of build_soar_mermaid: same lanes, order and
+    decision edges, laid out left to right.
+    """
+    import graphviz
+
+    dot = graphviz.Digraph("soar_playbook", format="svg")
+    dot.attr(rankdir="LR", fontname="Helvetica", compound="true", newrank="true")
+    dot.attr("node", shape="box", style="rounded,filled", fontname="Helvetica", fontsize="11", penwidth="2")
+    dot.attr("edge", fontname="Helvetica", fontsize="10")
+
+    lanes: Dict[str, List[tuple]] = {lane: [] for lane in LANE_ORDER}
+    edges: List[tuple] = []
+
+    previous, previous_is_decision = "A", False
+    for index, block in enumerate(blocks):
+        if not isinstance(block, dict):
+            continue
+
+        node_id = f"N{index}"
+        lane = block_lane(block)
+        attrs = dict(_NODE_STYLES[LANES[lane][2]])
+        if is_nested(block):
+            attrs["style"] = "rounded,filled,dashed"
+        lanes[lane].append((node_id, graphviz.escape(block_label(block, index)), attrs))
+
+        if previous_is_decision:
+            edges += [(previous, node_id, "Yes"), (previous, "Z", "No")]
+        else:
+            edges.append((previous, node_id, None))
+        previous, previous_is_decision = node_id, lane == "decision"
+
+    edges += [(previous, "Z", "Yes"), (previous, "Z", "No")] if previous_is_decision else [(previous, "Z", None)]
+
+    with dot.subgraph(name="cluster_intake") as lane:
+        lane.attr(label="Alert Intake", style="rounded", color="#B0BEC5")
+        lane.node("A", "SIEM Alert Received", **_NODE_STYLES["intake"])
+
+    for name in LANE_ORDER:
+        if not lanes[name]:
+            continue
+        with dot.subgraph(name=f"cluster_{name}") as lane:
+            lane.attr(label=LANES[name][1], style="rounded", color="#B0BEC5")
+            for node_id, label, attrs in lanes[name]:
+                lane.node(node_id, label, **attrs)
+
+    with dot.subgraph(name="cluster_closure") as lane:
+        lane.attr(label="Incident Closure", style="rounded", color="#B0BEC5")
+        lane.node("Z", "Update Incident & Close", **_NODE_STYLES["closure"])
+
+    for tail, head, label in edges:
+        dot.edge(tail, head, label=label)
+
+    return dot
+
+
+# -------------------------------------------------
+# Render Cache (files keyed by diagram hash)
+# -------------------------------------------------
+_lock = threading.Lock()
+# None until the first render attempt; False once we know `dot` is missing
+_dot_available: Optional[bool] = None
+_counters = {"hits": 0, "renders": 0, "unavailable": 0}
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+    record_event(f"diagram_render_{name}")
+
+
+def diagram_key(blocks: List[Dict[str, Any]]) -> str:
+    return f"{blocks_hash(blocks)[:32]}_v{RENDER_VERSION}"
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        # Removed by a concurrent prune
+        return None
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _read_hit(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        # Pruning goes by mtime, so a hit marks the file recently used
+        os.utime(path)
+    except OSError:
+        # Not rendered yet, or pruned just now
+        return None
+    return data
+
+
+def _prune(directory: str) -> None:
+    now = time.time()
+    files = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        mtime = _mtime(path)
+        if mtime is None:
+            continue
+        # A .tmp file is another render still being written, unless it was orphaned long ago
+        if name.endswith(".tmp"):
+            if now - mtime > TMP_GRACE_SECONDS:
+                _remove(path)
+            continue
+        files.append((mtime, path))
+
+    if len(files) <= MAX_CACHED_FILES:
+        return
+    files.sort()
+    for _, path in files[: len(files) - MAX_CACHED_FILES]:
+        _remove(path)
+
+
+def diagram_path(blocks: List[Dict[str, Any]], fmt: str = "svg") -> str:
+    """Where render_diagram() keeps this diagram (it may since have been pruned)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported diagram format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+    return os.path.join(RENDER_DIR, f"{diagram_key(blocks)}.{fmt}")
+
+
+def render_diagram(blocks: List[Dict[str, Any]], fmt: str = "svg") -> Optional[bytes]:
+    """
+    The rendered diagram's bytes, rendering it only on a cache miss.
+    Returns None when Graphviz (the Python package or the `dot` binary)
+    is not installed; callers fall back to showing the Mermaid source.
+    """
+    global _dot_available
+
+    path = diagram_path(blocks, fmt)
+    data = _read_hit(path)
+    if data is not None:
+        _count("hits")
+        return data
+
+    if _dot_available is False:
+        _count("unavailable")
+        return None
+
+    try:
+        import graphviz
+    except ImportError:
+        _dot_available = False
+        _count("unavailable")
+        return None
+
+    with span("diagram_render", blocks=len(blocks), format=fmt):
+        try:
+            data = build_soar_graphviz(blocks).pipe(format=fmt)
+        except graphviz.ExecutableNotFound:
+            _dot_available = False
+            _count("unavailable")
+            return None
+        _dot_available = True
+
+    os.makedirs(RENDER_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    _count("renders")
+    _prune(RENDER_DIR)
+    return data
+
+
+def static_url(path: str) -> Optional[str]:
+    """
+    Browser URL for a rendered file when it sits under Streamlit's static
+    folder (server.enableStaticServing), else None.
+    """
+    parts = os.path.relpath(path, ROOT).split(os.sep)
+    if parts[0] != "static":
+        return None
+    return "app/" + "/".join(parts)
+
+
+def render_stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_counters, "dot_available": _dot_available, "directory": RENDER_DIR}
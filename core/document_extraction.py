@@ -0,0 +1,230 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+
+# -------------------------------------------------
+# Limits (overridable via env)
+# -------------------------------------------------
+DEFAULT_MAX_PAGES = int(os.getenv("IRP_MAX_PAGES", 400))
+DEFAULT_MAX_CHARS = int(os.getenv("IRP_MAX_CHARS", 400_000))
+
+# PDFs at or below this size are extracted inline; larger ones fan out
+PAGES_PER_TASK = 25
+PARALLEL_MIN_PAGES = 2 * PAGES_PER_TASK
+
+CACHE_MAX_CHARS = 8_000_000
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _read_bytes(source: Union[bytes, BinaryIO]) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# -------------------------------------------------
+# Result Cache (keyed by content hash)
+# -------------------------------------------------
+class _ExtractionCache:
+    """
+    In-process LRU of extraction results, bounded by total characters.
+    Reruns with the same uploaded file never re-parse it.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Tuple, result: Dict[str, Any]) -> None:
+        size = len(result["text"])
+        if size > self.max_chars:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._chars -= len(self._entries.pop(key)["text"])
+            self._entries[key] = result
+            self._chars += size
+
+            while self._chars > self.max_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= len(evicted["text"])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "chars": self._chars, "hits": self.hits, "misses": self.misses}
+
+
+_cache = _ExtractionCache(CACHE_MAX_CHARS)
+
+
+def extraction_cache_stats() -> Dict[str, int]:
+    return _cache.stats()
+
+
+# -------------------------------------------------
+# PDF: parallel page-range extraction
+# -------------------------------------------------
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+    return _pool
+
+
+def _extract_page_range(data: bytes, start: int, stop: int) -> List[str]:
+    # Runs in a worker process; must stay a top-level function
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages(
+    data: bytes,
+    max_pages: Optional[int] = None,
+    parallel: bool = True
+) -> Iterator[Tuple[int, int, int, str]]:
+    """
+    Yields (page_index, page_count, total_pages, text) in page order as pages
+    are extracted; page_count is what will be extracted (at most max_pages).
+
+    Large documents are split into page ranges handled by a process pool;
+    results are still yielded in order, as soon as each range finishes.
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    count = total if max_pages is None else min(total, max_pages)
+
+    # Fanning out only pays off with spare cores and enough pages
+    if not parallel or count < PARALLEL_MIN_PAGES or (os.cpu_count() or 1) < 2:
+        for i in range(count):
+            yield i, count, total, reader.pages[i].extract_text() or ""
+        return
+
+    pool = _get_pool()
+    futures = [
+        (start, pool.submit(_extract_page_range, data, start, min(start + PAGES_PER_TASK, count)))
+        for start in range(0, count, PAGES_PER_TASK)
+    ]
+
+    try:
+        for start, future in futures:
+            for offset, text in enumerate(future.result()):
+                yield start + offset, count, total, text
+    finally:
+        for _, future in futures:
+            future.cancel()
+
+
+def extract_pdf(
+    source: Union[bytes, BinaryIO],
+    max_pages: int = DEFAULT_MAX_PAGES,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    progress: Optional[ProgressCallback] = None,
+    use_cache: bool = True
+) -> Dict[str, Any]:
+    """
+    Returns {"text", "pages", "chars", "truncated", "cached"} for a PDF.
+    """
+    data = _read_bytes(source)
+    key = ("pdf", content_hash(data), max_pages, max_chars)
+
+    cached = _cache.get(key) if use_cache else None
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    parts: List[str] = []
+    chars = 0
+    pages = 0
+    truncated = False
+
+    for index, count, total, text in iter_pdf_pages(data, max_pages=max_pages):
+        pages = index + 1
+        # Pages past max_pages are never read
+        truncated = truncated or total > count
+        if progress is not None:
+            progress(pages, count)
+        if not text:
+            continue
+
+        # The "\n" joiner only counts between pages, so chars == len(text) below
+        room = max_chars - chars - (1 if parts else 0)
+        if len(text) > room:
+            if room > 0:
+                parts.append(text[:room])
+                chars = max_chars
+            truncated = True
+            break
+
+        chars += len(text) + (1 if parts else 0)
+        parts.append(text)
+
+    result = {"text": "\n".join(parts), "pages": pages, "chars": chars, "truncated": truncated}
+    if use_cache:
+        _cache.put(key, result)
+    return {**result, "cached": False}
+
+
+# -------------------------------------------------
+# DOCX
+# -------------------------------------------------
+def extract_docx(
+    source: Union[bytes, BinaryIO],
+    max_chars: int = DEFAULT_MAX_CHARS,
+    use_cache: bool = True
+) -> Dict[str, Any]:
+    data = _read_bytes(source)
+    key = ("docx", content_hash(data), max_chars)
+
+    cached = _cache.get(key) if use_cache else None
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    from docx import Document
+
+    document = Document(io.BytesIO(data))
+    text = "\n".join(p.text for p in document.paragraphs if p.text.strip())
+
+    truncated = len(text) > max_chars
+    if truncated:
+        text = text[:max_chars]
+
+    result = {"text": text, "pages": 0, "chars": len(text), "truncated": truncated}
+    if use_cache:
+        _cache.put(key, result)
+    return {**result, "cached": False}
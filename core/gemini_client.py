@@ -0,0 +1,203 @@
+import os
+import atexit
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Dict, Any, Optional
+
+# google.genai and httpx take most of a cold start to import: they are
+# loaded when the first client is built, not when this module is imported
+if TYPE_CHECKING:
+    import httpx
+    from google import genai
+    from google.genai import types
+
+
+# -----------------------------
+# Pool Defaults (overridable via env)
+# -----------------------------
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+
+
+def _api_key() -> str:
+    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY / GOOGLE_API_KEY not set")
+    return api_key
+
+
+def _http_options(**kwargs) -> "types.HttpOptions":
+    from google.genai import types
+
+    # GEMINI_BASE_URL points the SDK at a stand-in (e.g. loadtest/mock_gemini_server.py)
+    base_url = os.getenv("GEMINI_BASE_URL")
+    if base_url:
+        kwargs["base_url"] = base_url
+    return types.HttpOptions(**kwargs)
+
+
+def _pool_limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+        max_keepalive_connections=int(os.getenv("GEMINI_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE)),
+        keepalive_expiry=float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY)),
+    )
+
+
+def _pool_connections(http_client: Optional[Any]) -> Dict[str, int]:
+    """
+    Best-effort view of the underlying httpcore pool.
+    """
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+
+    idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+    return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+# -----------------------------
+# Process-wide Client Holder
+# -----------------------------
+class GeminiClientHolder:
+    """
+    Owns one pooled, keep-alive Gemini client per process.
+
+    - get():        shared sync client (thread-safe, built once)
+    - get_async():  async client bound to the running event loop
+    - stats():      request counters and connection pool usage
+    - close():      releases sockets (registered with atexit)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        self._client: Optional["genai.Client"] = None
+        self._http_client: Optional["httpx.Client"] = None
+
+        self._async_client: Optional["genai.Client"] = None
+        self._async_http_client: Optional["httpx.AsyncClient"] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._counters = {"clients_created": 0, "sync_requests": 0, "async_requests": 0}
+
+    # -------------------------
+    # Counters
+    # -------------------------
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _on_sync_request(self, request: "httpx.Request") -> None:
+        self._count("sync_requests")
+
+    async def _on_async_request(self, request: "httpx.Request") -> None:
+        self._count("async_requests")
+
+    # -------------------------
+    # Clients
+    # -------------------------
+    def get(self) -> "genai.Client":
+        if self._client is not None:
+            return self._client
+
+        import httpx
+        from google import genai
+
+        with self._lock:
+            if self._client is None:
+                self._http_client = httpx.Client(
+                    limits=_pool_limits(),
+                    event_hooks={"request": [self._on_sync_request]},
+                )
+                self._client = genai.Client(
+                    api_key=_api_key(),
+                    http_options=_http_options(httpx_client=self._http_client),
+                )
+                self._counters["clients_created"] += 1
+
+        return self._client
+
+    def get_async(self):
+        """
+        Returns `client.aio` for the current event loop. Async sockets are
+        tied to their loop, so a new loop gets a fresh pool.
+        """
+        import httpx
+        from google import genai
+
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            if self._async_client is None or self._async_loop is not loop:
+                self._async_http_client = httpx.AsyncClient(
+                    limits=_pool_limits(),
+                    event_hooks={"request": [self._on_async_request]},
+                )
+                self._async_client = genai.Client(
+                    api_key=_api_key(),
+                    http_options=_http_options(httpx_async_client=self._async_http_client),
+                )
+                self._async_loop = loop
+                self._counters["clients_created"] += 1
+
+            return self._async_client.aio
+
+    # -------------------------
+    # Shutdown
+    # -------------------------
+    def close(self) -> None:
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._client = None
+            self._http_client = None
+
+            # Async sockets can only be closed from a live loop; otherwise drop them
+            if self._async_loop is not None and not self._async_loop.is_closed():
+                if not self._async_loop.is_running():
+                    self._async_loop.run_until_complete(self._async_http_client.aclose())
+            self._async_client = None
+            self._async_http_client = None
+            self._async_loop = None
+
+    async def aclose(self) -> None:
+        with self._lock:
+            http_client = self._async_http_client
+            self._async_client = None
+            self._async_http_client = None
+            self._async_loop = None
+
+        if http_client is not None:
+            await http_client.aclose()
+
+    # -------------------------
+    # Stats
+    # -------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+
+        return {
+            **counters,
+            "sync_pool": _pool_connections(self._http_client),
+            "async_pool": _pool_connections(self._async_http_client),
+        }
+
+
+_holder = GeminiClientHolder()
+atexit.register(_holder.close)
+
+
+def get_client_holder() -> GeminiClientHolder:
+    return _holder
+
+
+def get_gemini_client() -> "genai.Client":
+    return _holder.get()
+
+
+def get_async_gemini_client():
+    return _holder.get_async()
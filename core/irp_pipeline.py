@@ -0,0 +1,311 @@
+import os
+import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.llm_backends import get_backend
+from core.playbook_engine import (
+    UPSTREAM_BREAKER,
+    generate_playbook,
+    generate_playbook_stream,
+)
+from core.resilience import (
+    Deadline,
+    MalformedResponseError,
+    call_with_retries,
+    default_deadline_seconds,
+    default_retry_policy,
+)
+from core.response_cache import get_response_cache, make_cache_key
+from core.telemetry import record_size, span
+
+
+# -------------------------------------------------
+# Limits (overridable via env)
+# -------------------------------------------------
+# IRPs at or below this size go to the model in a single prompt
+DIRECT_MAX_CHARS = int(os.getenv("IRP_DIRECT_MAX_CHARS", 24_000))
+CHUNK_MAX_CHARS = int(os.getenv("IRP_CHUNK_MAX_CHARS", 12_000))
+MAP_CONCURRENCY = int(os.getenv("IRP_MAP_CONCURRENCY", 8))
+
+# Condensed notes larger than this are mapped again before the reduce call
+REDUCE_MAX_CHARS = DIRECT_MAX_CHARS
+MAX_MAP_ROUNDS = 3
+
+# Raw excerpt kept for a chunk whose map call failed, so its content is not lost
+MAP_FALLBACK_CHARS = 2_000
+
+IRP_HEADER = "INCIDENT RESPONSE PLAN (IRP):\n"
+
+MapProgress = Dict[str, Any]
+
+
+# -------------------------------------------------
+# Section-aware Chunking
+# -------------------------------------------------
+_HEADING = re.compile(
+    r"^\s*(?:"
+    r"#{1,6}\s+\S"                                        # markdown
+    r"|(?:section|chapter|phase|appendix|step)\s+[\w.]+"  # "Phase 2: Containment"
+    r"|\d+(?:\.\d+)*[.)]?\s+[A-Z]"                        # "3.1 Eradication"
+    r")",
+    re.IGNORECASE,
+)
+_CAPS_HEADING = re.compile(r"^\s*[A-Z][A-Z0-9 &/,:()\-]{3,80}\s*$")
+
+
+def _is_heading(line: str) -> bool:
+    # Sentences ("1. Isolate the host.") are list items, not headings
+    stripped = line.strip()
+    if not stripped or len(stripped) > 120 or stripped.endswith("."):
+        return False
+    return bool(_HEADING.match(line) or _CAPS_HEADING.match(line))
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """
+    Splits IRP text at headings. Returns [(title, body)], where body
+    includes the heading line itself.
+    """
+    sections: List[Tuple[str, str]] = []
+    title = "Preamble"
+    lines: List[str] = []
+
+    for line in text.splitlines():
+        if _is_heading(line):
+            if any(l.strip() for l in lines):
+                sections.append((title, "\n".join(lines).strip()))
+            lines = []
+            title = line.strip().lstrip("#").strip()
+        lines.append(line)
+
+    if any(l.strip() for l in lines):
+        sections.append((title, "\n".join(lines).strip()))
+
+    return sections
+
+
+def _split_oversized(body: str, max_chars: int) -> List[str]:
+    # Paragraphs first, then lines, then a hard cut for pathological input
+    pieces: List[str] = []
+    current = ""
+
+    for paragraph in re.split(r"\n\s*\n", body):
+        units = [paragraph] if len(paragraph) <= max_chars else paragraph.splitlines()
+        for unit in units:
+            while len(unit) > max_chars:
+                pieces.append(unit[:max_chars])
+                unit = unit[max_chars:]
+            if current and len(current) + len(unit) + 2 > max_chars:
+                pieces.append(current)
+                current = ""
+            current = f"{current}\n\n{unit}" if current else unit
+
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_irp(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[Dict[str, str]]:
+    """
+    Packs consecutive sections into chunks of at most `max_chars`,
+    never splitting a section unless it alone exceeds the limit.
+    Returns [{"title", "text"}] in document order.
+    """
+    chunks: List[Dict[str, str]] = []
+    titles: List[str] = []
+    current = ""
+
+    def flush() -> None:
+        nonlocal current, titles
+        if current:
+            chunks.append({"title": " / ".join(titles[:3]) + (" / ..." if len(titles) > 3 else ""), "text": current})
+        current, titles = "", []
+
+    for title, body in split_sections(text):
+        if len(body) > max_chars:
+            flush()
+            for i, piece in enumerate(_split_oversized(body, max_chars)):
+                chunks.append({"title": title if i == 0 else f"{title} (cont. {i})", "text": piece})
+            continue
+
+        if current and len(current) + len(body) + 2 > max_chars:
+            flush()
+        current = f"{current}\n\n{body}" if current else body
+        titles.append(title)
+
+    flush()
+    return chunks
+
+
+# -------------------------------------------------
+# Map: extract response steps per chunk
+# -------------------------------------------------
+def build_map_prompt(chunk_text: str, title: str, index: int, total: int) -> str:
+    return f"""
+You are a SOC incident response analyst condensing an Incident Response Plan (IRP)
+so a SOAR architect can turn it into an automation playbook.
+
+From the IRP excerpt below (part {index + 1} of {total}, section: {title}), extract ONLY:
+- Concrete response actions (detection, triage, enrichment, containment, eradication, recovery)
+- Decision points and the criteria that drive them
+- Escalation paths, owners and SOC roles
+- Named tools, systems and integrations
+- SLAs, time limits and notification requirements
+
+Rules:
+- One fact per line, each line starting with "- "
+- Keep the IRP's terminology, system names and thresholds verbatim
+- Do not invent anything that is not in the excerpt
+- If the excerpt contains nothing operational, output exactly: NONE
+
+IRP Excerpt:
+{chunk_text}
+""".strip()
+
+
+def _map_chunk(chunk: Dict[str, str], index: int, total: int) -> str:
+    prompt = build_map_prompt(chunk["text"], chunk["title"], index, total)
+    record_size("irp_map_prompt", len(prompt))
+
+    cache = get_response_cache()
+    backend = get_backend()
+    cache_key = make_cache_key(prompt, backend.model, "irp-map", "")
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached["notes"]
+
+    def attempt(timeout_ms: int) -> str:
+        with span("irp_map_call", backend=backend.name, chunk=index, chars=len(chunk["text"])):
+            text = backend.generate(prompt, timeout_ms)
+        if not text.strip():
+            raise MalformedResponseError("Empty response from model")
+        return text.strip()
+
+    notes = call_with_retries(
+        attempt,
+        policy=default_retry_policy(),
+        deadline=Deadline(default_deadline_seconds()),
+        breaker=UPSTREAM_BREAKER,
+    )
+    record_size("irp_map_response", len(notes))
+
+    if cache is not None:
+        cache.set(cache_key, {"notes": notes})
+    return notes
+
+
+def iter_map(chunks: List[Dict[str, str]], concurrency: int = MAP_CONCURRENCY) -> Iterator[Tuple[int, Optional[str], Optional[Exception]]]:
+    """
+    Runs the map step over all chunks concurrently and yields
+    (chunk_index, notes, error) as each one finishes.
+    """
+    total = len(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, total)), thread_name_prefix="irp-map") as pool:
+        # Each worker runs in a copy of the caller's context so its spans join the request trace
+        futures = {
+            pool.submit(contextvars.copy_context().run, _map_chunk, chunk, i, total): i
+            for i, chunk in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], (None if error else future.result()), error
+
+
+def _condense(chunks: List[Dict[str, str]], notes: List[Optional[str]]) -> str:
+    parts = []
+    for chunk, text in zip(chunks, notes):
+        if text is None:
+            # Map call failed: keep a raw excerpt rather than dropping the section
+            text = chunk["text"][:MAP_FALLBACK_CHARS]
+        elif text.strip().upper() == "NONE":
+            continue
+        parts.append(f"### {chunk['title']}\n{text}")
+    return "\n\n".join(parts)
+
+
+def iter_condense(irp_text: str) -> Iterator[MapProgress]:
+    """
+    Map stage of the pipeline. Yields
+    - {"event": "map_progress", "round": int, "done": int, "total": int, "failed": int}
+    - {"event": "condensed", "text": str, "chunks": int}   (always last)
+    """
+    text = irp_text
+    total_chunks = 0
+
+    for round_no in range(1, MAX_MAP_ROUNDS + 1):
+        chunks = chunk_irp(text)
+        total_chunks += len(chunks)
+        notes: List[Optional[str]] = [None] * len(chunks)
+        failed = 0
+        first_error: Optional[Exception] = None
+
+        with span("irp_map", round=round_no, chunks=len(chunks), chars=len(text)):
+            for done, (index, result, error) in enumerate(iter_map(chunks), start=1):
+                notes[index] = result
+                if error is not None:
+                    failed += 1
+                    first_error = first_error or error
+                yield {"event": "map_progress", "round": round_no, "done": done, "total": len(chunks), "failed": failed}
+
+        if failed == len(chunks):
+            raise first_error if isinstance(first_error, RuntimeError) else RuntimeError(f"Model request failed: {first_error}")
+
+        text = _condense(chunks, notes)
+        if len(text) <= REDUCE_MAX_CHARS:
+            break
+
+    record_size("irp_condensed", len(text))
+    yield {"event": "condensed", "text": text, "chunks": total_chunks}
+
+
+# -------------------------------------------------
+# Reduce: build the playbook from condensed notes
+# -------------------------------------------------
+def _reduce_input(condensed: str, chunks: int) -> str:
+    return (
+        f"INCIDENT RESPONSE PLAN (IRP) - condensed from {chunks} sections.\n"
+        "Each section lists the response actions, decisions, roles and tools it defines:\n\n"
+        f"{condensed}"
+    )
+
+
+def generate_irp_playbook_stream(irp_text: str, mode: str, depth: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming playbook generation for an IRP of any size.
+
+    Small IRPs are sent as a single prompt. Larger ones are split into
+    section-aware chunks whose response steps are extracted concurrently
+    (map), then one reduce call builds the playbook from the condensed
+    notes, so latency tracks the longest chunk rather than the document.
+
+    Emits the map events of iter_condense followed by the events of
+    generate_playbook_stream.
+    """
+    if len(irp_text) <= DIRECT_MAX_CHARS:
+        yield from generate_playbook_stream(IRP_HEADER + irp_text, mode, depth)
+        return
+
+    condensed = None
+    for event in iter_condense(irp_text):
+        if event["event"] == "condensed":
+            condensed = event
+        yield event
+
+    with span("irp_reduce", chars=len(condensed["text"])):
+        yield from generate_playbook_stream(_reduce_input(condensed["text"], condensed["chunks"]), mode, depth)
+
+
+def generate_irp_playbook(irp_text: str, mode: str, depth: str) -> Dict[str, Any]:
+    if len(irp_text) <= DIRECT_MAX_CHARS:
+        return generate_playbook(IRP_HEADER + irp_text, mode, depth)
+
+    condensed = None
+    for event in iter_condense(irp_text):
+        if event["event"] == "condensed":
+            condensed = event
+
+    with span("irp_reduce", chars=len(condensed["text"])):
+        return generate_playbook(_reduce_input(condensed["text"], condensed["chunks"]), mode, depth)
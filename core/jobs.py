@@ -0,0 +1,258 @@
+"""
+In-process job queue for playbook generation.
+
+Streamlit pages submit a generation and poll it instead of holding the
+script thread for the whole model call:
+
+    job_id = get_job_queue().submit(user, "deployment", generate_playbook_stream, alert_text=...)
+    get_job_queue().get(job_id)  # {"status", "summary", "blocks", "progress", "result", "error", ...}
+
+- A fixed pool of workers caps concurrent upstream generations
+- Admission control: a bounded queue and a per-user limit on open jobs
+- Fairness: workers take the next job round-robin across users, so one
+  user's burst cannot starve everyone else
+- Finished jobs are kept for a while so results survive reruns and
+  reconnects (the page keeps the job id in the URL)
+"""
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from core.telemetry import record_duration, record_event, trace
+
+
+# -------------------------------------------------
+# Configuration (env)
+# -------------------------------------------------
+WORKERS = int(os.getenv("PLAYBOOK_JOB_WORKERS", 4))
+QUEUE_MAX = int(os.getenv("PLAYBOOK_JOB_QUEUE_MAX", 100))
+PER_USER_MAX = int(os.getenv("PLAYBOOK_JOB_PER_USER", 2))
+RETAIN_SECONDS = float(os.getenv("PLAYBOOK_JOB_RETAIN_SECONDS", 3600))
+RETAIN_MAX = int(os.getenv("PLAYBOOK_JOB_RETAIN_MAX", 500))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobRejected(RuntimeError):
+    """Admission control turned the job away (queue full or per-user limit reached)."""
+
+
+# -------------------------------------------------
+# Job
+# -------------------------------------------------
+class Job:
+    def __init__(self, user: str, kind: str, fn: Callable[..., Iterator[Dict[str, Any]]], kwargs: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.kind = kind
+        self.fn = fn
+        self.kwargs = kwargs
+
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        # Progress, mirrored from the generation events
+        self.summary: Optional[str] = None
+        self.blocks: List[Dict[str, Any]] = []
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        kind = event["event"]
+        if kind == "map_progress":
+            self.progress = {"stage": "condensing", "done": event["done"], "total": event["total"]}
+        elif kind == "condensed":
+            self.progress = {"stage": "condensed", "chunks": event["chunks"], "chars": len(event["text"])}
+        elif kind == "field" and event["name"] == "summary":
+            self.summary = event["value"]
+        elif kind == "block":
+            self.blocks.append(event["block"])
+        elif kind == "complete":
+            self.result = event["playbook"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "summary": self.summary,
+            "blocks": list(self.blocks),
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# -------------------------------------------------
+# Queue
+# -------------------------------------------------
+class JobQueue:
+    def __init__(self, workers: int = WORKERS, queue_max: int = QUEUE_MAX, per_user_max: int = PER_USER_MAX):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.per_user_max = per_user_max
+
+        self._cond = threading.Condition()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        # Pending jobs per user, and the users with pending work in serving order
+        self._pending: Dict[str, Deque[Job]] = {}
+        self._rotation: Deque[str] = deque()
+        self._open_per_user: Dict[str, int] = {}
+        self._queued = 0
+        self._running = 0
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._threads: List[threading.Thread] = []
+
+    def _count(self, name: str) -> None:
+        self._counters[name] += 1
+        record_event(f"job_{name}")
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"playbook-job-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, user: str, kind: str, fn: Callable[..., Iterator[Dict[str, Any]]], **kwargs: Any) -> str:
+        """
+        Queues fn(**kwargs), a generation event stream, and returns the job
+        id. Raises JobRejected when the queue is full or the user already
+        has per_user_max jobs queued or running.
+        """
+        with self._cond:
+            self._prune()
+
+            if self._open_per_user.get(user, 0) >= self.per_user_max:
+                self._count("rejected")
+                raise JobRejected(f"You already have {self.per_user_max} generations in progress")
+            if self._queued >= self.queue_max:
+                self._count("rejected")
+                raise JobRejected("Too many generations are queued; try again shortly")
+
+            job = Job(user, kind, fn, kwargs)
+            self._jobs[job.id] = job
+            self._open_per_user[user] = self._open_per_user.get(user, 0) + 1
+            if user not in self._pending:
+                self._pending[user] = deque()
+                self._rotation.append(user)
+            self._pending[user].append(job)
+            self._queued += 1
+            self._count("submitted")
+
+            self._start_workers()
+            self._cond.notify()
+            return job.id
+
+    def _next_job(self) -> Job:
+        with self._cond:
+            while not self._rotation:
+                self._cond.wait()
+
+            # Round-robin: one job from the user at the front, who then goes to the back
+            user = self._rotation.popleft()
+            pending = self._pending[user]
+            job = pending.popleft()
+            if pending:
+                self._rotation.append(user)
+            else:
+                del self._pending[user]
+
+            self._queued -= 1
+            self._running += 1
+            job.status = RUNNING
+            job.started_at = time.time()
+            return job
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            record_duration("job_queue_wait", job.started_at - job.created_at)
+
+            error: Optional[str] = None
+            try:
+                with trace(f"{job.kind}_request", user=job.user):
+                    for event in job.fn(**job.kwargs):
+                        with self._cond:
+                            job.apply(event)
+                if job.result is None:
+                    error = "Generation ended without a playbook"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+            with self._cond:
+                job.finished_at = time.time()
+                job.status = FAILED if error else DONE
+                job.error = error
+                job.fn = job.kwargs = None
+                self._running -= 1
+                self._open_per_user[job.user] -= 1
+                if not self._open_per_user[job.user]:
+                    del self._open_per_user[job.user]
+                self._count("failed" if error else "completed")
+
+    def _prune(self) -> None:
+        """Drops finished jobs past their retention (caller holds the lock)."""
+        cutoff = time.time() - RETAIN_SECONDS
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        excess = len(finished) - RETAIN_MAX
+        for job in finished:
+            if job.finished_at < cutoff or excess > 0:
+                del self._jobs[job.id]
+                excess -= 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of the job, or None if unknown / expired. Queued jobs include their position."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+
+            snapshot = job.snapshot()
+            if job.status == QUEUED:
+                snapshot["position"] = self._position(job)
+            return snapshot
+
+    def _position(self, job: Job) -> int:
+        # Jobs served before this one: everything ahead of it in its user's
+        # deque, plus up to that many from each other user in rotation
+        ahead = self._pending[job.user].index(job)
+        return 1 + ahead + sum(
+            min(len(self._pending[user]), ahead + (self._rotation.index(user) < self._rotation.index(job.user)))
+            for user in self._rotation if user != job.user
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._counters,
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": self._running,
+                "users_waiting": len(self._rotation),
+                "retained": len(self._jobs),
+            }
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """One queue per process, shared by every Streamlit session."""
+    global _job_queue
+
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,362 @@
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# -----------------------------
+# Errors
+# -----------------------------
+class JSONExtractionError(ValueError):
+    """
+    Raised when no usable JSON value could be recovered.
+
+    `offset` is the UTF-8 byte offset into the full input where
+    parsing failed (or where the unterminated value started).
+    """
+
+    def __init__(self, message: str, offset: Optional[int] = None):
+        self.reason = message
+        self.offset = offset
+        if offset is not None:
+            message = f"{message} (at byte offset {offset})"
+        super().__init__(message)
+
+
+# -----------------------------
+# Single-pass Streaming Extractor
+# -----------------------------
+class StreamingJSONExtractor:
+    """
+    Recovers top-level JSON objects / arrays embedded in model output.
+
+    Scans every character exactly once, tracking bracket depth and
+    string / escape state, so prose before or after the JSON, ```json
+    fences and trailing text never cause backtracking. Text can be fed
+    in arbitrary chunks (e.g. as tokens stream in).
+    """
+
+    def __init__(self, allow_arrays: bool = True):
+        self.allow_arrays = allow_arrays
+        self.values: List[Any] = []
+        self.last_error: Optional[JSONExtractionError] = None
+
+        # Only the text of the value currently being scanned is retained, as
+        # a list of chunk slices joined once the value closes: appending to
+        # one string would copy it on every chunk
+        self._parts: List[str] = []
+        self._bytes = 0                     # bytes fed before the current chunk
+        self._start: Optional[int] = None   # absolute byte offset of the open value
+
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    # -------------------------
+    # Scanning
+    # -------------------------
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Consumes a chunk and returns the values completed by it.
+        """
+        completed: List[Any] = []
+
+        i = 0
+        end = len(chunk)
+        # Where the open value's text begins in this chunk
+        segment = 0 if self._start is not None else None
+        openers = "{[" if self.allow_arrays else "{"
+
+        # Jump between structural characters instead of stepping per char
+        while i < end:
+            if self._escape:
+                self._escape = False
+                i += 1
+                continue
+
+            match = _STRUCTURAL.search(chunk, i)
+            if match is None:
+                break
+
+            i = match.start()
+            ch = chunk[i]
+
+            if self._depth == 0:
+                if ch in openers:
+                    self._start = self._bytes + len(chunk[:i].encode("utf-8"))
+                    self._depth = 1
+                    segment = i
+            elif self._in_string:
+                if ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(chunk[segment:i + 1])
+                    value = self._decode("".join(self._parts))
+                    if value is not _INVALID:
+                        completed.append(value)
+                    self._parts = []
+                    self._start = None
+                    segment = None
+
+            i += 1
+
+        # Text outside any value is dropped as soon as it is scanned
+        if segment is not None:
+            self._parts.append(chunk[segment:])
+        self._bytes += len(chunk.encode("utf-8"))
+
+        self.values.extend(completed)
+        return completed
+
+    def _decode(self, candidate: str) -> Any:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError as e:
+            self.last_error = JSONExtractionError(
+                f"Invalid JSON: {e.msg}",
+                offset=self._start + len(candidate[:e.pos].encode("utf-8"))
+            )
+            return _INVALID
+
+    def close(self) -> List[Any]:
+        """
+        Signals end of input. Records an error if a value was left open.
+        """
+        if self._depth > 0 and self._start is not None:
+            self.last_error = JSONExtractionError(
+                "Unterminated JSON value",
+                offset=self._start
+            )
+        return self.values
+
+    @property
+    def pending_offset(self) -> Optional[int]:
+        """
+        Byte offset of the value currently being scanned, if any.
+        """
+        return self._start
+
+
+_INVALID = object()
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+
+
+# -----------------------------
+# Incremental Playbook Parser
+# -----------------------------
+class PlaybookStreamParser:
+    """
+    Emits parts of a `{"summary": ..., "blocks": [...]}` document as
+    soon as they are complete, while the rest is still streaming.
+
+    Events are dicts:
+    - {"event": "field", "name": <top-level key>, "value": <string>}
+    - {"event": "block", "index": <n>, "block": <dict>}
+    """
+
+    def __init__(self, array_key: str = "blocks"):
+        self.array_key = array_key
+
+        # Every chunk, for `text`; the scan works on `_buffer`, which only
+        # keeps what an unfinished string or item still needs
+        self._chunks: List[str] = []
+        self._buffer = ""
+
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+        self._pending_key: Optional[str] = None
+        self._container_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._item_count = 0
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        events: List[Dict[str, Any]] = []
+
+        text = self._buffer
+        i = self._pos
+        end = len(text)
+
+        while i < end:
+            if self._escape:
+                self._escape = False
+                i += 1
+                continue
+
+            match = _PLAYBOOK_STRUCTURAL.search(text, i)
+            if match is None:
+                i = end
+                break
+
+            i = match.start()
+            ch = text[i]
+
+            if self._in_string:
+                if ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._top_level_string(self._string_start, i + 1, events)
+
+            elif self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+
+            elif ch in "{[":
+                if self._depth == 1:
+                    self._container_key = self._pending_key
+                    self._pending_key = None
+                elif self._depth == 2 and self._container_key == self.array_key:
+                    self._item_start = i
+                self._depth += 1
+
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._item_start is not None:
+                    self._emit_item(self._item_start, i + 1, events)
+                    self._item_start = None
+                elif self._depth == 1:
+                    self._container_key = None
+
+            elif ch == "," and self._depth == 1:
+                self._pending_key = None
+
+            i += 1
+
+        self._pos = i
+
+        # Drop the scanned prefix no open string or item refers to
+        keep_from = self._pos
+        if self._in_string:
+            keep_from = min(keep_from, self._string_start)
+        if self._item_start is not None:
+            keep_from = min(keep_from, self._item_start)
+        if keep_from:
+            self._buffer = self._buffer[keep_from:]
+            self._pos -= keep_from
+            self._string_start -= keep_from
+            if self._item_start is not None:
+                self._item_start -= keep_from
+
+        return events
+
+    def _top_level_string(self, start: int, stop: int, events: List[Dict[str, Any]]) -> None:
+        try:
+            value = json.loads(self._buffer[start:stop])
+        except ValueError:
+            return
+
+        if self._pending_key is None:
+            self._pending_key = value
+        else:
+            events.append({"event": "field", "name": self._pending_key, "value": value})
+            self._pending_key = None
+
+    def _emit_item(self, start: int, stop: int, events: List[Dict[str, Any]]) -> None:
+        try:
+            item = json.loads(self._buffer[start:stop])
+        except ValueError:
+            return
+
+        events.append({"event": "block", "index": self._item_count, "block": item})
+        self._item_count += 1
+
+
+_PLAYBOOK_STRUCTURAL = re.compile(r'[{}\[\]",\\]')
+
+
+# -----------------------------
+# Convenience Helpers
+# -----------------------------
+def _fence_body(text: str) -> Optional[Tuple[str, int]]:
+    """
+    Returns the body of the first ```json fence and its char offset.
+    """
+    marker = text.find("```json")
+    if marker == -1:
+        return None
+
+    body_start = text.find("\n", marker)
+    if body_start == -1:
+        return None
+    body_start += 1
+
+    body_end = text.find("```", body_start)
+    if body_end == -1:
+        body_end = len(text)
+
+    return text[body_start:body_end], body_start
+
+
+def _scan(text: str, expected: Tuple[type, ...]) -> Tuple[Any, Optional[JSONExtractionError]]:
+    extractor = StreamingJSONExtractor(allow_arrays=list in expected)
+
+    for value in extractor.feed(text):
+        if isinstance(value, expected):
+            return value, None
+
+    extractor.close()
+    return _INVALID, extractor.last_error
+
+
+def extract_json_value(text: str, expected: Tuple[type, ...] = (dict, list)) -> Any:
+    """
+    Returns the first top-level JSON value of an `expected` type.
+
+    A ```json fenced block is preferred when present; otherwise the
+    whole text is scanned.
+    """
+    try:
+        value = json.loads(text)
+        if isinstance(value, expected):
+            return value
+    except ValueError:
+        pass
+
+    error: Optional[JSONExtractionError] = None
+
+    fenced = _fence_body(text)
+    if fenced is not None:
+        body, body_start = fenced
+        value, error = _scan(body, expected)
+        if value is not _INVALID:
+            return value
+        if error is not None and error.offset is not None:
+            error = JSONExtractionError(
+                error.reason,
+                offset=error.offset + len(text[:body_start].encode("utf-8"))
+            )
+
+    value, scan_error = _scan(text, expected)
+    if value is not _INVALID:
+        return value
+
+    error = error or scan_error
+    if error is not None:
+        raise error
+
+    raise JSONExtractionError("No valid JSON found in model output")
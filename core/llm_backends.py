@@ -0,0 +1,556 @@
+import os
+import json
+import time
+import hashlib
+import contextvars
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from core.context_cache import get_context_cache
+from core.gemini_client import get_async_gemini_client, get_gemini_client
+from core.resilience import DeadlineExceeded, UpstreamUnavailableError
+from core.telemetry import record_tokens, span
+
+
+if TYPE_CHECKING:
+    from google.genai import errors as genai_errors
+    from google.genai import types
+
+
+DEFAULT_GEMINI_MODEL = "models/gemini-2.5-flash"
+DEFAULT_GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+# -----------------------------
+# Backend Interface
+# -----------------------------
+def join_prompt(prefix: str, prompt: str) -> str:
+    return f"{prefix}\n\n{prompt}" if prefix else prompt
+
+
+class LLMBackend:
+    """
+    Minimal text-in / text-out interface used by the playbook engine.
+
+    `timeout_ms` is the remaining request deadline; backends must not
+    wait longer than that for a single call.
+
+    `prefix` is static text that goes before `prompt` and is identical
+    across requests; backends that support it cache it model-side,
+    the others send join_prompt(prefix, prompt).
+
+    `schema` is a pydantic model the response must be JSON for; backends
+    with structured output constrain decoding to it, the others at least
+    switch to JSON mode. Callers still validate the result.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def generate(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> Iterator[str]:
+        yield self.generate(prompt, timeout_ms, prefix, schema)
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        """Exact prompt size from the provider, or None where unsupported / unavailable."""
+        return None
+
+    def generate_served(
+        self,
+        prompt: str,
+        timeout_ms: int,
+        prefix: str = "",
+        schema: Optional[type] = None
+    ) -> Tuple[str, str]:
+        """generate(), plus the model that answered (differs from `model` only when hedged)."""
+        return self.generate(prompt, timeout_ms, prefix, schema), self.model
+
+    @property
+    def stream_model(self) -> str:
+        """The model stream() answers with."""
+        return self.model
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "model": self.model}
+
+
+# -----------------------------
+# Gemini
+# -----------------------------
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model: str = DEFAULT_GEMINI_MODEL):
+        super().__init__(model)
+
+    @staticmethod
+    def _contents(prompt: str) -> list:
+        return [
+            {
+                "role": "user",
+                "parts": [{"text": prompt}]
+            }
+        ]
+
+    @staticmethod
+    def _config(
+        timeout_ms: int,
+        cached_content: Optional[str] = None,
+        schema: Optional[type] = None
+    ) -> "types.GenerateContentConfig":
+        from google.genai import types
+
+        # Carry the remaining deadline into the SDK so no single attempt outlives it
+        return types.GenerateContentConfig(
+            http_options=types.HttpOptions(timeout=timeout_ms),
+            cached_content=cached_content,
+            # The SDK derives property_ordering from the model's field order,
+            # so streamed JSON arrives summary first, then blocks in order
+            response_mime_type="application/json" if schema is not None else None,
+            response_schema=schema,
+        )
+
+    def _cached_prefix(self, prefix: str) -> Optional[str]:
+        cache = get_context_cache() if prefix else None
+        return cache.resolve(get_gemini_client(), self.model, prefix) if cache is not None else None
+
+    def _request(
+        self,
+        prompt: str,
+        timeout_ms: int,
+        prefix: str,
+        cached_content: Optional[str],
+        schema: Optional[type]
+    ) -> Dict[str, Any]:
+        # With a cached prefix only the request-specific suffix is sent
+        return {
+            "model": self.model,
+            "contents": self._contents(prompt if cached_content else join_prompt(prefix, prompt)),
+            "config": self._config(timeout_ms, cached_content, schema),
+        }
+
+    def _cache_rejected(self, e: "genai_errors.APIError", cached_content: Optional[str]) -> bool:
+        """The cache expired or was deleted under us: forget it and resend in full."""
+        if cached_content is None:
+            return False
+        # Any other 400 is about the request itself; resending it would fail the same way
+        message = (e.message or "").lower()
+        names_cache = cached_content.lower() in message or "cached content" in message or "cachedcontent" in message
+        if e.code not in (403, 404) and not (e.code == 400 and names_cache):
+            return False
+        get_context_cache().invalidate(self.model, cached_content)
+        return True
+
+    def generate(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> str:
+        from google.genai import errors as genai_errors
+
+        cached_content = self._cached_prefix(prefix)
+        client = get_gemini_client()
+        try:
+            response = client.models.generate_content(
+                **self._request(prompt, timeout_ms, prefix, cached_content, schema)
+            )
+        except genai_errors.APIError as e:
+            if not self._cache_rejected(e, cached_content):
+                raise
+            response = client.models.generate_content(**self._request(prompt, timeout_ms, prefix, None, schema))
+        self._record_usage(response.usage_metadata)
+        return response.text or ""
+
+    async def agenerate(self, prompt: str, timeout_ms: int, schema: Optional[type] = None) -> str:
+        """generate() on the running event loop's pooled async client (no prefix caching)."""
+        response = await get_async_gemini_client().models.generate_content(
+            **self._request(prompt, timeout_ms, "", None, schema)
+        )
+        self._record_usage(response.usage_metadata)
+        return response.text or ""
+
+    def stream(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> Iterator[str]:
+        from google.genai import errors as genai_errors
+
+        cached_content = self._cached_prefix(prefix)
+        client = get_gemini_client()
+        chunks = client.models.generate_content_stream(
+            **self._request(prompt, timeout_ms, prefix, cached_content, schema)
+        )
+        try:
+            first = next(chunks, None)
+        except genai_errors.APIError as e:
+            if not self._cache_rejected(e, cached_content):
+                raise
+            chunks = client.models.generate_content_stream(
+                **self._request(prompt, timeout_ms, prefix, None, schema)
+            )
+            first = next(chunks, None)
+
+        usage = None
+        for chunk in itertools.chain([first] if first is not None else [], chunks):
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                yield chunk.text
+        self._record_usage(usage)
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        import httpx
+        from google.genai import errors as genai_errors
+
+        try:
+            with span("count_tokens", backend=self.name):
+                response = get_gemini_client().models.count_tokens(model=self.model, contents=text)
+        except (genai_errors.APIError, httpx.HTTPError):
+            # Budgeting falls back to the local estimate
+            return None
+        return response.total_tokens
+
+    def _record_usage(self, usage) -> None:
+        if usage is not None:
+            record_tokens(
+                self.name,
+                self.model,
+                usage.prompt_token_count,
+                usage.candidates_token_count,
+                usage.cached_content_token_count,
+            )
+
+
+# -----------------------------
+# Groq
+# -----------------------------
+class GroqBackend(LLMBackend):
+    name = "groq"
+
+    def __init__(self, model: str = DEFAULT_GROQ_MODEL):
+        super().__init__(model)
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import groq
+
+                    api_key = os.getenv("GROQ_API_KEY")
+                    if not api_key:
+                        raise RuntimeError("GROQ_API_KEY not set")
+
+                    # Retries are owned by core.resilience, not the SDK
+                    self._client = groq.Groq(api_key=api_key, max_retries=0)
+        return self._client
+
+    def _create(self, prompt: str, timeout_ms: int, stream: bool, schema: Optional[type]):
+        import groq
+
+        # JSON mode only: the schema itself is described in the prompt
+        extra = {"response_format": {"type": "json_object"}} if schema is not None else {}
+        try:
+            return self._get_client().chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=timeout_ms / 1000,
+                stream=stream,
+                **extra,
+            )
+        except groq.APIConnectionError as e:
+            raise UpstreamUnavailableError(f"Groq unreachable: {e}")
+
+    def generate(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> str:
+        completion = self._create(join_prompt(prefix, prompt), timeout_ms, stream=False, schema=schema)
+        if completion.usage is not None:
+            record_tokens(self.name, self.model, completion.usage.prompt_tokens, completion.usage.completion_tokens)
+        return completion.choices[0].message.content or ""
+
+    def stream(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> Iterator[str]:
+        for chunk in self._create(join_prompt(prefix, prompt), timeout_ms, stream=True, schema=schema):
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+
+# -----------------------------
+# Deterministic Local Stub
+# -----------------------------
+class StubBackend(LLMBackend):
+    """
+    Offline backend for tests and demos: same prompt, same playbook.
+    """
+
+    name = "stub"
+
+    def __init__(self, model: str = "stub-playbook-v1", latency: float = 0.0):
+        super().__init__(model)
+        self.latency = latency
+
+    def generate(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> str:
+        if self.latency:
+            time.sleep(min(self.latency, timeout_ms / 1000))
+
+        prompt = join_prompt(prefix, prompt)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        alert = prompt.rsplit("SIEM Alert:", 1)[-1].strip().splitlines()
+        headline = alert[0][:120] if alert else "SIEM alert"
+
+        return json.dumps({
+            "summary": f"Stub playbook {digest} for: {headline}",
+            "confidence": "Medium",
+            "blocks": [
+                {"id": "1", "title": "Parse & Normalize Alert", "type": "enrichment",
+                 "description": "Extract entities from the SIEM alert."},
+                {"id": "2", "title": "Threat Intelligence Lookup", "type": "enrichment",
+                 "description": "Check IPs, hashes and domains against TI feeds."},
+                {"id": "3", "title": "Threat Confirmed?", "type": "decision",
+                 "description": "Branch on enrichment verdict and asset criticality."},
+                {"id": "4", "title": "Contain Affected Entity", "type": "automation",
+                 "description": "Block IP / disable account / isolate host."},
+                {"id": "5", "title": "Analyst Review", "type": "human",
+                 "description": "L1 validates containment and closes or escalates."},
+            ],
+        })
+
+    def stream(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> Iterator[str]:
+        text = self.generate(prompt, timeout_ms, prefix, schema)
+        for i in range(0, len(text), 64):
+            yield text[i:i + 64]
+
+
+# -----------------------------
+# Latency Tracking
+# -----------------------------
+class LatencyTracker:
+    """Rolling window of successful call latencies (seconds)."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+# -----------------------------
+# Hedged Requests
+# -----------------------------
+# Primaries run here so the caller can wait on them with a timeout; the
+# hedges themselves get their own, smaller pool: when that is busy the
+# system is saturated and a duplicate request would only add to the load
+HEDGE_WORKERS = int(os.getenv("PLAYBOOK_HEDGE_WORKERS", 32))
+MAX_HEDGES_IN_FLIGHT = int(os.getenv("PLAYBOOK_MAX_HEDGES_IN_FLIGHT", 4))
+
+_primary_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="llm-primary")
+_hedge_pool = ThreadPoolExecutor(max_workers=MAX_HEDGES_IN_FLIGHT, thread_name_prefix="llm-hedge")
+_hedge_slots = threading.BoundedSemaphore(MAX_HEDGES_IN_FLIGHT)
+
+
+class HedgedBackend(LLMBackend):
+    """
+    Sends to `primary`; if it has not answered by its recent p95 latency,
+    fires the same prompt at `secondary` and returns whichever succeeds
+    first. Only the slow tail (~5% of calls) pays for a second request.
+
+    The hedge timer starts when the primary starts running, not when it is
+    queued, and at most MAX_HEDGES_IN_FLIGHT hedges run at once.
+
+    `model` names both backends (cache keys must not mix hedged and
+    unhedged results); generate_served() says which one answered.
+
+    Streaming is not hedged: it goes to the primary only.
+    """
+
+    name = "hedged"
+
+    def __init__(
+        self,
+        primary: LLMBackend,
+        secondary: LLMBackend,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        default_delay: float = 15.0,
+        min_delay: float = 1.0,
+        max_delay: float = 30.0
+    ):
+        super().__init__(f"{primary.model}|{secondary.model}")
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "hedges_fired": 0, "hedges_skipped": 0, "secondary_wins": 0}
+
+    def hedge_delay(self) -> float:
+        if self.latency.count() < self.min_samples:
+            return self.default_delay
+        p = self.latency.percentile(self.percentile)
+        return max(self.min_delay, min(self.max_delay, p))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _timed_primary(
+        self,
+        running: threading.Event,
+        deadline: float,
+        prompt: str,
+        timeout_ms: int,
+        prefix: str,
+        schema: Optional[type]
+    ) -> Tuple[str, str]:
+        running.set()
+        started = time.monotonic()
+        # Time spent queued comes out of the caller's deadline
+        remaining_ms = max(1, int((deadline - started) * 1000))
+        served = self.primary.generate_served(prompt, min(timeout_ms, remaining_ms), prefix, schema)
+        self.latency.record(time.monotonic() - started)
+        return served
+
+    def _secondary(self, prompt: str, timeout_ms: int, prefix: str, schema: Optional[type]) -> Tuple[str, str]:
+        try:
+            return self.secondary.generate_served(prompt, timeout_ms, prefix, schema)
+        finally:
+            _hedge_slots.release()
+
+    def generate(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> str:
+        return self.generate_served(prompt, timeout_ms, prefix, schema)[0]
+
+    def generate_served(
+        self,
+        prompt: str,
+        timeout_ms: int,
+        prefix: str = "",
+        schema: Optional[type] = None
+    ) -> Tuple[str, str]:
+        self._count("calls")
+        deadline = time.monotonic() + timeout_ms / 1000
+
+        # Pool threads carry the caller's context (trace spans) along
+        running = threading.Event()
+        primary = _primary_pool.submit(
+            contextvars.copy_context().run, self._timed_primary, running, deadline, prompt, timeout_ms, prefix, schema
+        )
+        if not running.wait(timeout_ms / 1000) and primary.cancel():
+            raise DeadlineExceeded("Deadline exceeded before the model call could start")
+
+        # Measured from the primary's start, so a queue under load does not trigger hedges
+        delay = min(self.hedge_delay(), max(0.0, deadline - time.monotonic()))
+        done, _ = wait([primary], timeout=delay)
+        if done or not _hedge_slots.acquire(blocking=False):
+            if not done:
+                self._count("hedges_skipped")
+            return primary.result()
+
+        self._count("hedges_fired")
+        remaining_ms = max(1, int((deadline - time.monotonic()) * 1000))
+        secondary = _hedge_pool.submit(
+            contextvars.copy_context().run, self._secondary, prompt, remaining_ms, prefix, schema
+        )
+
+        # First success wins; the loser keeps running in the pool and is ignored
+        pending = {primary, secondary}
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is secondary:
+                        self._count("secondary_wins")
+                    return future.result()
+                first_error = first_error or future.exception()
+
+        raise first_error
+
+    def stream(self, prompt: str, timeout_ms: int, prefix: str = "", schema: Optional[type] = None) -> Iterator[str]:
+        return self.primary.stream(prompt, timeout_ms, prefix, schema)
+
+    @property
+    def stream_model(self) -> str:
+        return self.primary.stream_model
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        return self.primary.count_tokens(text)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "name": self.name,
+            "primary": self.primary.stats(),
+            "secondary": self.secondary.stats(),
+            "hedge_delay_seconds": round(self.hedge_delay(), 3),
+            "primary_p95_seconds": self.latency.percentile(self.percentile),
+            **counters,
+        }
+
+
+# -----------------------------
+# Registry / Configuration
+# -----------------------------
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "groq": GroqBackend,
+    "stub": StubBackend,
+}
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str) -> LLMBackend:
+    if name not in BACKENDS:
+        raise RuntimeError(f"Unknown LLM backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def get_backend() -> LLMBackend:
+    """
+    PLAYBOOK_BACKEND picks the primary (default: gemini).
+    PLAYBOOK_HEDGE_BACKEND, if set, enables hedging to that backend.
+    """
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = create_backend(os.getenv("PLAYBOOK_BACKEND", "gemini"))
+
+                hedge_name = os.getenv("PLAYBOOK_HEDGE_BACKEND")
+                if hedge_name and hedge_name != backend.name:
+                    backend = HedgedBackend(backend, create_backend(hedge_name))
+
+                _backend = backend
+    return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Overrides the process backend (e.g. StubBackend in tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def available_backends() -> List[str]:
+    return list(BACKENDS)
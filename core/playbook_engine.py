@@ -1,40 +1,67 @@
 import os
-import json
-import re
-from typing import Dict, Any
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import Callable, Dict, Any, Iterator, Optional, Tuple
 
-from google import genai
+from core.alert_normalizer import get_template_cache, normalize_alert, template_cache_stats
+from core.json_extractor import PlaybookStreamParser, extract_json_value
+from core.context_cache import context_cache_stats, prefix_digest
+from core.llm_backends import LLMBackend, get_backend, join_prompt
+from core.playbook_store import get_playbook_store
+from core.resilience import (
+    CircuitBreaker,
+    Deadline,
+    DeadlineExceeded,
+    MalformedResponseError,
+    SingleFlight,
+    call_with_retries,
+    default_deadline_seconds,
+    default_retry_policy,
+    retry_stats,
+)
+from core.response_cache import get_response_cache, make_cache_key
+from core.retrieval import reference_context, retrieval_version
+from core.telemetry import record_event, record_size, span
+from core.token_budget import budget_prompt
 
 
-# -----------------------------
-# Gemini Client
-# -----------------------------
-def get_gemini_client() -> genai.Client:
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY / GOOGLE_API_KEY not set")
+# Shared by every session in the process so a degraded upstream fails fast
+UPSTREAM_BREAKER = CircuitBreaker("llm")
+
+# Identical concurrent requests (same prompt, model, mode, depth) share one upstream call
+GENERATIONS = SingleFlight("generation")
+
 
-    return genai.Client(api_key=api_key)
+def get_resilience_stats() -> Dict[str, Any]:
+    return {
+        "backend": get_backend().stats(),
+        "breaker": UPSTREAM_BREAKER.stats(),
+        "retries": retry_stats(),
+        "template_cache": template_cache_stats(),
+        "coalescing": GENERATIONS.stats(),
+        "context_cache": context_cache_stats(),
+    }
 
 
 # -----------------------------
 # Safe JSON extraction
 # -----------------------------
 def extract_json(text: str) -> Dict[str, Any]:
-    try:
-        return json.loads(text)
-    except Exception:
-        match = re.search(r"\{[\s\S]*\}", text)
-        if not match:
-            raise ValueError("No valid JSON found in model output")
-        return json.loads(match.group())
+    return extract_json_value(text, expected=(dict,))
 
 
 # -----------------------------
 # Prompt Builder
 # -----------------------------
-def build_prompt(alert_text: str, mode: str, depth: str) -> str:
-    return f"""
+# Everything before the alert is identical on every call: it is sent as the
+# backend `prefix` so Gemini can serve it from a cached context (see
+# core.context_cache). Only build_prompt_suffix() varies per request.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE_FILES = ("reference_context.txt", "reference_sources.txt")
+
+PROMPT_INSTRUCTIONS = """
 You are an enterprise-grade SOAR architect working in a Tier-1 SOC.
 
 Your task:
@@ -54,27 +81,306 @@ Output MUST be valid JSON only.
 No markdown. No explanations. No extra text.
 
 JSON Schema:
-{{
+{
   "summary": "One-paragraph technical summary of the incident",
   "confidence": "Low | Medium | High",
   "blocks": [
-    {{
+    {
       "id": "string",
       "title": "string",
       "type": "enrichment | decision | automation | human",
       "description": "string"
-    }}
+    }
   ]
-}}
+}
+""".strip()
+
+_prefix_lock = threading.Lock()
+_prefix: Tuple[Tuple, str] = ((), "")
+
+
+def prompt_prefix() -> str:
+    """
+    Instructions + schema + reference sources. Re-read when a reference
+    file changes, which also changes the context cache key.
+    """
+    global _prefix
+
+    paths = [os.path.join(ROOT, name) for name in REFERENCE_FILES]
+    stamp = tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+    if _prefix[0] == stamp:
+        return _prefix[1]
 
+    with _prefix_lock:
+        references = []
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    references.append(f.read().strip())
+
+        prefix = PROMPT_INSTRUCTIONS
+        if references:
+            prefix += "\n\nReference Sources:\n" + "\n\n".join(references)
+        _prefix = (stamp, prefix)
+        return prefix
+
+
+def prompt_version(model: str) -> str:
+    """
+    Identifies the prompt inputs other than the alert: the prefix (which
+    tracks the reference files) and the retrieval corpus.
+    """
+    return f"{prefix_digest(model, prompt_prefix())}:{retrieval_version()}"
+
+
+def _render_suffix(context: str, alert_text: str, mode: str, depth: str) -> str:
+    return f"""
 Mode: {mode}
 Depth: {depth}
 
-SIEM Alert:
+{context}SIEM Alert:
 {alert_text}
 """.strip()
 
 
+def build_prompt_suffix(
+    alert_text: str,
+    mode: str,
+    depth: str,
+    count_tokens: Optional[Callable[[str], Optional[int]]] = None
+) -> str:
+    """Compacted alert + retrieved context, fitted with the prefix to the mode's token budget."""
+    suffix, _ = budget_prompt(
+        alert_text,
+        mode,
+        render=lambda context, alert: _render_suffix(context, alert, mode, depth),
+        # The reference source files are already in the prefix
+        context_for=lambda alert: reference_context(alert, exclude_sources=REFERENCE_FILES),
+        fixed=prompt_prefix(),
+        count_tokens=count_tokens,
+    )
+    return suffix
+
+
+def build_prompt(alert_text: str, mode: str, depth: str) -> str:
+    """The full prompt, as sent to backends without prefix caching."""
+    return join_prompt(prompt_prefix(), build_prompt_suffix(alert_text, mode, depth))
+
+
+# -----------------------------
+# Shared Helpers
+# -----------------------------
+def _parse_playbook(text: str) -> Dict[str, Any]:
+    if not text:
+        raise MalformedResponseError("Empty response from model")
+
+    try:
+        with span("json_parse", chars=len(text)):
+            return extract_json(text)
+    except ValueError as e:
+        raise MalformedResponseError(f"Model returned invalid JSON: {e}")
+
+
+def _build_prompt_measured(alert_text: str, mode: str, depth: str, backend: LLMBackend) -> Tuple[str, str]:
+    with span("build_prompt", alert_chars=len(alert_text)):
+        prefix = prompt_prefix()
+        suffix = build_prompt_suffix(alert_text, mode, depth, count_tokens=backend.count_tokens)
+    record_size("prompt", len(prefix) + len(suffix))
+    record_size("prompt_suffix", len(suffix))
+    return prefix, suffix
+
+
+def _store_generated(
+    alert_text: str,
+    data: Dict[str, Any],
+    model: str,
+    mode: str,
+    depth: str,
+    timings: Dict[str, Optional[float]]
+) -> None:
+    store = get_playbook_store()
+    if store is None:
+        return
+
+    # Alerts of the same shape (see core.alert_normalizer) group under one use case
+    first_line = alert_text.strip().splitlines()[0] if alert_text.strip() else ""
+    use_case = normalize_alert(first_line)[0][:120]
+
+    try:
+        with span("playbook_store_save"):
+            store.save(
+                data,
+                use_case=use_case,
+                source_alert=alert_text,
+                model=model,
+                mode=mode,
+                depth=depth,
+                timings={k: round(v, 3) for k, v in timings.items() if v is not None},
+            )
+    except sqlite3.Error:
+        # The playbook has already been generated; losing the archive copy must not fail the request
+        record_event("playbook_store_errors")
+
+
+def _wrap_upstream_error(e: Exception) -> RuntimeError:
+    if isinstance(e, RuntimeError):
+        return e
+    return RuntimeError(f"Model request failed: {e}")
+
+
+# -----------------------------
+# Generation Request
+# -----------------------------
+class _GenerationRequest:
+    """
+    One playbook request: cache lookups first, then (on a miss) the
+    upstream call, coalesced with identical in-flight requests on `key`.
+    """
+
+    def __init__(self, alert_text: str, mode: str, depth: str):
+        self.alert_text = alert_text
+        self.mode = mode
+        self.depth = depth
+        self.started = time.perf_counter()
+        self.backend = get_backend()
+        self.templates = get_template_cache()
+        self.cache = get_response_cache()
+        self.template_key: Optional[str] = None
+        self.entities: Dict[str, str] = {}
+        self.prefix = ""
+        self.prompt: Optional[str] = None
+        self.key: Optional[str] = None
+        # The model that wrote the playbook (one side of a hedged pair)
+        self.served_model = self.backend.model
+
+    def lookup(self) -> Optional[Dict[str, Any]]:
+        # Alerts differing only in IPs / accounts / hosts / timestamps share a playbook
+        if self.templates is not None:
+            templated, self.template_key, self.entities = self.templates.lookup(
+                self.alert_text, self.backend.model, self.mode, self.depth, prompt_version(self.backend.model)
+            )
+            if templated is not None:
+                return templated
+
+        self.prefix, self.prompt = _build_prompt_measured(self.alert_text, self.mode, self.depth, self.backend)
+        # Same key as the response cache: (full prompt, model, mode, depth)
+        self.key = make_cache_key(join_prompt(self.prefix, self.prompt), self.backend.model, self.mode, self.depth)
+
+        # Repeat submissions of the same alert are served from disk
+        if self.cache is not None:
+            with span("cache_lookup") as s:
+                cached = self.cache.get(self.key)
+                s.set("hit", cached is not None)
+            return cached
+        return None
+
+    def validate(self, data: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+        """
+        The schema-checked playbook. Invalid blocks / fields are regenerated
+        by one repair call that sends only the failures (the prefix stays
+        cached), instead of a full regeneration.
+        """
+        from core.playbook_schema import DEPLOYMENT_SCHEMA, validate_playbook
+
+        def regenerate(instructions: str, schema: type) -> str:
+            with span("model_call", backend=self.backend.name, repair=True):
+                text = self.backend.generate(
+                    join_prompt(self.prompt, instructions),
+                    max(1, deadline.remaining_ms()),
+                    self.prefix,
+                    schema,
+                )
+            record_size("repair_response", len(text))
+            return text
+
+        return validate_playbook(DEPLOYMENT_SCHEMA, data, regenerate)
+
+    def call(self) -> Dict[str, Any]:
+        from core.playbook_schema import DEPLOYMENT_SCHEMA
+
+        deadline = Deadline(default_deadline_seconds())
+
+        def attempt(timeout_ms: int) -> Dict[str, Any]:
+            with span("model_call", backend=self.backend.name):
+                text, self.served_model = self.backend.generate_served(
+                    self.prompt, timeout_ms, self.prefix, DEPLOYMENT_SCHEMA.model
+                )
+            record_size("response", len(text))
+            return self.validate(_parse_playbook(text), deadline)
+
+        try:
+            data = call_with_retries(
+                attempt,
+                policy=default_retry_policy(),
+                deadline=deadline,
+                breaker=UPSTREAM_BREAKER,
+            )
+        except Exception as e:
+            raise _wrap_upstream_error(e)
+
+        self.finish(data, {"total_seconds": time.perf_counter() - self.started})
+        return data
+
+    def stream(self) -> Iterator[Dict[str, Any]]:
+        """Yields parser events; the generator's return value is the playbook."""
+        from core.playbook_schema import DEPLOYMENT_SCHEMA
+
+        parser = PlaybookStreamParser(array_key="blocks")
+        self.served_model = self.backend.stream_model
+        deadline = Deadline(default_deadline_seconds())
+
+        # Retries only cover opening the stream: once events are yielded,
+        # replaying them would duplicate blocks on the caller's screen
+        def open_stream(timeout_ms: int):
+            stream = iter(self.backend.stream(self.prompt, timeout_ms, self.prefix, DEPLOYMENT_SCHEMA.model))
+            return next(stream, None), stream
+
+        try:
+            with span("model_time_to_first_token", backend=self.backend.name):
+                first_chunk, stream = call_with_retries(
+                    open_stream,
+                    policy=default_retry_policy(),
+                    deadline=deadline,
+                    breaker=UPSTREAM_BREAKER,
+                )
+        except Exception as e:
+            raise _wrap_upstream_error(e)
+        first_token_seconds = time.perf_counter() - self.started
+
+        chunk = first_chunk
+        while chunk is not None:
+            yield from parser.feed(chunk)
+
+            if deadline.expired:
+                raise DeadlineExceeded(f"Deadline of {deadline.seconds:.0f}s exceeded while streaming")
+
+            try:
+                chunk = next(stream, None)
+            except Exception as e:
+                raise _wrap_upstream_error(e)
+
+        record_size("response", len(parser.text))
+        # Blocks already shown stay on screen; the complete event carries the repaired playbook
+        try:
+            data = self.validate(_parse_playbook(parser.text), deadline)
+        except Exception as e:
+            raise _wrap_upstream_error(e)
+
+        self.finish(data, {
+            "total_seconds": time.perf_counter() - self.started,
+            "time_to_first_token_seconds": first_token_seconds,
+        })
+        return data
+
+    def finish(self, data: Dict[str, Any], timings: Dict[str, Optional[float]]) -> None:
+        if self.cache is not None:
+            self.cache.set(self.key, data)
+        if self.templates is not None:
+            self.templates.store_playbook(self.template_key, self.entities, data)
+
+        _store_generated(self.alert_text, data, self.served_model, self.mode, self.depth, timings)
+
+
 # -----------------------------
 # Main Playbook Generator
 # -----------------------------
@@ -84,28 +390,87 @@ def generate_playbook(
     depth: str
 ) -> Dict[str, Any]:
 
-    client = get_gemini_client()
-    prompt = build_prompt(alert_text, mode, depth)
+    request = _GenerationRequest(alert_text, mode, depth)
+
+    data = request.lookup()
+    if data is not None:
+        return data
+
+    return GENERATIONS.do(request.key, request.call)
+
+
+async def generate_playbook_async(
+    alert_text: str,
+    mode: str,
+    depth: str
+) -> Dict[str, Any]:
+    """
+    asyncio variant of generate_playbook. Lookups and the upstream call run
+    in worker threads; coroutines and threads asking for the same playbook
+    at the same time share one upstream call.
+    """
+
+    request = _GenerationRequest(alert_text, mode, depth)
+
+    data = await asyncio.to_thread(request.lookup)
+    if data is not None:
+        return data
+
+    return await GENERATIONS.do_async(request.key, request.call)
+
+
+# -----------------------------
+# Streaming Playbook Generator
+# -----------------------------
+def generate_playbook_stream(
+    alert_text: str,
+    mode: str,
+    depth: str
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of generate_playbook.
+
+    Yields events as soon as they can be parsed from the token stream:
+    - {"event": "field", "name": "summary" | "confidence" | ..., "value": str}
+    - {"event": "block", "index": int, "block": dict}
+    - {"event": "complete", "playbook": dict}   (always last)
+
+    A request that matches one already in flight waits for it and replays
+    the finished playbook instead of opening a second stream.
+    """
+
+    request = _GenerationRequest(alert_text, mode, depth)
+
+    data = request.lookup()
+    if data is not None:
+        yield from _replay_events(data)
+        return
+
+    future, leader = GENERATIONS.join(request.key)
+    if not leader:
+        with span("coalesced_wait"):
+            data = future.result()
+        yield from _replay_events(data)
+        return
 
     try:
-        response = client.models.generate_content(
-            model="models/gemini-2.5-flash",
-            contents=[
-                {
-                    "role": "user",
-                    "parts": [{"text": prompt}]
-                }
-            ],
-        )
-    except Exception as e:
-        raise RuntimeError(f"Gemini request failed: {e}")
-
-    if not response.text:
-        raise RuntimeError("Empty response from Gemini")
-
-    data = extract_json(response.text)
-
-    if "blocks" not in data:
-        raise RuntimeError("Invalid playbook structure returned")
-
-    return data
+        data = yield from request.stream()
+    except BaseException as e:
+        # Includes the consumer abandoning the stream (GeneratorExit); waiters must not hang
+        error = e if isinstance(e, Exception) else RuntimeError("Playbook stream was abandoned")
+        GENERATIONS.complete(request.key, future, error=error)
+        raise
+    GENERATIONS.complete(request.key, future, data)
+
+    yield {"event": "complete", "playbook": data}
+
+
+def _replay_events(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for name, value in data.items():
+        if isinstance(value, str):
+            yield {"event": "field", "name": name, "value": value}
+
+    for index, block in enumerate(data.get("blocks", [])):
+        yield {"event": "block", "index": index, "block": block}
+
+    yield {"event": "complete", "playbook": data}
@@ -0,0 +1,252 @@
+"""
+Typed response schemas for generated playbooks.
+
+Each schema is sent to the model as a structured-output constraint
+(response_schema) and validated locally with a validator compiled once
+at import. When only some parts of a response are invalid, a repair
+request regenerates just those parts:
+
+    backend.generate(prompt, timeout_ms, prefix, schema=DEPLOYMENT_SCHEMA.model)
+    playbook = validate_playbook(DEPLOYMENT_SCHEMA, data, regenerate)
+"""
+
+import json
+from typing import Annotated, Any, Callable, Dict, List, Literal, Optional, Type
+
+from pydantic import BaseModel, BeforeValidator, Field, TypeAdapter, ValidationError, create_model
+
+from core.json_extractor import extract_json_value
+from core.resilience import MalformedResponseError
+from core.telemetry import record_event, span
+
+
+# Raw text of an invalid block quoted back to the model, at most
+REPAIR_QUOTE_CHARS = 600
+
+
+def _lower(value: Any) -> Any:
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def _capitalized(value: Any) -> Any:
+    return value.strip().capitalize() if isinstance(value, str) else value
+
+
+NonEmpty = Annotated[str, Field(min_length=1)]
+
+
+# -----------------------------
+# Deployment (core.playbook_engine)
+# -----------------------------
+class DeploymentBlock(BaseModel):
+    id: str
+    title: NonEmpty
+    type: Annotated[Literal["enrichment", "decision", "automation", "human"], BeforeValidator(_lower)]
+    description: str
+
+
+class DeploymentPlaybook(BaseModel):
+    summary: str
+    confidence: Annotated[Literal["Low", "Medium", "High"], BeforeValidator(_capitalized)]
+    blocks: List[DeploymentBlock] = Field(min_length=1)
+
+
+# -----------------------------
+# Learning (app.py)
+# -----------------------------
+class LearningBlock(BaseModel):
+    title: NonEmpty
+    why: str
+    soc_role: str
+    if_skipped: str
+    decision_logic: str
+    automation_risk: str
+    human_takeover: str
+
+
+class LearningPlaybook(BaseModel):
+    blocks: List[LearningBlock] = Field(min_length=1)
+
+
+# -----------------------------
+# Validation
+# -----------------------------
+class SchemaCheck:
+    """
+    Outcome of PlaybookSchema.validate. `playbook` is the normalized
+    playbook when everything passed; otherwise `bad_fields` /
+    `bad_blocks` say what needs regenerating.
+    """
+
+    def __init__(self, playbook: Optional[Dict[str, Any]], bad_fields: Dict[str, str], bad_blocks: Dict[int, str]):
+        self.playbook = playbook
+        self.bad_fields = bad_fields
+        self.bad_blocks = bad_blocks
+
+    @property
+    def ok(self) -> bool:
+        return self.playbook is not None
+
+
+def _quote(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)[:REPAIR_QUOTE_CHARS]
+
+
+def _message(error: Dict[str, Any], skip: int) -> str:
+    where = ".".join(str(part) for part in error["loc"][skip:])
+    return f"{where}: {error['msg']}" if where else error["msg"]
+
+
+class PlaybookSchema:
+    def __init__(self, name: str, playbook_model: Type[BaseModel], block_model: Type[BaseModel]):
+        self.name = name
+        self.model = playbook_model
+        self.block_model = block_model
+
+        # Compiled once; validate_python runs in pydantic-core
+        self._validator = TypeAdapter(playbook_model)
+        self.fields = [field for field in playbook_model.model_fields if field != "blocks"]
+
+        # What a repair call returns: only the replaced parts
+        replacement = create_model(f"{block_model.__name__}Replacement", index=(int, ...), block=(block_model, ...))
+        self.repair_model = create_model(
+            f"{playbook_model.__name__}Repair",
+            **{field: (Optional[playbook_model.model_fields[field].annotation], None) for field in self.fields},
+            blocks=(List[replacement], Field(default_factory=list)),
+        )
+        self._repair_validator = TypeAdapter(self.repair_model)
+
+    def validate(self, data: Any) -> SchemaCheck:
+        try:
+            return SchemaCheck(self._validator.validate_python(data).model_dump(), {}, {})
+        except ValidationError as e:
+            errors = e.errors(include_url=False)
+
+        bad_fields: Dict[str, List[str]] = {}
+        bad_blocks: Dict[int, List[str]] = {}
+        for error in errors:
+            loc = error["loc"]
+            if not loc:
+                bad_fields.setdefault("*", []).append(error["msg"])
+            elif loc[0] == "blocks" and len(loc) > 1 and isinstance(loc[1], int):
+                bad_blocks.setdefault(loc[1], []).append(_message(error, 2))
+            else:
+                bad_fields.setdefault(str(loc[0]), []).append(_message(error, 0))
+
+        return SchemaCheck(
+            None,
+            {field: "; ".join(messages) for field, messages in bad_fields.items()},
+            {index: "; ".join(messages) for index, messages in bad_blocks.items()},
+        )
+
+    # -------------------------
+    # Repair
+    # -------------------------
+    def repair_prompt(self, data: Any, check: SchemaCheck) -> str:
+        blocks = data.get("blocks") if isinstance(data, dict) else None
+        rebuild_blocks = "blocks" in check.bad_fields or "*" in check.bad_fields or not isinstance(blocks, list)
+
+        # The model never saw its earlier answer: everything it needs is quoted here
+        lines = [
+            "A playbook generated for the request above failed validation.",
+            "The invalid parts, what was wrong with them and what they contained are listed below.",
+            "Return JSON with ONLY the replacement parts; do not repeat valid parts.",
+        ]
+
+        fields = [f for f in self.fields if f in check.bad_fields or "*" in check.bad_fields]
+        if fields:
+            lines.append("")
+            lines.append("Fields to regenerate:")
+            for field in fields:
+                lines.append(f"  {field}: {check.bad_fields.get(field, 'missing')}")
+                if isinstance(data, dict) and field in data:
+                    lines.append(f"    was: {_quote(data[field])}")
+
+        if rebuild_blocks:
+            lines.append("")
+            lines.append('The "blocks" list is missing or unusable: return the complete list, index 0 upwards.')
+            if "blocks" in check.bad_fields:
+                lines.append(f"  error: {check.bad_fields['blocks']}")
+            if blocks is not None:
+                lines.append(f"  was: {_quote(blocks)}")
+        else:
+            valid = [
+                f"  {i}. {block.get('title') or block.get('id') or '?'}"
+                for i, block in enumerate(blocks)
+                if i not in check.bad_blocks and isinstance(block, dict)
+            ]
+            if valid:
+                lines.append("")
+                lines.append("Valid blocks (context only, keep as they are):")
+                lines.extend(valid)
+
+            lines.append("")
+            lines.append('Blocks to regenerate (return each under "blocks" with its index):')
+            for index, reason in sorted(check.bad_blocks.items()):
+                lines.append(f"  index {index}: {reason}")
+                lines.append(f"    was: {_quote(blocks[index])}")
+
+        return "\n".join(lines)
+
+    def merge(self, data: Any, check: SchemaCheck, repair_text: str) -> Dict[str, Any]:
+        """`data` with the parts from a repair response swapped in."""
+        try:
+            repair = self._repair_validator.validate_python(extract_json_value(repair_text, expected=(dict,)))
+        except (ValueError, ValidationError) as e:
+            raise MalformedResponseError(f"Repair response for {self.name} playbook was invalid: {e}")
+
+        merged = dict(data) if isinstance(data, dict) else {}
+        for field in self.fields:
+            value = getattr(repair, field)
+            if value is not None:
+                merged[field] = value
+
+        replacements = {item.index: item.block.model_dump() for item in repair.blocks}
+        blocks = merged.get("blocks")
+        if not isinstance(blocks, list) or "blocks" in check.bad_fields:
+            merged["blocks"] = [replacements[i] for i in sorted(replacements)]
+        else:
+            merged["blocks"] = [replacements.get(i, block) for i, block in enumerate(blocks)]
+
+        return merged
+
+
+DEPLOYMENT_SCHEMA = PlaybookSchema("deployment", DeploymentPlaybook, DeploymentBlock)
+LEARNING_SCHEMA = PlaybookSchema("learning", LearningPlaybook, LearningBlock)
+
+
+def validate_playbook(
+    schema: PlaybookSchema,
+    data: Any,
+    regenerate: Callable[[str, Type[BaseModel]], str]
+) -> Dict[str, Any]:
+    """
+    The validated playbook. On a partial failure, calls
+    regenerate(repair_instructions, repair_schema) once for just the
+    failing parts; raises MalformedResponseError if that does not fix it.
+    """
+    check = schema.validate(data)
+    if check.ok:
+        record_event("schema_valid")
+        return check.playbook
+
+    record_event("schema_repairs")
+    record_event("schema_repaired_blocks", len(check.bad_blocks))
+
+    with span("schema_repair", schema=schema.name, blocks=len(check.bad_blocks), fields=len(check.bad_fields)):
+        merged = schema.merge(data, check, regenerate(schema.repair_prompt(data, check), schema.repair_model))
+        repaired = schema.validate(merged)
+
+    if not repaired.ok and repaired.bad_blocks and not repaired.bad_fields:
+        # Still-invalid blocks are dropped rather than failing the whole playbook
+        kept = [block for i, block in enumerate(merged["blocks"]) if i not in repaired.bad_blocks]
+        repaired = schema.validate({**merged, "blocks": kept})
+        if repaired.ok:
+            record_event("schema_blocks_dropped")
+
+    if not repaired.ok:
+        record_event("schema_repair_failed")
+        problems = list(repaired.bad_fields.values()) + list(repaired.bad_blocks.values())
+        raise MalformedResponseError(f"{schema.name} playbook failed validation after repair: {problems[:3]}")
+
+    return repaired.playbook
@@ -0,0 +1,496 @@
+"""
+Indexed local store for generated playbooks.
+
+    python -m core.playbook_store import playbooks/        # legacy SECTION A/B files
+    python -m core.playbook_store search "revoke sessions"
+    python -m core.playbook_store find --technique T1110 --since 2026-01-01
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.json_extractor import JSONExtractionError, extract_json_value
+
+
+DEFAULT_STORE_PATH = os.path.join("playbooks", "store.sqlite3")
+
+# Whole IRPs can be submitted as the "alert"; keep the head only
+SOURCE_ALERT_MAX_CHARS = 20_000
+
+_TECHNIQUE = re.compile(r"\bT\d{4}(?:\.\d{3})?\b")
+_LEGACY_TIMESTAMP = re.compile(r"(\d{8}_\d{6})")
+_DOCS_MARKER = "SECTION B: DOCUMENTATION_TEXT"
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def content_hash(playbook: Dict[str, Any]) -> str:
+    """
+    Identity of a playbook's content: same summary / confidence / blocks,
+    same hash, regardless of key order or JSON formatting.
+    """
+    canonical = json.dumps(
+        {k: playbook.get(k) for k in ("summary", "confidence", "blocks")},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _strings(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [s for v in value for s in _strings(v)]
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _strings(v)]
+    return []
+
+
+def block_title(block: Dict[str, Any]) -> str:
+    # Engine blocks use "title"; legacy agent blocks use "block_name"
+    return str(block.get("title") or block.get("block_name") or block.get("id") or "")
+
+
+def extract_techniques(*texts: str) -> List[str]:
+    return sorted({t for text in texts if text for t in _TECHNIQUE.findall(text)})
+
+
+# -----------------------------
+# SQLite Store
+# -----------------------------
+class PlaybookStore:
+    """
+    One row per distinct playbook (deduplicated by content hash), with
+    secondary indexes on use case, MITRE technique and creation date and
+    an FTS5 index over block titles and text.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS playbooks (
+                    id INTEGER PRIMARY KEY,
+                    content_hash TEXT NOT NULL UNIQUE,
+                    use_case TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    confidence TEXT NOT NULL,
+                    blocks TEXT NOT NULL,
+                    documentation TEXT NOT NULL,
+                    source_alert TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    depth TEXT NOT NULL,
+                    timings TEXT NOT NULL,
+                    source_path TEXT,
+                    created_at REAL NOT NULL,
+                    created_date TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_playbooks_use_case ON playbooks (use_case, created_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_playbooks_date ON playbooks (created_date)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS playbook_techniques (
+                    technique TEXT NOT NULL,
+                    playbook_id INTEGER NOT NULL REFERENCES playbooks (id) ON DELETE CASCADE,
+                    PRIMARY KEY (technique, playbook_id)
+                )
+                """
+            )
+
+            try:
+                conn.execute(
+                    """
+                    CREATE VIRTUAL TABLE IF NOT EXISTS block_text USING fts5 (
+                        title, body, playbook_id UNINDEXED, block_index UNINDEXED
+                    )
+                    """
+                )
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search() falls back to LIKE
+                self.fts = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # -------------------------
+    # Writes
+    # -------------------------
+    def save(
+        self,
+        playbook: Dict[str, Any],
+        use_case: str = "",
+        source_alert: str = "",
+        model: str = "",
+        mode: str = "",
+        depth: str = "",
+        timings: Optional[Dict[str, float]] = None,
+        documentation: str = "",
+        source_path: Optional[str] = None,
+        created_at: Optional[float] = None
+    ) -> Tuple[int, bool]:
+        """
+        Returns (playbook_id, created). Re-saving identical content is a
+        no-op that returns the existing id with created=False.
+        """
+        digest = content_hash(playbook)
+        blocks = [b for b in playbook.get("blocks") or [] if isinstance(b, dict)]
+        created_at = created_at if created_at is not None else time.time()
+        summary = str(playbook.get("summary") or "")
+
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT id FROM playbooks WHERE content_hash = ?", (digest,)).fetchone()
+            if row is not None:
+                return row["id"], False
+
+            playbook_id = conn.execute(
+                """
+                INSERT INTO playbooks (
+                    content_hash, use_case, summary, confidence, blocks, documentation,
+                    source_alert, model, mode, depth, timings, source_path, created_at, created_date
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    digest,
+                    use_case or "unknown",
+                    summary,
+                    str(playbook.get("confidence") or ""),
+                    json.dumps(blocks, ensure_ascii=False),
+                    documentation,
+                    source_alert[:SOURCE_ALERT_MAX_CHARS],
+                    model,
+                    mode,
+                    depth,
+                    json.dumps(timings or {}),
+                    source_path,
+                    created_at,
+                    datetime.fromtimestamp(created_at).strftime("%Y-%m-%d"),
+                )
+            ).lastrowid
+
+            block_texts = [" ".join(_strings(b)) for b in blocks]
+            conn.executemany(
+                "INSERT OR IGNORE INTO playbook_techniques (technique, playbook_id) VALUES (?, ?)",
+                [(t, playbook_id) for t in extract_techniques(source_alert, summary, documentation, *block_texts)]
+            )
+
+            if self.fts:
+                conn.executemany(
+                    "INSERT INTO block_text (title, body, playbook_id, block_index) VALUES (?, ?, ?, ?)",
+                    [(block_title(b), text, playbook_id, i) for i, (b, text) in enumerate(zip(blocks, block_texts))]
+                )
+
+        return playbook_id, True
+
+    def delete(self, playbook_id: int) -> None:
+        conn = self._connect()
+        with conn:
+            if self.fts:
+                conn.execute("DELETE FROM block_text WHERE playbook_id = ?", (playbook_id,))
+            conn.execute("DELETE FROM playbooks WHERE id = ?", (playbook_id,))
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def get(self, playbook_id: int) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM playbooks WHERE id = ?", (playbook_id,)).fetchone()
+        if row is None:
+            return None
+
+        record = dict(row)
+        record["blocks"] = json.loads(record["blocks"])
+        record["timings"] = json.loads(record["timings"])
+        record["techniques"] = [
+            r["technique"] for r in conn.execute(
+                "SELECT technique FROM playbook_techniques WHERE playbook_id = ? ORDER BY technique",
+                (playbook_id,)
+            )
+        ]
+        return record
+
+    def find(
+        self,
+        use_case: Optional[str] = None,
+        technique: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Newest first. `since` / `until` are inclusive YYYY-MM-DD dates.
+        Returns summaries only; use get() for blocks and documentation.
+        """
+        clauses, params = [], []
+        if use_case:
+            clauses.append("p.use_case = ?")
+            params.append(use_case)
+        if technique:
+            clauses.append("p.id IN (SELECT playbook_id FROM playbook_techniques WHERE technique = ?)")
+            params.append(technique.upper())
+        if since:
+            clauses.append("p.created_date >= ?")
+            params.append(since)
+        if until:
+            clauses.append("p.created_date <= ?")
+            params.append(until)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"""
+            SELECT p.id, p.content_hash, p.use_case, p.summary, p.confidence, p.model,
+                   p.mode, p.depth, p.timings, p.source_path, p.created_at, p.created_date
+            FROM playbooks p {where}
+            ORDER BY p.created_at DESC
+            LIMIT ?
+            """,
+            (*params, limit)
+        ).fetchall()
+        return [{**dict(r), "timings": json.loads(r["timings"])} for r in rows]
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Full-text search over block titles and text, best match first.
+        """
+        conn = self._connect()
+
+        if self.fts:
+            # Quote every term so user input cannot inject FTS5 query syntax
+            terms = re.findall(r"\w+", query)
+            if not terms:
+                return []
+            match = " ".join(f'"{t}"' for t in terms)
+            rows = conn.execute(
+                """
+                SELECT b.playbook_id, b.block_index, b.title,
+                       snippet(block_text, 1, '[', ']', '...', 12) AS snippet,
+                       p.use_case, p.created_date
+                FROM block_text b JOIN playbooks p ON p.id = b.playbook_id
+                WHERE block_text MATCH ?
+                ORDER BY bm25(block_text)
+                LIMIT ?
+                """,
+                (match, limit)
+            ).fetchall()
+            return [dict(r) for r in rows]
+
+        results = []
+        for row in conn.execute("SELECT id, use_case, created_date, blocks FROM playbooks").fetchall():
+            for i, block in enumerate(json.loads(row["blocks"])):
+                text = " ".join(_strings(block))
+                if query.lower() in text.lower():
+                    results.append({
+                        "playbook_id": row["id"], "block_index": i, "title": block_title(block),
+                        "snippet": text[:160], "use_case": row["use_case"], "created_date": row["created_date"],
+                    })
+                    if len(results) == limit:
+                        return results
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        playbooks = conn.execute("SELECT COUNT(*) FROM playbooks").fetchone()[0]
+        use_cases = conn.execute("SELECT COUNT(DISTINCT use_case) FROM playbooks").fetchone()[0]
+        techniques = conn.execute("SELECT COUNT(DISTINCT technique) FROM playbook_techniques").fetchone()[0]
+        return {
+            "playbooks": playbooks,
+            "use_cases": use_cases,
+            "techniques": techniques,
+            "fts": self.fts,
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+# -----------------------------
+# Legacy SECTION A / SECTION B Import
+# -----------------------------
+def _legacy_use_case(filename: str, documentation: str) -> str:
+    stem = re.sub(r"^PB_", "", os.path.splitext(os.path.basename(filename))[0])
+    if not stem.startswith("generated") and stem not in ("latest", "blocks"):
+        return re.sub(r"_v\d+$", "", stem)
+
+    # Timestamped files carry the use case only in their documentation title
+    for line in documentation.splitlines()[:15]:
+        match = re.search(r"playbook(?: name)?\W*:\s*(.+)", line.strip("#* "), re.IGNORECASE)
+        if match:
+            title = re.sub(r"\s+response$", "", match.group(1).strip("*# "), flags=re.IGNORECASE)
+            return re.sub(r"[^A-Za-z0-9]+", "_", title).strip("_") or "unknown"
+    return "unknown"
+
+
+def _legacy_summary(documentation: str) -> str:
+    # First prose paragraph of the documentation (skipping headings / metadata)
+    for paragraph in re.split(r"\n\s*\n", documentation):
+        text = paragraph.strip()
+        if len(text) > 80 and not re.match(r"(?:[#*|-]|\d+\.)", text):
+            return text[:1000]
+    return ""
+
+
+def parse_legacy_text(text: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Parses agent.py output: SECTION A (JSON block array) and SECTION B
+    (free-text documentation). Returns (playbook, documentation).
+    """
+    blocks_text, _, documentation = text.partition(_DOCS_MARKER)
+    documentation = documentation.strip()
+
+    try:
+        blocks = extract_json_value(blocks_text, expected=(list, dict))
+    except JSONExtractionError as e:
+        raise ValueError(f"No SECTION A block array found: {e.reason}")
+    if isinstance(blocks, dict):
+        blocks = blocks.get("blocks", [])
+
+    return {"summary": _legacy_summary(documentation), "confidence": "", "blocks": blocks}, documentation
+
+
+def import_legacy_file(store: PlaybookStore, path: str, model: str = "legacy") -> Tuple[int, bool]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    playbook, documentation = parse_legacy_text(text)
+
+    match = _LEGACY_TIMESTAMP.search(os.path.basename(path))
+    created_at = (
+        datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+        if match else os.path.getmtime(path)
+    )
+
+    return store.save(
+        playbook,
+        use_case=_legacy_use_case(path, documentation),
+        model=model,
+        documentation=documentation,
+        source_path=os.path.relpath(path),
+        created_at=created_at,
+    )
+
+
+def import_legacy_dir(store: PlaybookStore, directory: str) -> Dict[str, int]:
+    counts = {"imported": 0, "duplicates": 0, "failed": 0}
+
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.startswith("PB_") or not name.endswith((".txt", ".json")) or not os.path.isfile(path):
+            continue
+        try:
+            _, created = import_legacy_file(store, path)
+        except (ValueError, OSError) as e:
+            counts["failed"] += 1
+            print(f"[FAIL] {name}: {e}", file=sys.stderr)
+            continue
+        counts["imported" if created else "duplicates"] += 1
+
+    return counts
+
+
+# -----------------------------
+# Process-wide Instance
+# -----------------------------
+_store: Optional[PlaybookStore] = None
+_store_lock = threading.Lock()
+
+
+def get_playbook_store() -> Optional[PlaybookStore]:
+    """
+    Returns the shared store, or None when PLAYBOOK_STORE_DISABLED is set.
+    """
+    global _store
+
+    if os.getenv("PLAYBOOK_STORE_DISABLED"):
+        return None
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PlaybookStore(os.getenv("PLAYBOOK_STORE_PATH", DEFAULT_STORE_PATH))
+    return _store
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Query and maintain the playbook store")
+    parser.add_argument("--path", default=os.getenv("PLAYBOOK_STORE_PATH", DEFAULT_STORE_PATH))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Import legacy SECTION A/B playbook files")
+    importer.add_argument("directory", nargs="?", default="playbooks")
+
+    search = commands.add_parser("search", help="Full-text search over block text")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+
+    find = commands.add_parser("find", help="Filter by use case / technique / date")
+    find.add_argument("--use-case")
+    find.add_argument("--technique")
+    find.add_argument("--since", help="YYYY-MM-DD")
+    find.add_argument("--until", help="YYYY-MM-DD")
+    find.add_argument("--limit", type=int, default=50)
+
+    show = commands.add_parser("show", help="Print one playbook as JSON")
+    show.add_argument("id", type=int)
+
+    commands.add_parser("stats")
+
+    args = parser.parse_args(argv)
+    store = PlaybookStore(args.path)
+
+    if args.command == "import":
+        result = import_legacy_dir(store, args.directory)
+    elif args.command == "search":
+        result = store.search(args.query, limit=args.limit)
+    elif args.command == "find":
+        result = store.find(args.use_case, args.technique, args.since, args.until, args.limit)
+    elif args.command == "show":
+        result = store.get(args.id)
+        if result is None:
+            print(f"No playbook with id {args.id}", file=sys.stderr)
+            return 1
+    else:
+        result = store.stats()
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Rerun-aware helpers for the Streamlit pages.
+
+Streamlit re-executes a page top to bottom on every widget interaction, so:
+- process-wide resources are built once, off the render path (warm_resources)
+- per-session derived artifacts are pinned to their input (session_memo)
+- pure, shareable artifacts go through a bounded LRU keyed by input hash (memoize)
+- track_rerun / render_debug_panel measure what each rerun costs
+- user_key identifies the user for per-user limits and fairness;
+  session_key identifies one browser session (tab)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import streamlit as st
+
+from core.startup import prewarm_stats
+from core.telemetry import record_duration
+
+
+# PLAYBOOK_DEBUG_PANEL=1 (or ?debug=1 in the URL) shows the rerun panel
+DEBUG_PANEL = os.getenv("PLAYBOOK_DEBUG_PANEL") == "1"
+
+# Sessions not seen for this long no longer count as active
+SESSION_IDLE_SECONDS = 600
+
+# PLAYBOOK_USER_KEY_FROM_IP=1 keys anonymous users on their client address (see user_key)
+USER_KEY_FROM_IP = os.getenv("PLAYBOOK_USER_KEY_FROM_IP") == "1"
+
+
+# -------------------------------------------------
+# Process-wide Resources
+# -------------------------------------------------
+def warm_resources() -> Dict[str, Any]:
+    """
+    Starts loading the deferred dependencies and building the shared,
+    process-wide objects in the background (core.startup.prewarm), once
+    per process. Call it at the end of a page so the first paint never
+    waits on it; a request that arrives first just builds what it needs.
+    """
+    from core.startup import prewarm
+
+    return prewarm()
+
+
+# -------------------------------------------------
+# Bounded Memoization (shared across sessions)
+# -------------------------------------------------
+def input_hash(*args: Any, **kwargs: Any) -> str:
+    hasher = hashlib.sha256()
+    for value in (*args, *sorted(kwargs.items())):
+        if isinstance(value, (bytes, bytearray)):
+            hasher.update(value)
+        else:
+            hasher.update(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()
+
+
+class _LRU:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+_memo_caches: Dict[str, _LRU] = {}
+_MISSING = object()
+
+
+def memoize(maxsize: int = 128) -> Callable:
+    """
+    Process-wide LRU for pure functions of JSON-serializable / bytes
+    arguments. Results are shared by every session, so treat them as
+    read-only.
+    """
+    def decorator(fn: Callable) -> Callable:
+        cache = _memo_caches.setdefault(f"{fn.__module__}.{fn.__qualname__}", _LRU(maxsize))
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = input_hash(*args, **kwargs)
+            result = cache.get(key, _MISSING)
+            if result is _MISSING:
+                result = fn(*args, **kwargs)
+                cache.put(key, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def session_memo(name: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+    """
+    Per-session pin: returns the value computed for `key` on an earlier
+    rerun, recomputing only when `key` changes (e.g. a new upload's
+    file_id or a new playbook result). Costs no hashing on reruns.
+    """
+    slot_name = f"_memo_{name}"
+    slot = st.session_state.get(slot_name)
+    if slot is None or slot[0] != key:
+        slot = (key, compute())
+        st.session_state[slot_name] = slot
+    return slot[1]
+
+
+# -------------------------------------------------
+# Rerun Tracking
+# -------------------------------------------------
+_process_lock = threading.Lock()
+_process = {"reruns": 0}
+_sessions: Dict[str, float] = {}
+
+
+def _session_id() -> Optional[str]:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def session_key() -> str:
+    """This browser session: stable across its reruns, distinct per tab."""
+    return _session_id() or "anonymous"
+
+
+def user_key(by_ip: bool = USER_KEY_FROM_IP) -> str:
+    """
+    Fairness / admission key: the signed-in user, else the browser session
+    (or the client address when `by_ip`, see PLAYBOOK_USER_KEY_FROM_IP).
+
+    Keying on the address is off by default and never used for the answer
+    engine's budgets: behind NAT or a proxy a whole office shares one
+    address, and so would share one key.
+    """
+    if st.user.get("email"):
+        return st.user["email"]
+    if by_ip and st.context.ip_address:
+        return st.context.ip_address
+    return session_key()
+
+
+def track_rerun(page: str) -> None:
+    """Call first thing on a page; render_debug_panel() closes the measurement."""
+    now = time.time()
+    st.session_state["_rerun_started"] = (page, time.perf_counter())
+
+    session_id = _session_id()
+    with _process_lock:
+        _process["reruns"] += 1
+        if session_id is not None:
+            _sessions[session_id] = now
+        for sid in [s for s, seen in _sessions.items() if now - seen > SESSION_IDLE_SECONDS]:
+            del _sessions[sid]
+
+
+def _finish_rerun() -> Optional[Dict[str, Any]]:
+    started = st.session_state.pop("_rerun_started", None)
+    if started is None:
+        return None
+
+    page, t0 = started
+    elapsed = time.perf_counter() - t0
+    record_duration(f"rerun_{page}", elapsed)
+
+    history = st.session_state.setdefault("_rerun_history", {}).setdefault(page, deque(maxlen=100))
+    history.append(elapsed)
+    counts = st.session_state.setdefault("_rerun_counts", {})
+    counts[page] = counts.get(page, 0) + 1
+
+    ordered = sorted(history)
+    return {
+        "page": page,
+        "reruns_this_session": counts[page],
+        "this_rerun_ms": round(elapsed * 1000, 2),
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * (len(ordered) - 1) + 0.5))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def process_stats() -> Dict[str, Any]:
+    with _process_lock:
+        return {
+            "reruns_total": _process["reruns"],
+            "active_sessions": len(_sessions),
+            "memo_caches": {name: cache.stats() for name, cache in _memo_caches.items()},
+            "prewarm": prewarm_stats(),
+        }
+
+
+def render_debug_panel() -> None:
+    """
+    Call last on a page. Records this rerun's duration (always) and shows
+    the panel when PLAYBOOK_DEBUG_PANEL=1 or the URL has ?debug=1.
+    """
+    current = _finish_rerun()
+
+    if not (DEBUG_PANEL or st.query_params.get("debug") == "1"):
+        return
+
+    with st.sidebar.expander("Rerun debug", expanded=True):
+        if current is not None:
+            st.metric("Reruns (this session)", current["reruns_this_session"])
+            st.metric("This rerun", f"{current['this_rerun_ms']:.1f} ms")
+            st.json(current)
+        st.json(process_stats())
@@ -0,0 +1,499 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.telemetry import record_event
+
+
+# -----------------------------
+# Errors
+# -----------------------------
+class MalformedResponseError(RuntimeError):
+    """Model answered, but not with a usable playbook (empty / bad JSON)."""
+
+
+class DeadlineExceeded(RuntimeError):
+    """The per-request deadline ran out before a usable answer arrived."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Upstream is considered degraded; the call was rejected without trying."""
+
+
+class UpstreamUnavailableError(RuntimeError):
+    """A backend could not reach its provider (connection / timeout)."""
+
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """
+    Throttling, server errors and transport problems: worth retrying and
+    counted against the circuit breaker.
+    """
+    # Looked up, not imported: an SDK that was never loaded cannot have raised,
+    # and importing google.genai here would put it on every page's cold start
+    genai_errors = sys.modules.get("google.genai.errors")
+    if genai_errors is not None and isinstance(exc, genai_errors.APIError):
+        return exc.code in RETRYABLE_STATUS_CODES
+
+    # Other provider SDKs (e.g. groq) expose the HTTP status as `status_code`
+    status_code = getattr(exc, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_STATUS_CODES
+
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return isinstance(exc, UpstreamUnavailableError)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return is_upstream_failure(exc) or isinstance(exc, MalformedResponseError)
+
+
+# -----------------------------
+# Deadline
+# -----------------------------
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def remaining_ms(self) -> int:
+        return int(self.remaining() * 1000)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+# -----------------------------
+# Retry Policy
+# -----------------------------
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter:
+    sleep = uniform(0, min(max_delay, base_delay * multiplier ** attempt))
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        multiplier: float = 2.0
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def backoff(self, attempt: int) -> float:
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** attempt))
+        return random.uniform(0, ceiling)
+
+
+# -----------------------------
+# Circuit Breaker
+# -----------------------------
+class CircuitBreaker:
+    """
+    closed    -> calls flow; consecutive upstream failures are counted
+    open      -> calls fail fast until `recovery_timeout` has passed
+    half_open -> one trial call; success closes, failure re-opens, and a
+                 trial that ends any other way (cancelled, interrupted)
+                 is abandoned so the next call can try
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        self._counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "rejected": 0,
+            "opened": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Raises CircuitOpenError, or admits the call; True when it is the half-open trial."""
+        with self._lock:
+            state = self._current_state()
+
+            if state == self.OPEN or (state == self.HALF_OPEN and self._trial_in_flight):
+                self._counters["rejected"] += 1
+                raise CircuitOpenError(f"Circuit '{self.name}' is open; upstream degraded")
+
+            self._counters["calls"] += 1
+            if state == self.HALF_OPEN:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def abandon_trial(self) -> None:
+        """The trial call ended without an outcome; let another call try."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._counters["successes"] += 1
+            self._consecutive_failures = 0
+            self._state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._counters["failures"] += 1
+            self._consecutive_failures += 1
+
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._counters["opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures,
+                **self._counters,
+            }
+
+
+# -----------------------------
+# Rate Limiter
+# -----------------------------
+class RateLimiter:
+    """
+    Token buckets refilled continuously: each key may make `per_key` calls
+    per `period` seconds and all keys together `total` calls per period.
+    A rejected call spends nothing.
+    """
+
+    # Idle (full) per-key buckets are dropped once there are this many
+    MAX_KEYS = 10_000
+
+    def __init__(self, name: str, per_key: float, total: float, period: float = 60.0):
+        self.name = name
+        self.per_key = per_key
+        self.total = total
+        self.period = period
+
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._global = (total, time.monotonic())
+        self._counters = {"allowed": 0, "rejected": 0}
+
+    @staticmethod
+    def _refill(bucket: Tuple[float, float], capacity: float, period: float, now: float) -> float:
+        tokens, updated = bucket
+        return min(capacity, tokens + (now - updated) * capacity / period)
+
+    def try_acquire(self, key: str) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            own = self._refill(self._buckets.get(key, (self.per_key, now)), self.per_key, self.period, now)
+            shared = self._refill(self._global, self.total, self.period, now)
+
+            if own < 1 or shared < 1:
+                self._counters["rejected"] += 1
+                record_event(f"{self.name}_rate_limited")
+                return False
+
+            if len(self._buckets) >= self.MAX_KEYS:
+                self._buckets = {
+                    k: b for k, b in self._buckets.items()
+                    if self._refill(b, self.per_key, self.period, now) < self.per_key
+                }
+            self._buckets[key] = (own - 1, now)
+            self._global = (shared - 1, now)
+            self._counters["allowed"] += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "per_key": self.per_key,
+                "total": self.total,
+                "period_seconds": self.period,
+                "keys": len(self._buckets),
+                **self._counters,
+            }
+
+
+# -----------------------------
+# Single-flight (request coalescing)
+# -----------------------------
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first
+    caller (the leader) runs it, everyone who arrives while it is in
+    flight waits for and receives the same result or exception.
+
+    Works from threads (do) and coroutines (do_async); both wait on the
+    same concurrent.futures.Future, so a thread and a coroutine asking for
+    the same key coalesce too. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._counters = {"leaders": 0, "coalesced": 0}
+
+    def join(self, key: str) -> Tuple[Future, bool]:
+        """(future, is_leader). A leader must finish the call with complete()."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self._in_flight[key] = future
+            self._counters["leaders" if leader else "coalesced"] += 1
+
+        record_event(f"{self.name}_{'leaders' if leader else 'coalesced'}")
+        return future, leader
+
+    def complete(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _lead(self, key: str, future: Future, fn: Callable[[], Any]) -> None:
+        try:
+            result = fn()
+        except BaseException as e:
+            self.complete(key, future, error=e)
+        else:
+            self.complete(key, future, result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        future, leader = self.join(key)
+        if leader:
+            self._lead(key, future, fn)
+        return future.result()
+
+    async def do_async(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        The leader runs the (blocking) fn in the default executor. Waiters
+        are shielded: cancelling one caller never cancels the shared call.
+        """
+        future, leader = self.join(key)
+        if leader:
+            asyncio.get_running_loop().run_in_executor(None, self._lead, key, future, fn)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"name": self.name, "in_flight": len(self._in_flight), **self._counters}
+
+
+# -----------------------------
+# Retry Counters
+# -----------------------------
+_retry_lock = threading.Lock()
+_retry_counters = {"attempts": 0, "retries": 0, "deadline_exceeded": 0, "gave_up": 0}
+
+
+def _count(name: str) -> None:
+    with _retry_lock:
+        _retry_counters[name] += 1
+
+
+def retry_stats() -> Dict[str, int]:
+    with _retry_lock:
+        return dict(_retry_counters)
+
+
+# -----------------------------
+# Resilient Call
+# -----------------------------
+def _failed_attempt(
+    e: Exception,
+    attempt: int,
+    policy: RetryPolicy,
+    deadline: Deadline,
+    breaker: Optional[CircuitBreaker]
+) -> Tuple[Optional[float], bool]:
+    """
+    Books a failed attempt. Returns (backoff before the next attempt or
+    None to stop, whether the deadline is what stopped it); re-raises
+    errors that are not worth retrying.
+    """
+    if breaker is not None:
+        if is_upstream_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    if not is_retryable(e):
+        raise e
+
+    if attempt + 1 >= policy.max_attempts:
+        return None, False
+
+    delay = policy.backoff(attempt)
+    if delay >= deadline.remaining():
+        return None, True
+
+    _count("retries")
+    return delay, False
+
+
+def _give_up(deadline: Deadline, last_error: Optional[BaseException], out_of_time: bool) -> BaseException:
+    if out_of_time or last_error is None:
+        _count("deadline_exceeded")
+        return DeadlineExceeded(
+            f"Deadline of {deadline.seconds:.0f}s exceeded"
+            + (f" (last error: {last_error})" if last_error else "")
+        )
+
+    _count("gave_up")
+    return last_error
+
+
+def call_with_retries(
+    fn: Callable[[int], Any],
+    policy: RetryPolicy,
+    deadline: Deadline,
+    breaker: Optional[CircuitBreaker] = None,
+    sleep: Callable[[float], None] = time.sleep
+) -> Any:
+    """
+    Calls `fn(timeout_ms)` until it succeeds, a non-retryable error is
+    raised, attempts run out or the deadline passes. `timeout_ms` is the
+    remaining deadline so the SDK never waits past it.
+    """
+    last_error: Optional[BaseException] = None
+    out_of_time = False
+
+    for attempt in range(policy.max_attempts):
+        if deadline.expired:
+            out_of_time = True
+            break
+
+        trial = breaker is not None and breaker.allow()
+
+        _count("attempts")
+
+        try:
+            result = fn(max(1, deadline.remaining_ms()))
+        except Exception as e:
+            last_error = e
+            delay, out_of_time = _failed_attempt(e, attempt, policy, deadline, breaker)
+            if delay is None:
+                break
+            sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled / interrupted: no verdict on upstream health
+            if trial:
+                breaker.abandon_trial()
+            raise
+
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+    raise _give_up(deadline, last_error, out_of_time)
+
+
+async def call_with_retries_async(
+    fn: Callable[[int], Awaitable[Any]],
+    policy: RetryPolicy,
+    deadline: Deadline,
+    breaker: Optional[CircuitBreaker] = None
+) -> Any:
+    """call_with_retries for a coroutine function; backs off without blocking the loop."""
+    last_error: Optional[BaseException] = None
+    out_of_time = False
+
+    for attempt in range(policy.max_attempts):
+        if deadline.expired:
+            out_of_time = True
+            break
+
+        trial = breaker is not None and breaker.allow()
+
+        _count("attempts")
+
+        try:
+            result = await fn(max(1, deadline.remaining_ms()))
+        except Exception as e:
+            last_error = e
+            delay, out_of_time = _failed_attempt(e, attempt, policy, deadline, breaker)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled / interrupted: no verdict on upstream health
+            if trial:
+                breaker.abandon_trial()
+            raise
+
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+    raise _give_up(deadline, last_error, out_of_time)
+
+
+# -----------------------------
+# Defaults (overridable via env)
+# -----------------------------
+def default_retry_policy() -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=int(os.getenv("PLAYBOOK_RETRY_ATTEMPTS", 4)),
+        base_delay=float(os.getenv("PLAYBOOK_RETRY_BASE_DELAY", 0.5)),
+        max_delay=float(os.getenv("PLAYBOOK_RETRY_MAX_DELAY", 8.0)),
+    )
+
+
+def default_deadline_seconds() -> float:
+    return float(os.getenv("PLAYBOOK_DEADLINE_SECONDS", 90))
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+
+# -----------------------------
+# Defaults (overridable via env)
+# -----------------------------
+# Anchored at the repo root: the CLI, the pages and the benchmarks share one cache
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(ROOT, ".cache", "playbook_responses.sqlite3")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+# -----------------------------
+# Cache Key
+# -----------------------------
+def make_cache_key(prompt: str, model: str, mode: str, depth: str) -> str:
+    """
+    Content-addressed key: identical prompt + model + mode + depth
+    always maps to the same entry, regardless of which process asks.
+    """
+    hasher = hashlib.sha256()
+    for part in (model, mode, depth, prompt):
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()
+
+
+# -----------------------------
+# Disk-backed LRU + TTL Cache
+# -----------------------------
+class ResponseCache:
+    """
+    SQLite-backed response cache shared by every Streamlit worker process.
+
+    - Entries expire after `ttl_seconds`
+    - Total stored payload is bounded by `max_bytes` (least recently used evicted first)
+    - Hit / miss / eviction counters are persisted alongside the entries
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+                """
+            )
+
+    # One connection per thread; SQLite handles cross-process locking
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _bump(self, conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        conn.execute(
+            """
+            INSERT INTO counters (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+            """,
+            (name, amount)
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        now = time.time()
+
+        with conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+            if row is None:
+                self._bump(conn, "misses")
+                return None
+
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._bump(conn, "misses")
+                self._bump(conn, "expired")
+                return None
+
+            conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                (now, key)
+            )
+            self._bump(conn, "hits")
+
+        return json.loads(value)
+
+    def set(self, key: str, data: Dict[str, Any]) -> None:
+        value = json.dumps(data, ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        conn = self._connect()
+        now = time.time()
+
+        with conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, value, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute(
+            "DELETE FROM entries WHERE created_at < ?",
+            (now - self.ttl_seconds,)
+        ).rowcount
+        if expired:
+            self._bump(conn, "expired", expired)
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+
+        if evicted:
+            self._bump(conn, "evictions", evicted)
+
+    def clear(self) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM counters")
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+
+        return {
+            "hits": hits,
+            "misses": misses,
+            "expired": counters.get("expired", 0),
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# -----------------------------
+# Process-wide Instance
+# -----------------------------
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Returns the shared cache, or None when PLAYBOOK_CACHE_DISABLED is set.
+    """
+    global _cache
+
+    if os.getenv("PLAYBOOK_CACHE_DISABLED"):
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    path=os.getenv("PLAYBOOK_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    max_bytes=int(os.getenv("PLAYBOOK_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                    ttl_seconds=float(os.getenv("PLAYBOOK_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+                )
+    return _cache
@@ -0,0 +1,403 @@
+import os
+import re
+import glob
+import json
+import math
+import time
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.json_extractor import JSONExtractionError, extract_json_value
+from core.telemetry import record_size, span
+from core.token_budget import estimate_tokens
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -------------------------------------------------
+# Configuration (env)
+# -------------------------------------------------
+# PLAYBOOK_RETRIEVAL_DISABLED=1        prompts carry no reference context
+# PLAYBOOK_RETRIEVAL_TOP_K=<n>         max chunks injected per prompt
+# PLAYBOOK_RETRIEVAL_TOKEN_BUDGET=<n>  max (estimated) tokens of injected context
+# PLAYBOOK_RETRIEVAL_INDEX_PATH=<file> where the precomputed index is persisted
+# PLAYBOOK_RETRIEVAL_RECHECK_SECONDS=<n> how stale an in-place source edit may go unnoticed
+DEFAULT_TOP_K = int(os.getenv("PLAYBOOK_RETRIEVAL_TOP_K", 4))
+DEFAULT_TOKEN_BUDGET = int(os.getenv("PLAYBOOK_RETRIEVAL_TOKEN_BUDGET", 800))
+DEFAULT_INDEX_PATH = os.path.join(ROOT, ".cache", "retrieval_index.json")
+RECHECK_SECONDS = float(os.getenv("PLAYBOOK_RETRIEVAL_RECHECK_SECONDS", 30))
+
+SOURCE_PATTERNS = (
+    "reference_*.txt",
+    os.path.join("learning", "*.md"),
+    os.path.join("playbooks", "*.txt"),
+    os.path.join("playbooks", "*.json"),
+)
+
+CHUNK_MAX_CHARS = 1_000
+# Only the head of very large alerts / IRPs is used as the query
+QUERY_MAX_CHARS = 8_000
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+INDEX_VERSION = 1
+
+
+# -------------------------------------------------
+# Tokenization
+# -------------------------------------------------
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9_]+")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have if in into is it its of on or
+that the their this to was were will with within not no can should must
+may any all each per via than then them they these those been being
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+# -------------------------------------------------
+# Corpus Chunking
+# -------------------------------------------------
+def _windows(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    pieces: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > max_chars:
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _chunk_tagged(text: str) -> List[Tuple[str, str]]:
+    # reference_chunks.txt / reference_index.txt: "[TAG]" headed sections
+    parts = re.split(r"^\[([A-Z0-9_]+)\]\s*$", text, flags=re.MULTILINE)
+    if len(parts) == 1:
+        return [("", w) for w in _windows(text)]
+    return [(tag, body.strip()) for tag, body in zip(parts[1::2], parts[2::2]) if body.strip()]
+
+
+def _chunk_markdown(text: str) -> List[Tuple[str, str]]:
+    chunks = []
+    for section in re.split(r"^(?=#{1,3} )", text, flags=re.MULTILINE):
+        first_line = section.strip().splitlines()[0] if section.strip() else ""
+        heading = first_line.lstrip("#").strip() if first_line.startswith("#") else ""
+        for window in _windows(section):
+            chunks.append((heading, window))
+    return chunks
+
+
+def _describe_block(block: Dict[str, Any]) -> str:
+    fields = ("block_name", "title", "type", "purpose", "description", "failure_handling", "analyst_notes")
+    return "\n".join(f"{f}: {block[f]}" for f in fields if isinstance(block.get(f), str) and block[f].strip())
+
+
+def _chunk_playbook(text: str) -> List[Tuple[str, str]]:
+    # Legacy playbook files: SECTION A is a JSON block array, SECTION B free text
+    blocks_text, _, docs = text.partition("SECTION B: DOCUMENTATION_TEXT")
+    chunks: List[Tuple[str, str]] = []
+
+    try:
+        blocks = extract_json_value(blocks_text, expected=(list, dict))
+    except JSONExtractionError:
+        blocks = None
+    if isinstance(blocks, dict):
+        blocks = blocks.get("blocks")
+
+    if isinstance(blocks, list):
+        for block in blocks:
+            if isinstance(block, dict):
+                described = _describe_block(block)
+                if described:
+                    chunks.append((str(block.get("block_name") or block.get("title") or "block"), described))
+    else:
+        docs = text
+
+    chunks.extend(("documentation", w) for w in _windows(docs))
+    return chunks
+
+
+def chunk_file(path: str) -> List[Tuple[str, str]]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+
+    name = os.path.basename(path)
+    if name.endswith(".md"):
+        return _chunk_markdown(text)
+    if name.startswith("reference_"):
+        return _chunk_tagged(text)
+    return _chunk_playbook(text)
+
+
+def source_files(root: str = ROOT) -> List[str]:
+    paths: List[str] = []
+    for pattern in SOURCE_PATTERNS:
+        paths.extend(sorted(glob.glob(os.path.join(root, pattern))))
+    return paths
+
+
+def _source_dirs(root: str = ROOT) -> List[str]:
+    return sorted({os.path.dirname(os.path.join(root, pattern)) for pattern in SOURCE_PATTERNS})
+
+
+def _fingerprint(paths: Iterable[str]) -> str:
+    digest = hashlib.sha256(str(INDEX_VERSION).encode())
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Removed since the glob; the next check sees the directory change
+            continue
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    return digest.hexdigest()
+
+
+# -------------------------------------------------
+# BM25 Inverted Index
+# -------------------------------------------------
+class RetrievalIndex:
+    """
+    Okapi BM25 over reference, learning and past-playbook chunks.
+
+    postings: term -> [[chunk_id, term_frequency], ...]
+    """
+
+    def __init__(
+        self,
+        chunks: List[Dict[str, Any]],
+        postings: Dict[str, List[List[int]]],
+        lengths: List[int],
+        fingerprint: str = ""
+    ):
+        self.chunks = chunks
+        self.postings = postings
+        self.lengths = lengths
+        # Identifies the source files (and INDEX_VERSION) the index was built from
+        self.fingerprint = fingerprint
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    @classmethod
+    def build(cls, paths: Iterable[str], root: str = ROOT) -> "RetrievalIndex":
+        chunks: List[Dict[str, Any]] = []
+        postings: Dict[str, List[List[int]]] = {}
+        lengths: List[int] = []
+        seen = set()
+
+        for path in paths:
+            source = os.path.relpath(path, root)
+            for heading, text in chunk_file(path):
+                # Past playbooks repeat many blocks verbatim
+                key = hashlib.sha1(" ".join(text.lower().split()).encode()).hexdigest()
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                terms = Counter(tokenize(f"{heading} {text}"))
+                if not terms:
+                    continue
+
+                chunk_id = len(chunks)
+                chunks.append({"source": source, "heading": heading, "text": text})
+                lengths.append(sum(terms.values()))
+                for term, tf in terms.items():
+                    postings.setdefault(term, []).append([chunk_id, tf])
+
+        return cls(chunks, postings, lengths)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"chunks": self.chunks, "postings": self.postings, "lengths": self.lengths}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RetrievalIndex":
+        return cls(data["chunks"], data["postings"], data["lengths"])
+
+    def search(
+        self,
+        query: str,
+        k: int = DEFAULT_TOP_K,
+        sources: Optional[Iterable[str]] = None
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """Top-k (score, chunk) pairs; `sources` restricts results to those files."""
+        terms = set(tokenize(query[:QUERY_MAX_CHARS]))
+        n = len(self.chunks)
+        scores: Dict[int, float] = {}
+
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk_id] / self.avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        if sources is not None:
+            allowed = frozenset(sources)
+            scores = {chunk_id: score for chunk_id, score in scores.items() if self.chunks[chunk_id]["source"] in allowed}
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"chunks": len(self.chunks), "terms": len(self.postings), "avg_chunk_terms": round(self.avg_length, 1)}
+
+
+# -------------------------------------------------
+# Process-wide Index (rebuilt when its sources change)
+# -------------------------------------------------
+_index: Optional[RetrievalIndex] = None
+_index_lock = threading.Lock()
+# (source directory mtimes, monotonic time of the last full fingerprint)
+_checked: Tuple[Optional[tuple], float] = (None, 0.0)
+
+
+def _load_or_build(path: str, paths: List[str], fingerprint: str) -> RetrievalIndex:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("fingerprint") == fingerprint:
+            index = RetrievalIndex.from_dict(data)
+            index.fingerprint = fingerprint
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = RetrievalIndex.build(paths)
+    index.fingerprint = fingerprint
+
+    # Persisting is best-effort: a read-only checkout still works from memory
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, **index.to_dict()}, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+    return index
+
+
+def get_retrieval_index() -> Optional[RetrievalIndex]:
+    """
+    The index over the current source files. Adding or removing one
+    changes its directory's mtime and is picked up on the next call;
+    in-place edits are caught by a full fingerprint every RECHECK_SECONDS.
+    """
+    global _index, _checked
+
+    if os.getenv("PLAYBOOK_RETRIEVAL_DISABLED"):
+        return None
+
+    stamp = tuple(os.path.getmtime(d) if os.path.isdir(d) else None for d in _source_dirs())
+    if _index is not None and _checked[0] == stamp and time.monotonic() - _checked[1] < RECHECK_SECONDS:
+        return _index
+
+    with _index_lock:
+        if _index is not None and _checked[0] == stamp and time.monotonic() - _checked[1] < RECHECK_SECONDS:
+            return _index
+
+        paths = source_files()
+        fingerprint = _fingerprint(paths)
+        if _index is None or _index.fingerprint != fingerprint:
+            with span("retrieval_index_load"):
+                _index = _load_or_build(
+                    os.getenv("PLAYBOOK_RETRIEVAL_INDEX_PATH", DEFAULT_INDEX_PATH), paths, fingerprint
+                )
+        _checked = (stamp, time.monotonic())
+        return _index
+
+
+# -------------------------------------------------
+# Prompt Context
+# -------------------------------------------------
+def retrieve(
+    query: str,
+    k: int = DEFAULT_TOP_K,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    exclude_sources: Iterable[str] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Top-k chunks for `query` that fit together in `token_budget`, skipping
+    chunks from `exclude_sources` (files the prompt already includes whole).
+    """
+    excluded = frozenset(exclude_sources)
+    index = get_retrieval_index()
+    if index is None or k <= 0 or token_budget <= 0:
+        return []
+
+    with span("retrieval_search") as s:
+        # Over-fetch so a chunk too large for the remaining budget can be skipped
+        hits = index.search(query, k=k * 3)
+        selected = []
+        used = 0
+        for score, chunk in hits:
+            if chunk["source"] in excluded:
+                continue
+            cost = estimate_tokens(chunk["text"])
+            if used + cost > token_budget:
+                continue
+            selected.append({**chunk, "score": round(score, 3)})
+            used += cost
+            if len(selected) == k:
+                break
+        s.set("hits", len(selected))
+        s.set("tokens", used)
+
+    return selected
+
+
+def format_context(hits: List[Dict[str, Any]]) -> str:
+    parts = []
+    for hit in hits:
+        label = hit["source"] + (f" | {hit['heading']}" if hit["heading"] else "")
+        parts.append(f"[{label}]\n{hit['text']}")
+    return "\n\n".join(parts)
+
+
+def reference_context(
+    query: str,
+    k: int = DEFAULT_TOP_K,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    exclude_sources: Iterable[str] = ()
+) -> str:
+    """
+    Prompt section with the reference material most relevant to `query`,
+    or "" when retrieval is disabled or nothing matches.
+    """
+    hits = retrieve(query, k=k, token_budget=token_budget, exclude_sources=exclude_sources)
+    if not hits:
+        return ""
+
+    context = format_context(hits)
+    record_size("retrieved_context", len(context))
+    return (
+        "Reference Context (retrieved from the SOC knowledge base; use where relevant, do not copy verbatim):\n"
+        f"{context}\n\n"
+    )
+
+
+def retrieval_version() -> str:
+    """Changes whenever retrieved context could: the index's source files, or retrieval being switched off."""
+    index = get_retrieval_index()
+    return index.fingerprint[:16] if index is not None else "off"
+
+
+def retrieval_stats() -> Dict[str, Any]:
+    index = get_retrieval_index()
+    return index.stats() if index is not None else {"enabled": False}
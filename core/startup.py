@@ -0,0 +1,206 @@
+"""
+Cold-start helpers.
+
+Heavy dependencies (google.genai, httpx, pydantic, PyPDF2, docx, groq) are
+imported where they are first used, so a fresh worker renders its first
+page without paying for them. What is left to pay happens here:
+
+- prewarm():       imports them and builds the shared, process-wide
+                   objects in a background thread, once per process.
+                   Servers that fork workers should call it from the
+                   post-fork hook (clients and sockets must not cross a fork)
+- import_report(): per-module import timings (python -X importtime) for
+                   any module, e.g. "core.playbook_engine"
+
+    python -m core.startup                       # report for the page modules
+    python -m core.startup agent --top 10
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional, Sequence
+
+
+# PLAYBOOK_PREWARM=0 leaves everything to first use
+PREWARM_ENABLED = os.getenv("PLAYBOOK_PREWARM", "1") != "0"
+
+# Deferred at import time, loaded by prewarm(); missing optional ones are skipped
+HEAVY_IMPORTS = (
+    "httpx",
+    "google.genai",
+    "pydantic",
+    "core.playbook_schema",
+    "PyPDF2",
+    "docx",
+    "groq",
+)
+
+# What the Streamlit pages and the CLI import before their first output
+PAGE_MODULES = (
+    "streamlit",
+    "core.rerun",
+    "core.playbook_engine",
+    "core.irp_pipeline",
+    "core.jobs",
+    "core.document_extraction",
+    "core.diagram_render",
+    "agent",
+)
+
+
+# -------------------------------------------------
+# Pre-warm
+# -------------------------------------------------
+_prewarm_lock = threading.Lock()
+_prewarm_thread: Optional[threading.Thread] = None
+_prewarm_stats: Dict[str, Any] = {"state": "idle"}
+
+
+def _timed_import(name: str) -> Optional[float]:
+    import importlib
+
+    started = time.perf_counter()
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        return None
+    return round(time.perf_counter() - started, 4)
+
+
+def _prewarm() -> None:
+    from core.answer_engine import get_answer_engine
+    from core.llm_backends import get_backend
+    from core.playbook_store import get_playbook_store
+    from core.response_cache import get_response_cache
+    from core.retrieval import get_retrieval_index
+    from core.telemetry import record_duration
+
+    started = time.perf_counter()
+    imports = {name: _timed_import(name) for name in HEAVY_IMPORTS}
+
+    backend = get_backend()
+    get_retrieval_index()
+    get_answer_engine()
+    get_response_cache()
+    get_playbook_store()
+
+    # The pooled client (httpx pool + SDK client) only when it can be built
+    if os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"):
+        from core.gemini_client import get_gemini_client
+        get_gemini_client()
+
+    elapsed = time.perf_counter() - started
+    record_duration("prewarm", elapsed)
+    _prewarm_stats.update(
+        state="done",
+        backend=backend.name,
+        seconds=round(elapsed, 3),
+        imports_seconds={name: seconds for name, seconds in imports.items() if seconds is not None},
+    )
+
+
+def _run_prewarm() -> None:
+    try:
+        _prewarm()
+    except Exception as e:
+        # Whatever failed here fails again, visibly, on first use
+        _prewarm_stats.update(state="failed", error=str(e) or type(e).__name__)
+
+
+def prewarm(background: bool = True) -> Dict[str, Any]:
+    """
+    Loads the deferred dependencies and shared resources once per process.
+    Returns immediately when `background` (the default); safe to call from
+    every page and from a server's post-fork hook.
+    """
+    global _prewarm_thread
+
+    if not PREWARM_ENABLED:
+        return {"state": "disabled"}
+
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_stats["state"] = "running"
+            _prewarm_thread = threading.Thread(target=_run_prewarm, name="playbook-prewarm", daemon=True)
+            _prewarm_thread.start()
+        thread = _prewarm_thread
+
+    if not background:
+        thread.join()
+    return prewarm_stats()
+
+
+def prewarm_stats() -> Dict[str, Any]:
+    return dict(_prewarm_stats)
+
+
+# -------------------------------------------------
+# Import Timing Report
+# -------------------------------------------------
+def import_report(module: str, top: int = 15) -> Dict[str, Any]:
+    """
+    Imports `module` in a fresh interpreter under -X importtime and returns
+    its total import time plus the `top` costliest modules it pulled in
+    (cumulative milliseconds, nested imports included).
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PLAYBOOK_PREWARM": "0"},
+    )
+    wall = time.perf_counter() - started
+
+    rows: List[Dict[str, Any]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+
+    total = next((row["cumulative_ms"] for row in rows if row["module"] == module), None)
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "import_ms": total,
+        "process_ms": round(wall * 1000, 1),
+        "heavy_loaded": sorted({row["module"] for row in rows} & set(HEAVY_IMPORTS)),
+        "top": sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top],
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    status = "" if report["ok"] else "  (import failed)"
+    print(f"{report['module']}: {report['import_ms'] or 0:.1f} ms import, "
+          f"{report['process_ms']:.1f} ms process{status}")
+    print(f"  heavy dependencies loaded: {', '.join(report['heavy_loaded']) or 'none'}")
+    for row in report["top"]:
+        print(f"  {row['cumulative_ms']:9.1f} ms  {'  ' * row['depth']}{row['module']}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-module import timings for a cold start")
+    parser.add_argument("modules", nargs="*", default=list(PAGE_MODULES))
+    parser.add_argument("--top", type=int, default=10, help="Costliest modules to list per report")
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        _print_report(import_report(module, top=args.top))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
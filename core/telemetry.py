@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# -----------------------------
+# Configuration (env)
+# -----------------------------
+# PLAYBOOK_TELEMETRY=0        disable all instrumentation (spans become no-ops)
+# PLAYBOOK_TRACE_PATH=<file>  append one JSONL record per finished trace
+# PLAYBOOK_METRICS_PORT=<n>   serve Prometheus text on http://0.0.0.0:<n>/metrics
+ENABLED = os.getenv("PLAYBOOK_TELEMETRY", "1") != "0"
+TRACE_PATH = os.getenv("PLAYBOOK_TRACE_PATH")
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (256, 1_024, 4_096, 16_384, 32_768, 65_536, 131_072, 262_144, 1_048_576)
+
+
+# -----------------------------
+# Metric Registry
+# -----------------------------
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (stage,) -> [bucket counts..., sum, count]
+        self.durations: Dict[str, List[float]] = {}
+        # (kind,) -> [bucket counts..., sum, count]
+        self.sizes: Dict[str, List[float]] = {}
+        # (backend, model, direction) -> total
+        self.tokens: Dict[Tuple[str, str, str], int] = {}
+        # event -> total
+        self.events: Dict[str, int] = {}
+
+    def observe_duration(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            row = self.durations.get(stage)
+            if row is None:
+                row = self.durations[stage] = [0] * (len(DURATION_BUCKETS) + 2)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += seconds
+            row[-1] += 1
+
+    def observe_size(self, kind: str, chars: int) -> None:
+        with self._lock:
+            row = self.sizes.get(kind)
+            if row is None:
+                row = self.sizes[kind] = [0] * (len(SIZE_BUCKETS) + 2)
+            for i, bound in enumerate(SIZE_BUCKETS):
+                if chars <= bound:
+                    row[i] += 1
+            row[-2] += chars
+            row[-1] += 1
+
+    def add_tokens(self, backend: str, model: str, direction: str, count: int) -> None:
+        with self._lock:
+            key = (backend, model, direction)
+            self.tokens[key] = self.tokens.get(key, 0) + count
+
+    def add_event(self, event: str, count: int) -> None:
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + count
+
+    def snapshot(self):
+        with self._lock:
+            return (
+                {k: list(v) for k, v in self.durations.items()},
+                {k: list(v) for k, v in self.sizes.items()},
+                dict(self.tokens),
+                dict(self.events),
+            )
+
+
+_registry = _Registry()
+
+
+# -----------------------------
+# Spans & Traces
+# -----------------------------
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("playbook_trace", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "_started", "_trace")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self._started = 0.0
+        self._trace = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def __enter__(self) -> "Span":
+        self._trace = _current_trace.get()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = time.perf_counter() - self._started
+        _registry.observe_duration(self.name, duration)
+
+        if self._trace is not None:
+            record = {
+                "name": self.name,
+                "start_ms": round((self._started - self._trace["_t0"]) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+            }
+            if self.attrs:
+                record["attrs"] = self.attrs
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            self._trace["spans"].append(record)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attrs: Any):
+    """
+    Times one pipeline stage:  with span("json_parse", chars=len(text)): ...
+    """
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+
+class _Trace:
+    """Groups the spans of one user request into a single JSONL record."""
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self._token = None
+        self._data: Optional[Dict[str, Any]] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def __enter__(self) -> "_Trace":
+        self._data = {"_t0": time.perf_counter(), "spans": []}
+        self._token = _current_trace.set(self._data)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _current_trace.reset(self._token)
+        duration = time.perf_counter() - self._data["_t0"]
+        _registry.observe_duration(self.name, duration)
+
+        if TRACE_PATH:
+            _write_trace({
+                "trace_id": uuid.uuid4().hex,
+                "name": self.name,
+                "timestamp": time.time(),
+                "duration_ms": round(duration * 1000, 3),
+                "error": exc_type.__name__ if exc_type else None,
+                "attrs": self.attrs,
+                "spans": self._data["spans"],
+            })
+        return False
+
+
+def trace(name: str, **attrs: Any):
+    if not ENABLED:
+        return _NOOP
+    return _Trace(name, attrs)
+
+
+_trace_lock = threading.Lock()
+
+
+def _write_trace(record: Dict[str, Any]) -> None:
+    line = json.dumps(record, default=str) + "\n"
+    with _trace_lock:
+        with open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+# -----------------------------
+# Sizes & Tokens
+# -----------------------------
+def record_size(kind: str, chars: int) -> None:
+    if ENABLED:
+        _registry.observe_size(kind, chars)
+
+
+def record_tokens(
+    backend: str,
+    model: str,
+    input_tokens: Optional[int],
+    output_tokens: Optional[int],
+    cached_tokens: Optional[int] = None
+) -> None:
+    """`cached_tokens` is the part of `input_tokens` served from a model-side context cache."""
+    if not ENABLED:
+        return
+    if input_tokens:
+        _registry.add_tokens(backend, model, "input", int(input_tokens))
+    if output_tokens:
+        _registry.add_tokens(backend, model, "output", int(output_tokens))
+    if cached_tokens:
+        _registry.add_tokens(backend, model, "cached", int(cached_tokens))
+
+    current = _current_trace.get()
+    if current is not None:
+        current["spans"].append({
+            "name": "tokens",
+            "attrs": {"backend": backend, "input": input_tokens, "output": output_tokens, "cached": cached_tokens},
+        })
+
+
+def record_duration(stage: str, seconds: float) -> None:
+    """For timings that do not fit a with-block (e.g. a whole Streamlit rerun)."""
+    if ENABLED:
+        _registry.observe_duration(stage, seconds)
+
+
+def record_event(event: str, count: int = 1) -> None:
+    """Counts discrete outcomes, e.g. record_event("template_cache_hits")."""
+    if ENABLED:
+        _registry.add_event(event, count)
+
+
+# -----------------------------
+# Prometheus Exposition
+# -----------------------------
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    durations, sizes, tokens, events = _registry.snapshot()
+    lines = [
+        "# HELP playbook_stage_duration_seconds Duration of playbook pipeline stages.",
+        "# TYPE playbook_stage_duration_seconds histogram",
+    ]
+
+    for stage, row in sorted(durations.items()):
+        label = f'stage="{_label(stage)}"'
+        for bound, count in zip(DURATION_BUCKETS, row):
+            lines.append(f'playbook_stage_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'playbook_stage_duration_seconds_bucket{{{label},le="+Inf"}} {row[-1]}')
+        lines.append(f"playbook_stage_duration_seconds_sum{{{label}}} {row[-2]:.6f}")
+        lines.append(f"playbook_stage_duration_seconds_count{{{label}}} {row[-1]}")
+
+    lines += [
+        "# HELP playbook_payload_chars Prompt / response sizes in characters.",
+        "# TYPE playbook_payload_chars histogram",
+    ]
+    for kind, row in sorted(sizes.items()):
+        label = f'kind="{_label(kind)}"'
+        for bound, count in zip(SIZE_BUCKETS, row):
+            lines.append(f'playbook_payload_chars_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'playbook_payload_chars_bucket{{{label},le="+Inf"}} {row[-1]}')
+        lines.append(f"playbook_payload_chars_sum{{{label}}} {row[-2]}")
+        lines.append(f"playbook_payload_chars_count{{{label}}} {row[-1]}")
+
+    lines += [
+        "# HELP playbook_llm_tokens_total Tokens reported by the model provider.",
+        "# TYPE playbook_llm_tokens_total counter",
+    ]
+    for (backend, model, direction), total in sorted(tokens.items()):
+        lines.append(
+            f'playbook_llm_tokens_total{{backend="{_label(backend)}",model="{_label(model)}",'
+            f'direction="{direction}"}} {total}'
+        )
+
+    lines += [
+        "# HELP playbook_events_total Discrete pipeline outcomes (cache hits, coalesced calls, ...).",
+        "# TYPE playbook_events_total counter",
+    ]
+    for event, total in sorted(events.items()):
+        lines.append(f'playbook_events_total{{event="{_label(event)}"}} {total}')
+
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Optional /metrics Endpoint
+# -----------------------------
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def maybe_start_metrics_server() -> Optional[int]:
+    """
+    Starts the /metrics endpoint once per process if PLAYBOOK_METRICS_PORT is set.
+    """
+    global _metrics_server
+
+    port = os.getenv("PLAYBOOK_METRICS_PORT")
+    if not port or not ENABLED:
+        return None
+
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError:
+                # Another worker process already owns the port
+                return None
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+
+    return _metrics_server.server_port
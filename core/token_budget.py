@@ -0,0 +1,250 @@
+"""
+Token budgeting between prompt building and the model call.
+
+    prompt, report = budget_prompt(alert_text, "deployment", render, fixed=prefix)
+
+1. Compact the alert: whitespace, boilerplate, and runs of log lines that
+   differ only in numbers / hex ids (timestamps, IPs, ports, counters)
+2. Estimate tokens locally; if over the mode's budget, drop the retrieved
+   context first, then cut the alert from the middle (head and tail kept).
+   A budget that leaves less than MIN_ALERT_TOKENS for the alert is an
+   error (TokenBudgetError), not an empty alert
+3. Near the limit, confirm with the backend's count-tokens API and cut
+   again if the estimate was low
+
+Sizes before and after are recorded so prompt size (and the latency that
+follows it) stays bounded.
+"""
+
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.telemetry import record_event, record_size, span
+
+
+# -----------------------------
+# Budgets (env)
+# -----------------------------
+# Whole-prompt budgets in tokens, including any cached prefix.
+# PLAYBOOK_TOKEN_BUDGET_<MODE> overrides one mode, PLAYBOOK_TOKEN_BUDGET the default.
+DEFAULT_BUDGETS = {
+    "deployment": 16_000,
+    "learning": 8_000,
+    "agent": 16_000,
+}
+DEFAULT_BUDGET = 12_000
+
+# Estimates at or above this share of the budget are confirmed with the backend
+CONFIRM_RATIO = float(os.getenv("PLAYBOOK_TOKEN_CONFIRM_RATIO", 0.8))
+
+# Identical-shape log lines repeated at least this often are collapsed
+MIN_REPEATS = 3
+# Shorter lines (headings, separators, "key: value") are never collapsed
+MIN_COLLAPSE_CHARS = 24
+
+# Least of the alert worth sending once the prefix and template are paid for
+MIN_ALERT_TOKENS = int(os.getenv("PLAYBOOK_MIN_ALERT_TOKENS", 256))
+
+
+class TokenBudgetError(ValueError):
+    """The fixed parts of the prompt leave too little of the budget for the alert."""
+
+
+def token_budget(mode: str) -> int:
+    key = mode.strip().lower()
+    override = os.getenv(f"PLAYBOOK_TOKEN_BUDGET_{key.upper()}") or os.getenv("PLAYBOOK_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return DEFAULT_BUDGETS.get(key, DEFAULT_BUDGET)
+
+
+# -----------------------------
+# Local Estimator
+# -----------------------------
+# Words cost about one token per five letters, every digit and punctuation
+# mark one token: conservative for log-heavy text, where chars/4 runs low
+_PIECE = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+
+
+def estimate_tokens(text: str) -> int:
+    tokens = 0
+    for piece in _PIECE.findall(text):
+        tokens += (len(piece) + 4) // 5
+    return tokens + 1
+
+
+# -----------------------------
+# Compaction
+# -----------------------------
+_BOILERPLATE = re.compile(
+    r"^\s*(?:"
+    r"this (?:e-?mail|message|alert) (?:was|has been) (?:sent|generated)\b.*"
+    r"|(?:confidentiality|privileged and confidential|disclaimer)\b.*"
+    r"|do not reply\b.*|please do not reply\b.*"
+    r"|(?:click|log ?in) (?:here|to the console) to (?:view|see|manage)\b.*"
+    r"|to (?:unsubscribe|stop receiving|manage (?:your )?notification)\b.*"
+    r"|(?:sent from my|get outlook for)\b.*"
+    r"|-{2,}\s*original message\s*-{2,}"
+    r"|(?:copyright|\(c\)|©)\s*\d{4}\b.*"
+    r")\s*$",
+    re.IGNORECASE,
+)
+
+_VARIABLE = re.compile(r"\b[0-9a-fA-F]{8,}\b|\d+")
+_SPACES = re.compile(r"[ \t\f\v]+")
+_BLANK_RUNS = re.compile(r"\n{3,}")
+
+
+def _shape(line: str) -> str:
+    return _VARIABLE.sub("#", line)
+
+
+def compact_text(text: str) -> str:
+    """
+    Lossy only where it is cheap to be: boilerplate lines are removed and
+    the middle of a run of same-shaped log lines becomes one marker (the
+    first and last occurrence are kept, so the time span survives).
+    """
+    lines = [_SPACES.sub(" ", line).strip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    lines = [line for line in lines if not _BOILERPLATE.match(line)]
+
+    positions: Dict[str, List[int]] = {}
+    for i, line in enumerate(lines):
+        if len(line) >= MIN_COLLAPSE_CHARS:
+            positions.setdefault(_shape(line), []).append(i)
+
+    dropped = set()
+    markers: Dict[int, int] = {}
+    for indexes in positions.values():
+        if len(indexes) >= MIN_REPEATS:
+            middle = indexes[1:-1]
+            dropped.update(middle)
+            markers[indexes[0]] = len(middle)
+
+    out = []
+    for i, line in enumerate(lines):
+        if i in dropped:
+            continue
+        out.append(line)
+        if i in markers:
+            out.append(f"[... {markers[i]} similar lines omitted ...]")
+
+    return _BLANK_RUNS.sub("\n\n", "\n".join(out)).strip()
+
+
+# -----------------------------
+# Truncation
+# -----------------------------
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """
+    Keeps the head (two thirds of the budget: title, rule, entities) and
+    the tail (latest events) of `text`, cutting from the middle.
+    """
+    if max_tokens < 1:
+        raise ValueError(f"max_tokens must be >= 1, got {max_tokens}")
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+
+    # Work in characters, scaled by this text's own chars-per-token
+    keep_chars = max(1, int(len(text) * max_tokens / total) - 48)
+    head_chars = keep_chars * 2 // 3
+    tail_chars = keep_chars - head_chars
+
+    head = text[:head_chars]
+    tail = text[len(text) - tail_chars:] if tail_chars else ""
+    # Prefer cutting on line boundaries when there are any nearby
+    if "\n" in head[head_chars // 2:]:
+        head = head[: head.rindex("\n")]
+    if "\n" in tail[: tail_chars // 2]:
+        tail = tail[tail.index("\n") + 1:]
+
+    omitted = len(text) - len(head) - len(tail)
+    return f"{head}\n[... {omitted:,} characters omitted to fit the token budget ...]\n{tail}"
+
+
+# -----------------------------
+# Governor
+# -----------------------------
+def budget_prompt(
+    alert_text: str,
+    mode: str,
+    render: Callable[[str, str], str],
+    context_for: Optional[Callable[[str], str]] = None,
+    fixed: str = "",
+    count_tokens: Optional[Callable[[str], Optional[int]]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Returns (prompt, report) with render(context, alert) fitted to the
+    mode's budget. `fixed` is text sent alongside the prompt (e.g. a cached
+    prefix) that counts against the budget but is never cut.
+    `context_for(alert)` supplies the retrieved context; `count_tokens`
+    (backend.count_tokens) confirms estimates close to the limit.
+    """
+    budget = token_budget(mode)
+
+    def alert_room(overhead: int) -> int:
+        room = budget - overhead
+        if room < MIN_ALERT_TOKENS:
+            raise TokenBudgetError(
+                f"The {mode} token budget ({budget}) leaves {room} tokens for the alert after "
+                f"{overhead} tokens of prompt; at least {MIN_ALERT_TOKENS} are needed. "
+                f"Raise PLAYBOOK_TOKEN_BUDGET_{mode.strip().upper()} or shorten the prompt prefix."
+            )
+        return room
+
+    with span("token_budget", mode=mode) as s:
+        alert = compact_text(alert_text)
+        context = context_for(alert) if context_for is not None else ""
+        fixed_tokens = estimate_tokens(fixed) if fixed else 0
+
+        prompt = render(context, alert)
+        estimated = fixed_tokens + estimate_tokens(prompt)
+        report = {
+            "budget": budget,
+            "alert_chars_before": len(alert_text),
+            "alert_chars_after": len(alert),
+            "tokens_estimated_before": fixed_tokens + estimate_tokens(render(context, alert_text)),
+            "context_dropped": False,
+            "truncated": False,
+            "confirmed_tokens": None,
+        }
+
+        if estimated > budget and context:
+            # Retrieved context is the lowest-priority part of the prompt
+            context = ""
+            prompt = render(context, alert)
+            estimated = fixed_tokens + estimate_tokens(prompt)
+            report["context_dropped"] = True
+
+        if estimated > budget:
+            overhead = fixed_tokens + estimate_tokens(render(context, ""))
+            prompt = render(context, truncate_middle(alert, alert_room(overhead)))
+            estimated = fixed_tokens + estimate_tokens(prompt)
+            report["truncated"] = True
+
+        if count_tokens is not None and estimated >= budget * CONFIRM_RATIO:
+            actual = count_tokens(fixed + prompt if fixed else prompt)
+            report["confirmed_tokens"] = actual
+            if actual is not None and actual > budget:
+                # The estimate ran low for this text: cut by the observed ratio
+                overhead = fixed_tokens + estimate_tokens(render(context, ""))
+                target = max(1, int(alert_room(overhead) * budget / actual * 0.95))
+                prompt = render(context, truncate_middle(alert, target))
+                estimated = fixed_tokens + estimate_tokens(prompt)
+                report["truncated"] = True
+
+        report["tokens_estimated_after"] = estimated
+        s.set("tokens", estimated)
+        s.set("truncated", report["truncated"])
+
+    record_size("alert_raw", len(alert_text))
+    record_size("alert_compacted", len(alert))
+    record_size("prompt_budgeted", len(fixed) + len(prompt))
+    if report["context_dropped"]:
+        record_event("token_budget_context_dropped")
+    if report["truncated"]:
+        record_event("token_budget_truncated")
+
+    return prompt, report
@@ -0,0 +1,145 @@
+"""
+Drives core.playbook_engine.generate_playbook at N-way concurrency and
+reports throughput, latency percentiles and error rates.
+
+Against the local mock (no API quota used):
+    python loadtest/load_driver.py --start-mock --concurrency 50 --requests 500
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadtest.mock_gemini_server import add_mock_arguments, start_server
+
+
+SAMPLE_ALERTS = [
+    "Multiple failed authentication attempts from {ip} followed by a successful login for {user}.",
+    "User {user} clicked a link in a suspected phishing email; proxy logs show a download from {ip}.",
+    "EDR detected malicious file execution on WS-{n:04d} by {user}.",
+    "Impossible travel: {user} logged in from {ip} and from a second country within 10 minutes.",
+    "Admin account {user} created a new service principal outside working hours from {ip}.",
+    "Rapid file encryption detected on FS-{n:03d}; ransom note dropped in multiple shares.",
+]
+
+
+def make_alert(i: int, unique: bool) -> str:
+    template = SAMPLE_ALERTS[i % len(SAMPLE_ALERTS)]
+    n = i if unique else 0
+    return template.format(ip=f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}", user=f"user{n}@corp.example", n=n)
+
+
+# -------------------------------------------------
+# Statistics
+# -------------------------------------------------
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: Counter, wall: float, total: int) -> Dict[str, Any]:
+    ok = len(latencies)
+    return {
+        "requests": total,
+        "succeeded": ok,
+        "failed": total - ok,
+        "error_rate": round((total - ok) / total, 4) if total else 0.0,
+        "errors": dict(errors),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 2) if wall else 0.0,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+    }
+
+
+# -------------------------------------------------
+# Driver
+# -------------------------------------------------
+def run_load(concurrency: int, requests: int, mode: str, depth: str, unique: bool) -> Dict[str, Any]:
+    from core.playbook_engine import generate_playbook, get_resilience_stats
+
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        started = time.perf_counter()
+        try:
+            generate_playbook(make_alert(i, unique), mode, depth)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] += 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    report = summarize(latencies, errors, wall, requests)
+    report["concurrency"] = concurrency
+    report["resilience"] = get_resilience_stats()
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent load test for generate_playbook")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mode", default="Deployment")
+    parser.add_argument("--depth", default="Deep")
+    parser.add_argument("--repeat-alerts", action="store_true",
+                        help="Reuse identical alert text (exercises caching) instead of unique alerts")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="Keep the response cache enabled (disabled by default to measure upstream)")
+    parser.add_argument("--start-mock", action="store_true", help="Start the mock server in-process")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not args.use_cache:
+        os.environ["PLAYBOOK_CACHE_DISABLED"] = "1"
+    # Synthetic alerts should not pile up in the playbook archive
+    os.environ.setdefault("PLAYBOOK_STORE_DISABLED", "1")
+
+    if args.start_mock:
+        server = start_server(args)
+        os.environ["GEMINI_BASE_URL"] = f"http://{args.host}:{server.server_port}"
+        os.environ.setdefault("GEMINI_API_KEY", "mock")
+        os.environ.setdefault("GEMINI_MAX_CONNECTIONS", str(args.concurrency))
+        os.environ.setdefault("GEMINI_MAX_KEEPALIVE", str(args.concurrency))
+
+    report = run_load(args.concurrency, args.requests, args.mode, args.depth, unique=not args.repeat_alerts)
+
+    if args.start_mock:
+        report["mock"] = dict(server.behaviour.counters)
+
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
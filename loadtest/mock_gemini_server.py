@@ -0,0 +1,447 @@
+"""
+Local stand-in for the Gemini `generateContent` / `streamGenerateContent`
+REST endpoints. Replays playbooks recorded under playbooks/ with
+configurable latency and fault injection. Also keeps `cachedContents`
+(context caching) in memory so the cached-prefix path can be exercised;
+like the real API, contexts below the model's minimum size are refused.
+
+Point the app at it with:
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=mock streamlit run app.py
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from core.context_cache import min_cache_tokens
+from core.json_extractor import JSONExtractionError, extract_json_value
+
+
+# -------------------------------------------------
+# Recorded Corpus
+# -------------------------------------------------
+TYPE_KEYWORDS = (
+    ("decision", ("decision", "determine", "assess", "triage", "verdict")),
+    ("human", ("analyst", "review", "notify", "escalat", "approval")),
+    ("automation", ("contain", "block", "disable", "isolate", "reset", "revoke")),
+)
+
+
+def _block_type(block: Dict[str, Any]) -> str:
+    text = f"{block.get('block_name', '')} {block.get('purpose', '')}".lower()
+    for block_type, keywords in TYPE_KEYWORDS:
+        if any(k in text for k in keywords):
+            return block_type
+    return "enrichment"
+
+
+def _as_playbook(name: str, blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Recorded agent output (SECTION A arrays) -> the schema core.playbook_engine expects.
+    """
+    return {
+        "summary": f"Replayed playbook from {name}",
+        "confidence": "Medium",
+        "blocks": [
+            {
+                "id": str(i + 1),
+                "title": b.get("block_name") or b.get("title") or f"Block {i + 1}",
+                "type": b.get("type") or _block_type(b),
+                "description": b.get("purpose") or b.get("description", ""),
+            }
+            for i, b in enumerate(blocks) if isinstance(b, dict)
+        ],
+    }
+
+
+def load_corpus(root: str) -> List[str]:
+    """
+    Returns response texts (JSON strings) recorded under `root`/playbooks.
+    """
+    responses = []
+    paths = sorted(glob.glob(os.path.join(root, "playbooks", "*.txt")))
+    paths.append(os.path.join(root, "playbooks", "PB_blocks.json"))
+
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+
+        try:
+            value = extract_json_value(text)
+        except JSONExtractionError:
+            continue
+
+        blocks = value.get("blocks", []) if isinstance(value, dict) else value
+        if blocks:
+            responses.append(json.dumps(_as_playbook(os.path.basename(path), blocks)))
+
+    if not responses:
+        raise RuntimeError(f"No recorded playbooks found under {root}/playbooks")
+
+    return responses
+
+
+# -------------------------------------------------
+# Fault / Latency Model
+# -------------------------------------------------
+class MockBehaviour:
+    def __init__(self, args):
+        self.latency_dist = args.latency_dist
+        self.latency_mean = args.latency_mean
+        self.latency_sigma = args.latency_sigma
+        self.rate_429 = args.rate_429
+        self.rate_truncated = args.rate_truncated
+        self.rate_malformed = args.rate_malformed
+        self.rate_invalid_block = args.rate_invalid_block
+        self.stream_chunk = args.stream_chunk
+
+        self._lock = threading.Lock()
+        self.counters = {
+            "requests": 0, "429": 0, "truncated": 0, "malformed": 0, "invalid_block": 0, "ok": 0,
+            "cached_requests": 0, "repairs": 0,
+        }
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def latency(self) -> float:
+        if self.latency_dist == "fixed":
+            return self.latency_mean
+        if self.latency_dist == "uniform":
+            return random.uniform(
+                max(0.0, self.latency_mean - self.latency_sigma),
+                self.latency_mean + self.latency_sigma
+            )
+        # lognormal with the requested mean; sigma is the shape parameter
+        mu = max(1e-6, self.latency_mean)
+        return random.lognormvariate(0, self.latency_sigma) * mu / math.exp(self.latency_sigma ** 2 / 2)
+
+    def corrupt(self, text: str) -> str:
+        roll = random.random()
+        if roll < self.rate_truncated:
+            self.count("truncated")
+            return text[: max(1, int(len(text) * random.uniform(0.2, 0.9)))]
+        if roll < self.rate_truncated + self.rate_malformed:
+            self.count("malformed")
+            return text.replace('",', '"', 1).replace(":", "", 1)
+        if roll < self.rate_truncated + self.rate_malformed + self.rate_invalid_block:
+            self.count("invalid_block")
+            return _invalidate_block(text)
+        self.count("ok")
+        return text
+
+
+def _invalidate_block(text: str) -> str:
+    """Valid JSON, but one block breaks the response schema (exercises block-level repair)."""
+    data = json.loads(text)
+    block = random.choice(data["blocks"])
+    block["type"] = "unknown"
+    block["title"] = ""
+    return json.dumps(data)
+
+
+_REPAIR_INDEX = re.compile(r"^\s*index (\d+):", re.MULTILINE)
+
+
+def _repair_response(prompt: str) -> str:
+    """Answers a repair request (core.playbook_schema) with just the parts it lists."""
+    repair: Dict[str, Any] = {"blocks": [
+        {"index": index, "block": {
+            "id": str(index + 1),
+            "title": f"Repaired block {index + 1}",
+            "type": "human",
+            "description": "Regenerated by the mock repair path.",
+        }}
+        for index in sorted({int(i) for i in _REPAIR_INDEX.findall(prompt)})
+    ]}
+    if "Fields to regenerate:" in prompt:
+        repair.update(summary="Repaired summary (mock)", confidence="Medium")
+    return json.dumps(repair)
+
+
+# -------------------------------------------------
+# HTTP Handler
+# -------------------------------------------------
+def _candidate(text: str, finish: bool = True) -> Dict[str, Any]:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return candidate
+
+
+def _content_text(contents: List[Dict[str, Any]]) -> str:
+    return "".join(part.get("text", "") for content in contents for part in content.get("parts", []))
+
+
+def _token_count(text: str) -> int:
+    # Rough stand-in for the tokenizer: ~4 characters per token
+    return len(text) // 4
+
+
+class MockCaches:
+    """In-memory `cachedContents` resources (no eviction beyond TTL)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caches: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _expiry(ttl: str) -> str:
+        expires = datetime.now(timezone.utc) + timedelta(seconds=float(ttl.rstrip("s")))
+        return expires.isoformat().replace("+00:00", "Z")
+
+    def _live(self) -> Dict[str, Dict[str, Any]]:
+        now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        for name in [n for n, c in self._caches.items() if c["expireTime"] <= now]:
+            del self._caches[name]
+        return self._caches
+
+    @staticmethod
+    def _public(cache: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in cache.items() if k != "text"}
+
+    def create(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """None when the contents are below the model's minimum cacheable size."""
+        text = _content_text(request.get("contents", []))
+        if _token_count(text) < min_cache_tokens(request.get("model", "")):
+            return None
+
+        with self._lock:
+            name = f"cachedContents/{len(self._caches) + 1:06d}{hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]}"
+            self._caches[name] = {
+                "name": name,
+                "model": request.get("model", ""),
+                "displayName": request.get("displayName", ""),
+                "expireTime": self._expiry(request.get("ttl", "3600s")),
+                "usageMetadata": {"totalTokenCount": _token_count(text)},
+                "text": text,
+            }
+            return self._public(self._caches[name])
+
+    def list(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cachedContents": [self._public(c) for c in self._live().values()]}
+
+    def update(self, name: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cache = self._live().get(name)
+            if cache is None:
+                return None
+            cache["expireTime"] = self._expiry(request.get("ttl", "3600s"))
+            return self._public(cache)
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            return self._caches.pop(name, None) is not None
+
+    def text(self, name: str) -> Optional[str]:
+        with self._lock:
+            cache = self._live().get(name)
+            return None if cache is None else cache["text"]
+
+
+def make_handler(corpus: List[str], behaviour: MockBehaviour, caches: MockCaches):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _not_found(self) -> None:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        def _read_json(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _cache_name(self) -> str:
+            return "cachedContents/" + self.path.split("?", 1)[0].rsplit("/", 1)[-1]
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                self._send_json(200, behaviour.counters)
+            elif self.path.split("?", 1)[0].endswith("/cachedContents"):
+                self._send_json(200, caches.list())
+            else:
+                self._not_found()
+
+        def do_PATCH(self):
+            cache = caches.update(self._cache_name(), self._read_json())
+            if cache is None:
+                self._not_found()
+            else:
+                self._send_json(200, cache)
+
+        def do_DELETE(self):
+            if caches.delete(self._cache_name()):
+                self._send_json(200, {})
+            else:
+                self._not_found()
+
+        def do_POST(self):
+            request = self._read_json()
+
+            if self.path.split("?", 1)[0].endswith("/cachedContents"):
+                created = caches.create(request)
+                if created is None:
+                    model = request.get("model", "")
+                    self._send_json(400, {"error": {
+                        "code": 400,
+                        "message": (
+                            "Cached content is too small. total_token_count="
+                            f"{_token_count(_content_text(request.get('contents', [])))}, "
+                            f"min_total_token_count={min_cache_tokens(model)}"
+                        ),
+                        "status": "INVALID_ARGUMENT",
+                    }})
+                    return
+                self._send_json(200, created)
+                return
+
+            if ":countTokens" in self.path:
+                self._send_json(200, {"totalTokens": _token_count(_content_text(request.get("contents", [])))})
+                return
+
+            behaviour.count("requests")
+
+            cached_text = ""
+            if request.get("cachedContent"):
+                cached_text = caches.text(request["cachedContent"])
+                if cached_text is None:
+                    self._send_json(404, {"error": {
+                        "code": 404,
+                        "message": f"CachedContent not found: {request['cachedContent']}",
+                        "status": "NOT_FOUND",
+                    }})
+                    return
+                behaviour.count("cached_requests")
+
+            time.sleep(behaviour.latency())
+
+            if random.random() < behaviour.rate_429:
+                behaviour.count("429")
+                self._send_json(429, {"error": {
+                    "code": 429,
+                    "message": "Resource has been exhausted (mock)",
+                    "status": "RESOURCE_EXHAUSTED",
+                }})
+                return
+
+            # Same prompt -> same recorded response, like a deterministic model
+            prompt = json.dumps(request.get("contents", ""), sort_keys=True)
+            schema = request.get("generationConfig", {}).get("responseSchema") or {}
+            if schema.get("title", "").endswith("Repair"):
+                behaviour.count("repairs")
+                text = _repair_response(_content_text(request.get("contents", [])))
+            else:
+                index = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % len(corpus)
+                text = behaviour.corrupt(corpus[index])
+            usage = {
+                "promptTokenCount": (len(cached_text) + len(prompt)) // 4,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": (len(cached_text) + len(prompt) + len(text)) // 4,
+            }
+            if cached_text:
+                usage["cachedContentTokenCount"] = len(cached_text) // 4
+
+            if ":streamGenerateContent" in self.path:
+                self._stream(text, usage)
+            else:
+                self._send_json(200, {"candidates": [_candidate(text)], "usageMetadata": usage})
+
+        def _stream(self, text: str, usage: Dict[str, int]) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            size = behaviour.stream_chunk
+            for i in range(0, len(text), size):
+                last = i + size >= len(text)
+                event = {"candidates": [_candidate(text[i:i + size], finish=last)]}
+                if last:
+                    event["usageMetadata"] = usage
+                data = f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+# -------------------------------------------------
+# Entrypoint
+# -------------------------------------------------
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--root", default=REPO_ROOT, help="Repo root containing playbooks/")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=1.0, help="Mean latency (seconds)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Spread / lognormal shape")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered 429")
+    parser.add_argument("--rate-truncated", type=float, default=0.0, help="Fraction of truncated JSON bodies")
+    parser.add_argument("--rate-malformed", type=float, default=0.0, help="Fraction of malformed JSON bodies")
+    parser.add_argument("--rate-invalid-block", type=float, default=0.0,
+                        help="Fraction of bodies with one schema-invalid block")
+    parser.add_argument("--stream-chunk", type=int, default=256, help="Characters per streamed chunk")
+
+
+def start_server(args) -> ThreadingHTTPServer:
+    corpus = load_corpus(args.root)
+    behaviour = MockBehaviour(args)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(corpus, behaviour, MockCaches()))
+    server.daemon_threads = True
+    server.behaviour = behaviour
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mock Gemini generateContent server")
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = start_server(args)
+    print(f"Mock Gemini listening on http://{args.host}:{server.server_port}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import streamlit as st
 
+from core.answer_engine import get_answer_engine
+from core.rerun import render_debug_panel, session_key, track_rerun, user_key, warm_resources
+
 # -------------------------------------------------
 # Page config
 # -------------------------------------------------
@@ -8,6 +11,8 @@ st.set_page_config(
     layout="wide"
 )
 
+track_rerun("learning")
+
 # -------------------------------------------------
 # Session state initialization
 # -------------------------------------------------
@@ -17,6 +22,76 @@ if "view" not in st.session_state:
 if "level" not in st.session_state:
     st.session_state.level = None
 
+if "siemmy_pending" not in st.session_state:
+    st.session_state.siemmy_pending = None   # (question, Future) while the model is asked
+    st.session_state.siemmy_settled = None   # (question, note) once a fallback produced no answer
+
+
+# -------------------------------------------------
+# Helpers: Ask Siemmy
+# -------------------------------------------------
+SIEMMY_DEFAULT = (
+    "Great question! In real SOCs, automation assists analysts — "
+    "but investigation and judgment remain human-led."
+)
+
+SIEMMY_NOTES = {
+    "rate_limited": "Siemmy is getting a lot of questions right now; here is the closest lesson passage.",
+    "unavailable": "Siemmy could not reach the model; here is the closest lesson passage.",
+}
+
+
+def render_answer(answer: dict) -> None:
+    st.info(answer["text"] or SIEMMY_DEFAULT)
+    if answer["sources"]:
+        prefix = "Answered with" if answer["origin"] == "model" else "From"
+        st.caption(f"{prefix}: " + " · ".join(answer["sources"]))
+
+
+def ask_siemmy(question: str, level: str) -> None:
+    """
+    Answers locally from the lessons when they cover the question; otherwise
+    shows the closest passage while the model is asked in the background.
+    """
+    settled = st.session_state.siemmy_settled
+    answer = get_answer_engine().ask(
+        question,
+        level,
+        user=user_key(by_ip=False),
+        session=session_key(),
+        # A fallback that already came back empty is not retried on every rerun
+        allow_model=settled is None or settled[0] != question,
+    )
+
+    if answer["pending"] is not None:
+        st.session_state.siemmy_pending = (question, answer["pending"])
+
+    render_answer(answer)
+
+    if answer["pending"] is not None:
+        poll_siemmy()
+    elif settled is not None and settled[0] == question and settled[1] in SIEMMY_NOTES:
+        st.caption(SIEMMY_NOTES[settled[1]])
+
+
+@st.fragment(run_every=0.5)
+def poll_siemmy() -> None:
+    pending = st.session_state.siemmy_pending
+    if pending is None:
+        return
+
+    question, future = pending
+    if not future.done():
+        st.caption("💭 Siemmy is thinking...")
+        return
+
+    st.session_state.siemmy_pending = None
+    result = future.result()
+    if "note" in result:
+        st.session_state.siemmy_settled = (question, result["note"])
+    # The model's answer is now cached: a full rerun shows it
+    st.rerun()
+
 
 # -------------------------------------------------
 # Header + Home button
@@ -151,17 +226,14 @@ elif st.session_state.view == "content":
         st.divider()
 
         # -------------------------
-        # Siemmy (simple & safe)
+        # Siemmy (lessons first, model for the rest)
         # -------------------------
         st.markdown("### 👋 Ask Siemmy")
 
         question = st.text_input("Ask about SOC, SIEM, or SOAR")
 
-        if question:
-            st.info(
-                "Great question! In real SOCs, automation assists analysts — "
-                "but investigation and judgment remain human-led."
-            )
+        if question.strip():
+            ask_siemmy(question.strip(), st.session_state.level)
 
     # -------------------------
     # RIGHT — Workflow diagram
@@ -185,3 +257,8 @@ elif st.session_state.view == "content":
         """)
 
         st.caption("Typical SOC alert handling flow")
+
+
+# Warms generation for the Deployment page while the user reads
+warm_resources()
+render_debug_panel()
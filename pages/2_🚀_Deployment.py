@@ -1,9 +1,15 @@
 import streamlit as st
-import streamlit.components.v1 as components
 from typing import Optional
 
-from core.playbook_engine import generate_playbook
+from core.document_extraction import extract_docx, extract_pdf
+from core.gemini_client import get_client_holder
+from core.irp_pipeline import generate_irp_playbook_stream
+from core.jobs import JobRejected, get_job_queue
+from core.playbook_engine import generate_playbook_stream, get_resilience_stats
 from core.diagram_engine import build_soar_mermaid
+from core.diagram_render import diagram_path, render_diagram, render_stats, static_url
+from core.rerun import memoize, render_debug_panel, session_memo, track_rerun, user_key, warm_resources
+from core.telemetry import maybe_start_metrics_server, prometheus_text, span
 
 
 # -------------------------------------------------
@@ -14,44 +20,77 @@ st.set_page_config(
     layout="wide"
 )
 
+track_rerun("deployment")
+
 st.title("🚀 SOAR Deployment Playbook")
 
+# Serves /metrics when PLAYBOOK_METRICS_PORT is set (once per process)
+maybe_start_metrics_server()
+
 
 # -------------------------------------------------
 # Session State
 # -------------------------------------------------
 if "deployment_result" not in st.session_state:
     st.session_state.deployment_result = None
+    # Bumped per generated result so derived artifacts are pinned to it
+    st.session_state.deployment_result_id = 0
+
+if "deployment_job" not in st.session_state:
+    # A refresh / reconnect picks the in-flight or finished job back up from the URL
+    st.session_state.deployment_job = st.query_params.get("job")
 
 
 # -------------------------------------------------
-# Helpers: File Text Extraction
+# Helpers: Block Rendering
 # -------------------------------------------------
-def extract_text_from_pdf(uploaded_file) -> str:
-    try:
-        from PyPDF2 import PdfReader
-    except ImportError:
-        return ""
+def render_block(index: int, block: dict) -> None:
+    title = block.get("title") or block.get("id") or f"Block {index + 1}"
+    block_type = block.get("type", "")
 
-    reader = PdfReader(uploaded_file)
-    pages = []
+    st.markdown(f"**{index + 1}. {title}**" + (f"  \n`{block_type}`" if block_type else ""))
+    st.caption(block.get("description", ""))
 
-    for page in reader.pages:
-        text = page.extract_text()
-        if text:
-            pages.append(text)
-
-    return "\n".join(pages)
 
+# -------------------------------------------------
+# Helpers: Derived Artifacts
+# -------------------------------------------------
+@memoize(maxsize=64)
+def diagram_artifacts(blocks: list) -> dict:
+    """SVG / PNG bytes (or the Mermaid fallback) for a block list, shared across sessions."""
+    svg = render_diagram(blocks, "svg")
+    if svg is None:
+        return {"svg": None, "png": None, "url": None, "mermaid": build_soar_mermaid(blocks)}
+
+    return {
+        "svg": svg.decode("utf-8"),
+        "png": render_diagram(blocks, "png"),
+        "url": static_url(diagram_path(blocks, "svg")),
+        "mermaid": None,
+    }
+
+
+def extract_irp(irp_file) -> dict:
+    filename = irp_file.name.lower()
+
+    # Cached by content hash as well, so re-uploading the same file skips re-parsing
+    with span("irp_extraction", kind=filename.rsplit(".", 1)[-1]) as s:
+        if filename.endswith(".pdf"):
+            progress_bar = st.progress(0.0, text="Extracting IRP pages...")
+            extraction = extract_pdf(
+                irp_file,
+                progress=lambda done, total: progress_bar.progress(
+                    done / total, text=f"Extracting IRP pages... {done}/{total}"
+                )
+            )
+            progress_bar.empty()
+        else:
+            extraction = extract_docx(irp_file)
 
-def extract_text_from_docx(uploaded_file) -> str:
-    try:
-        from docx import Document
-    except ImportError:
-        return ""
+        s.set("chars", extraction["chars"])
+        s.set("cached", extraction["cached"])
 
-    document = Document(uploaded_file)
-    return "\n".join(p.text for p in document.paragraphs if p.text.strip())
+    return extraction
 
 
 # -------------------------------------------------
@@ -73,6 +112,7 @@ input_mode = st.radio(
 # Conditional Input Panels
 # -------------------------------------------------
 combined_input: Optional[str] = None
+irp_text: Optional[str] = None
 
 if input_mode == "SIEM Alert Text":
 
@@ -104,43 +144,95 @@ elif input_mode == "Upload Incident Response Plan (IRP)":
     )
 
     if irp_file is not None:
-        filename = irp_file.name.lower()
-
-        if filename.endswith(".pdf"):
-            irp_text = extract_text_from_pdf(irp_file)
-        else:
-            irp_text = extract_text_from_docx(irp_file)
+        # Pinned to the upload: other widget reruns neither re-read nor re-hash the file
+        extraction = session_memo("irp_extraction", irp_file.file_id, lambda: extract_irp(irp_file))
+        irp_text = extraction["text"]
+
+        st.caption(
+            f"Extracted {extraction['chars']:,} characters"
+            + (f" from {extraction['pages']} pages" if extraction["pages"] else "")
+            + (" (truncated to the configured limit)" if extraction["truncated"] else "")
+        )
 
         if irp_text.strip():
-            combined_input = (
-                "INCIDENT RESPONSE PLAN (IRP):\n"
-                f"{irp_text}"
-            )
+            combined_input = irp_text
 
 
 # -------------------------------------------------
-# Generate Button
+# Generate Button (queued; the script thread is not held)
 # -------------------------------------------------
-if st.button("Generate Deployment Playbook", type="primary"):
+if st.button("Generate Deployment Playbook", type="primary", disabled=bool(st.session_state.deployment_job)):
 
     if not combined_input:
         st.warning("Please provide a valid input before generating the playbook.")
     else:
-        with st.spinner("Generating SOAR deployment playbook..."):
+        # IRPs go through the chunked map-reduce pipeline; alerts stream directly
+        if irp_text:
+            stream, kwargs = generate_irp_playbook_stream, {"irp_text": combined_input}
+        else:
+            stream, kwargs = generate_playbook_stream, {"alert_text": combined_input}
 
-            result = generate_playbook(
-                alert_text=combined_input,
-                mode="Deployment",
-                depth="Deep"
-            )
+        try:
+            job_id = get_job_queue().submit(user_key(), "deployment", stream, mode="Deployment", depth="Deep", **kwargs)
+        except JobRejected as e:
+            st.warning(str(e))
+        else:
+            st.session_state.deployment_job = job_id
+            st.query_params["job"] = job_id
 
-            st.session_state.deployment_result = result
 
-        st.success("Deployment playbook generated")
+# -------------------------------------------------
+# Job Progress (polled without rerunning the page)
+# -------------------------------------------------
+@st.fragment(run_every=1.0)
+def poll_deployment_job() -> None:
+    job = get_job_queue().get(st.session_state.deployment_job)
+
+    if job is None:
+        # Dropped from the URL as well, or a refresh would bring the dead job back
+        st.session_state.deployment_job = None
+        st.query_params.pop("job", None)
+        st.warning("This generation is no longer available; please generate again.")
+        return
+
+    if job["status"] == "queued":
+        st.info(f"Queued for generation (position {job['position']})...")
+        return
+
+    if job["status"] == "running":
+        with st.status("Generating SOAR deployment playbook...", expanded=True):
+            progress = job["progress"]
+            if progress.get("stage") == "condensing":
+                st.progress(
+                    progress["done"] / progress["total"],
+                    text=f"Condensing IRP sections... {progress['done']}/{progress['total']}"
+                )
+            elif progress.get("stage") == "condensed":
+                st.caption(f"Condensed {progress['chunks']} IRP sections into {progress['chars']:,} characters")
+
+            if job["summary"]:
+                st.write(job["summary"])
+            for index, block in enumerate(job["blocks"]):
+                render_block(index, block)
+        return
+
+    st.session_state.deployment_job = None
+    if job["status"] == "failed":
+        st.query_params.pop("job", None)
+        st.error(f"Playbook generation failed: {job['error']}")
+        return
+
+    st.session_state.deployment_result = job["result"]
+    st.session_state.deployment_result_id += 1
+    st.rerun()
+
+
+if st.session_state.deployment_job:
+    poll_deployment_job()
 
 
 # -------------------------------------------------
-# Render Output + SVG Download
+# Render Output + Diagram Download
 # -------------------------------------------------
 if st.session_state.deployment_result:
 
@@ -149,49 +241,68 @@ if st.session_state.deployment_result:
     st.subheader("Executive Summary")
     st.write(result.get("summary", "No summary generated."))
 
+    st.markdown("---")
+    st.subheader("Playbook Blocks")
+
+    for index, block in enumerate(result.get("blocks", [])):
+        render_block(index, block)
+
     st.markdown("---")
     st.subheader("SOAR Execution Flow")
 
-    mermaid_diagram = build_soar_mermaid(
-        blocks=result.get("blocks", [])
+    # Rendered server-side once per distinct block list; later reruns of this
+    # result reuse the bytes without hashing the blocks or touching the disk
+    diagram = session_memo(
+        "deployment_diagram",
+        st.session_state.deployment_result_id,
+        lambda: diagram_artifacts(result.get("blocks", []))
     )
 
-    mermaid_html = f"""
-    <html>
-      <head>
-        <script src="https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.min.js"></script>
-        <script>
-          mermaid.initialize({{ startOnLoad: false, theme: 'default' }});
-
-          async function renderAndDownload() {{
-            const {{ svg }} = await mermaid.render('soarDiagram', `{mermaid_diagram}`);
-            const blob = new Blob([svg], {{ type: 'image/svg+xml' }});
-            const url = URL.createObjectURL(blob);
-
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = 'soar_playbook.svg';
-            a.click();
-
-            URL.revokeObjectURL(url);
-          }}
-
-          document.addEventListener("DOMContentLoaded", async () => {{
-            const {{ svg }} = await mermaid.render('soarDiagram', `{mermaid_diagram}`);
-            document.getElementById("diagram").innerHTML = svg;
-          }});
-        </script>
-      </head>
-      <body>
-        <div id="diagram"></div>
-        <br/>
-        <button onclick="renderAndDownload()">⬇ Download SVG</button>
-      </body>
-    </html>
-    """
-
-    components.html(mermaid_html, height=700, scrolling=True)
+    if diagram["svg"] is not None:
+        st.image(diagram["svg"])
+
+        if diagram["url"]:
+            st.markdown(f"[Open full size]({diagram['url']})")
+
+        st.download_button("⬇ Download SVG", data=diagram["svg"], file_name="soar_playbook.svg", mime="image/svg+xml")
+
+        if diagram["png"] is not None:
+            st.download_button("⬇ Download PNG", data=diagram["png"], file_name="soar_playbook.png", mime="image/png")
+
+    else:
+        # No Graphviz on this host: show the diagram source rather than reaching out to a CDN
+        st.caption("Graphviz is not installed on this server; showing the Mermaid source instead.")
+        st.code(diagram["mermaid"], language="text")
+        st.download_button(
+            "⬇ Download Mermaid source",
+            data=diagram["mermaid"],
+            file_name="soar_playbook.mmd",
+            mime="text/plain"
+        )
 
     st.markdown("---")
     st.subheader("Model Confidence")
     st.info(f"Confidence Score: **{result.get('confidence', 'N/A')}**")
+
+
+# -------------------------------------------------
+# Upstream Health (shared across sessions)
+# -------------------------------------------------
+with st.sidebar.expander("Upstream connection pool"):
+    st.json(get_client_holder().stats())
+
+with st.sidebar.expander("Upstream resilience"):
+    st.json(get_resilience_stats())
+
+with st.sidebar.expander("Generation queue"):
+    st.json(get_job_queue().stats())
+
+with st.sidebar.expander("Diagram render cache"):
+    st.json(render_stats())
+
+with st.sidebar.expander("Stage metrics (Prometheus)"):
+    st.code(prometheus_text(), language="text")
+
+# SDK, clients, retrieval index, caches: loaded in the background once the page is up
+warm_resources()
+render_debug_panel()